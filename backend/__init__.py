@@ -1,19 +1,27 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
+from backend.json_provider import FastJSONProvider
 
 
 def create_app():
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
 
     app.config.from_object('backend.config.Config')
 
     frontend_url = app.config.get('FRONTEND_URL', 'http://localhost:5173')
     allowed_origins = [origin.strip() for origin in frontend_url.split(',') if origin.strip()]
-    CORS(app, origins=allowed_origins, supports_credentials=True)
+    CORS(app, origins=allowed_origins, supports_credentials=True, expose_headers=['ETag', 'Retry-After'])
+
+    from backend.middleware.http_cache import init_http_cache
+    init_http_cache(app)
 
     from backend.routes import register_blueprints
     register_blueprints(app)
 
+    from backend.commands import register_commands
+    register_commands(app)
+
     @app.errorhandler(404)
     def not_found(e):
         return jsonify({'success': False, 'error': 'לא נמצא'}), 404
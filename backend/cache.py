@@ -0,0 +1,98 @@
+"""
+Small in-process read-through cache with cross-worker invalidation.
+Each entry is stamped with its namespace's version from the cache_versions
+table. invalidate() bumps that version (as do the triggers in schema.sql),
+and every worker re-reads the version table at most once per
+CACHE_VERSION_CHECK_SECONDS, so stale entries are dropped everywhere
+without a query per cache hit. TTLs are only a safety net.
+At most CACHE_MAX_ENTRIES entries are kept, least recently used evicted
+first. Cached values are shared between requests: callers must not mutate
+them.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from backend.extensions import get_supabase
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_entries = OrderedDict()    # (namespace, key) -> (expires_at or None, version, value), LRU order
+_versions = {}   # namespace -> version
+_checked_at = 0.0
+
+
+def _sync_versions():
+    global _checked_at
+    now = time.monotonic()
+    if now - _checked_at < current_app.config['CACHE_VERSION_CHECK_SECONDS']:
+        return
+    _checked_at = now
+    try:
+        rows = get_supabase().table('cache_versions').select('namespace, version').execute().data or []
+    except Exception as e:
+        logger.warning('Could not read cache versions: %s', e)
+        return
+    with _lock:
+        changed = set()
+        for row in rows:
+            if _versions.get(row['namespace']) != row['version']:
+                changed.add(row['namespace'])
+            _versions[row['namespace']] = row['version']
+        # Entries of bumped namespaces can never be served again
+        for cache_key in [k for k in _entries if k[0] in changed]:
+            del _entries[cache_key]
+
+
+def get_or_set(namespace, key, loader, ttl=None):
+    """Return the cached value for (namespace, key), calling loader() on a miss.
+
+    ttl is in seconds; None uses CACHE_DEFAULT_TTL and 0 never expires.
+    """
+    _sync_versions()
+    now = time.monotonic()
+    with _lock:
+        version = _versions.get(namespace, 0)
+        entry = _entries.get((namespace, key))
+        if entry and entry[1] == version and (entry[0] is None or entry[0] > now):
+            _entries.move_to_end((namespace, key))
+            return entry[2]
+        if entry:
+            del _entries[(namespace, key)]
+
+    value = loader()
+    if ttl is None:
+        ttl = current_app.config['CACHE_DEFAULT_TTL']
+    max_entries = current_app.config['CACHE_MAX_ENTRIES']
+    with _lock:
+        _entries[(namespace, key)] = (now + ttl if ttl else None, version, value)
+        _entries.move_to_end((namespace, key))
+        while len(_entries) > max_entries:
+            _entries.popitem(last=False)
+    return value
+
+
+def discard(namespace):
+    """Drop a namespace in this process only (the version is bumped elsewhere)."""
+    with _lock:
+        for cache_key in [k for k in _entries if k[0] == namespace]:
+            del _entries[cache_key]
+
+
+def invalidate(namespace):
+    """Drop a namespace here and bump its version for the other workers."""
+    discard(namespace)
+    try:
+        result = get_supabase().rpc('bump_cache_version', {'p_namespace': namespace}).execute()
+        if result.data is not None:
+            with _lock:
+                _versions[namespace] = result.data
+    except Exception as e:
+        logger.warning('Could not bump cache version for %s: %s', namespace, e)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,128 @@
+import csv
+import json
+import click
+
+
+def register_commands(app):
+    @app.cli.command('import-patients')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--errors', 'errors_path', default=None,
+                  help='Where to write the per-row error CSV (default: <path>.errors.csv)')
+    @click.option('--chunk-size', default=500, show_default=True)
+    def import_patients(path, errors_path, chunk_size):
+        """Stream-import patients from a CSV file."""
+        from backend.services.import_service import import_patients as run_import
+
+        errors_path = errors_path or f'{path}.errors.csv'
+        with open(path, encoding='utf-8-sig', newline='') as src, \
+                open(errors_path, 'w', encoding='utf-8-sig', newline='') as err:
+            writer = csv.writer(err)
+            writer.writerow(['line', 'id_number', 'error'])
+            for event in run_import(src, chunk_size=chunk_size):
+                if event['type'] == 'error':
+                    writer.writerow([event['line'], event['id_number'], event['error']])
+                elif event['type'] == 'progress':
+                    click.echo(f"  {event['processed']} rows, {event['inserted']} inserted")
+                else:
+                    click.echo(
+                        f"Done: {event['inserted']} inserted, {event['duplicates']} duplicates, "
+                        f"{event['invalid']} invalid (see {errors_path})"
+                    )
+
+    @app.cli.command('rebalance-tasks')
+    def rebalance_tasks():
+        """Respace kanban rank keys in every column."""
+        from backend.services.task_service import rebalance_column
+
+        for status in ('open', 'in_progress', 'done'):
+            click.echo(f'  {status}: {rebalance_column(status)} tasks')
+
+    @app.cli.command('archive-tasks')
+    @click.option('--older-than-days', type=int, default=None,
+                  help='Defaults to TASK_ARCHIVE_AFTER_DAYS')
+    def archive_tasks(older_than_days):
+        """Move old done tasks into tasks_archive."""
+        from backend.services.task_service import archive_done_tasks
+
+        days = older_than_days if older_than_days is not None else app.config['TASK_ARCHIVE_AFTER_DAYS']
+        click.echo(f'Archived {archive_done_tasks(days)} tasks done more than {days} days ago')
+
+    @app.cli.command('cache-invalidate')
+    @click.argument('namespaces', nargs=-1, required=True)
+    def cache_invalidate(namespaces):
+        """Bump cache versions so every worker reloads (e.g. after editing users)."""
+        from backend import cache
+
+        for namespace in namespaces:
+            cache.invalidate(namespace)
+            click.echo(f'  invalidated {namespace}')
+
+    @app.cli.command('sweep-overdue')
+    @click.option('--force', is_flag=True, help='Run even if today\'s sweep already ran')
+    def sweep_overdue(force):
+        """Mark pending invoices past INVOICE_DUE_DAYS as overdue."""
+        from backend.services.invoice_service import sweep_overdue as run_sweep
+
+        outcome = run_sweep(force=force)
+        if outcome.get('ran'):
+            click.echo(f"Marked {outcome['updated']} invoices overdue")
+        else:
+            click.echo(f"Skipped: {outcome.get('reason')}")
+
+    @app.cli.command('auto-invoice')
+    @click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+                  help='Last appointment date to bill (default: today)')
+    def auto_invoice(until):
+        """Invoice every completed appointment that has no invoice yet."""
+        from backend.services.invoice_service import auto_invoice as run_auto_invoice
+
+        created = run_auto_invoice(until.date() if until else None)
+        total = sum(float(inv['amount']) for inv in created)
+        click.echo(f'Created {len(created)} invoices totalling {total:,.2f}')
+
+    @app.cli.command('score-no-shows')
+    def score_no_shows():
+        """Refit the no-show model and rescore upcoming appointments now."""
+        from backend.services.no_show_service import score_upcoming
+
+        outcome = score_upcoming()
+        click.echo(f"Scored {outcome['scored']} appointments ({outcome['method'] or 'nothing to score'})")
+
+    @app.cli.command('refit-forecast')
+    def refit_forecast():
+        """Refit the revenue forecast now (normally done once a day in the background)."""
+        from backend.services.forecast_service import refit
+
+        outcome = refit()
+        if outcome['fitted']:
+            click.echo(f"Fitted on {outcome['history_days']} days, forecasting {outcome['months']} months")
+        else:
+            click.echo(f"Skipped: {outcome['reason']} ({outcome['history_days']} days)")
+
+    @app.cli.command('train-churn')
+    @click.option('--synthetic', type=int, default=None,
+                  help='Train on N synthetic patients instead of the database (never promoted)')
+    @click.option('--jobs', type=int, default=-1, show_default=True, help='Parallel fits (-1: all cores)')
+    @click.option('--no-promote', is_flag=True, help='Only write the evaluation report')
+    def train_churn(synthetic, jobs, no_promote):
+        """Search churn models, calibrate the best and promote it if it wins."""
+        from backend.services import churn_training
+
+        if synthetic:
+            X, y, groups = churn_training.synthetic_training_set(synthetic)
+        else:
+            X, y, groups = churn_training.load_training_set()
+        if len(set(y)) < 2:
+            click.echo(f'Not enough labelled history to train ({len(y)} rows)')
+            return
+
+        report = churn_training.train(X, y, groups, n_jobs=jobs, promote=not (synthetic or no_promote))
+        for c in report['candidates']:
+            click.echo(f"  {c['family']:<20} {json.dumps(c['params']):<60} "
+                       f"AUC {c['mean_auc']:.4f} ±{c['std_auc']:.4f}  {c['fit_seconds']:.1f}s")
+        holdout = report['holdout']
+        click.echo(f"Best: {report['best']['family']} — holdout AUC {holdout['auc']:.4f}, "
+                   f"Brier {holdout['brier']:.4f} vs current {report['current']['kind']} "
+                   f"AUC {report['current']['auc']:.4f}")
+        click.echo(f"{'Promoted' if report['promoted'] else 'Not promoted'} "
+                   f"({report['timing']['total_seconds']:.0f}s); report: {report['report_path']}")
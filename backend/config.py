@@ -33,3 +33,56 @@ class Config:
     SUPABASE_SERVICE_KEY = os.environ.get('SUPABASE_SERVICE_KEY', '')
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
     FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:5173')
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '1000'))
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))
+    COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL', '5'))
+    TASK_RANK_MAX_LENGTH = int(os.environ.get('TASK_RANK_MAX_LENGTH', '12'))
+    EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', '1.0'))
+    EVENTS_RETENTION_MINUTES = int(os.environ.get('EVENTS_RETENTION_MINUTES', '60'))
+    EVENTS_HEARTBEAT_SECONDS = int(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '15'))
+    # Open SSE streams per worker; each holds one of its WEB_THREADS threads,
+    # and EVENTS_RESERVED_THREADS stay free for ordinary requests
+    WEB_THREADS = int(os.environ.get('WEB_THREADS', '16'))
+    EVENTS_RESERVED_THREADS = int(os.environ.get('EVENTS_RESERVED_THREADS', '4'))
+    EVENTS_MAX_STREAMS = int(os.environ.get(
+        'EVENTS_MAX_STREAMS', str(max(WEB_THREADS - EVENTS_RESERVED_THREADS, 1))
+    ))
+    EVENTS_TICKET_SECONDS = int(os.environ.get('EVENTS_TICKET_SECONDS', '30'))
+    EVENTS_GAP_SECONDS = int(os.environ.get('EVENTS_GAP_SECONDS', '60'))
+    TASK_BOARD_COLUMN_LIMIT = int(os.environ.get('TASK_BOARD_COLUMN_LIMIT', '50'))
+    TASK_ARCHIVE_AFTER_DAYS = int(os.environ.get('TASK_ARCHIVE_AFTER_DAYS', '30'))
+    TASK_ARCHIVE_INTERVAL = int(os.environ.get('TASK_ARCHIVE_INTERVAL', '3600'))
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', '3600'))
+    CACHE_VERSION_CHECK_SECONDS = float(os.environ.get('CACHE_VERSION_CHECK_SECONDS', '5'))
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '2000'))
+    AVAILABILITY_HORIZON_DAYS = int(os.environ.get('AVAILABILITY_HORIZON_DAYS', '60'))
+    AVAILABILITY_REBUILD_SECONDS = int(os.environ.get('AVAILABILITY_REBUILD_SECONDS', '900'))
+    AVAILABILITY_SLOT_MINUTES = int(os.environ.get('AVAILABILITY_SLOT_MINUTES', '15'))
+    # Clinic hours by Python weekday (Monday=0): Sunday-Thursday full days,
+    # Friday mornings, closed on Saturday
+    WORKING_HOURS = {
+        6: [('08:00', '18:00')],
+        0: [('08:00', '18:00')],
+        1: [('08:00', '18:00')],
+        2: [('08:00', '18:00')],
+        3: [('08:00', '18:00')],
+        4: [('08:00', '13:00')],
+    }
+    SERIES_HORIZON_DAYS = int(os.environ.get('SERIES_HORIZON_DAYS', '366'))
+    SERIES_MAX_OCCURRENCES = int(os.environ.get('SERIES_MAX_OCCURRENCES', '120'))
+    INVOICE_DUE_DAYS = int(os.environ.get('INVOICE_DUE_DAYS', '30'))
+    INVOICE_SWEEP_INTERVAL = int(os.environ.get('INVOICE_SWEEP_INTERVAL', '3600'))
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true'
+    SCHEDULER_STARTUP_DELAY = int(os.environ.get('SCHEDULER_STARTUP_DELAY', '30'))
+    SCHEDULER_TICK_SECONDS = int(os.environ.get('SCHEDULER_TICK_SECONDS', '30'))
+    UTILIZATION_REFRESH_SECONDS = int(os.environ.get('UTILIZATION_REFRESH_SECONDS', '600'))
+    NO_SHOW_HISTORY_DAYS = int(os.environ.get('NO_SHOW_HISTORY_DAYS', '365'))
+    NO_SHOW_HORIZON_DAYS = int(os.environ.get('NO_SHOW_HORIZON_DAYS', '14'))
+    NO_SHOW_SCORE_HOUR = int(os.environ.get('NO_SHOW_SCORE_HOUR', '2'))
+    NO_SHOW_SCORE_INTERVAL = int(os.environ.get('NO_SHOW_SCORE_INTERVAL', '1800'))
+    FORECAST_HISTORY_DAYS = int(os.environ.get('FORECAST_HISTORY_DAYS', '730'))
+    FORECAST_MONTHS = int(os.environ.get('FORECAST_MONTHS', '3'))
+    FORECAST_REFIT_INTERVAL = int(os.environ.get('FORECAST_REFIT_INTERVAL', '3600'))
+    # Where `flask train-churn` writes promoted models and evaluation reports
+    MODEL_DIR = os.environ.get('MODEL_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models'))
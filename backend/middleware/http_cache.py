@@ -0,0 +1,70 @@
+import gzip
+import hashlib
+from flask import request
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'application/x-ndjson')
+ENCODING_SUFFIXES = ('-br', '-gzip')
+
+
+def _client_etags():
+    """ETags sent in If-None-Match, with our per-encoding suffix stripped."""
+    tags = set()
+    for tag in request.if_none_match.as_set():
+        for suffix in ENCODING_SUFFIXES:
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)]
+                break
+        tags.add(tag)
+    return tags
+
+
+def _pick_encoding():
+    accepted = request.accept_encodings
+    if BROTLI_AVAILABLE and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def init_http_cache(app):
+    """Add strong ETags / 304s to GET JSON responses and compress large bodies."""
+
+    @app.after_request
+    def conditional_and_compress(response):
+        if response.direct_passthrough or response.is_streamed or response.status_code != 200:
+            return response
+        if 'Content-Encoding' in response.headers:
+            return response
+
+        body = response.get_data()
+        encoding = None
+        if len(body) >= app.config['COMPRESS_MIN_SIZE'] and response.mimetype.startswith(COMPRESSIBLE_TYPES):
+            encoding = _pick_encoding()
+
+        if request.method in ('GET', 'HEAD') and response.is_json:
+            etag = hashlib.sha256(body).hexdigest()[:32]
+            # Strong ETags must differ between encodings of the same resource
+            response.set_etag(f'{etag}-{encoding}' if encoding else etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            if request.if_none_match and (request.if_none_match.star_tag or etag in _client_etags()):
+                response.status_code = 304
+                response.set_data(b'')
+                response.headers.pop('Content-Type', None)
+                return response
+
+        if encoding == 'br':
+            response.set_data(brotli.compress(body, quality=app.config['COMPRESS_BR_LEVEL']))
+        elif encoding == 'gzip':
+            response.set_data(gzip.compress(body, compresslevel=app.config['COMPRESS_LEVEL']))
+
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+        return response
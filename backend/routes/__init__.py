@@ -8,6 +8,7 @@ def register_blueprints(app):
     from backend.routes.invoices import invoices_bp
     from backend.routes.tasks import tasks_bp
     from backend.routes.chat import chat_bp
+    from backend.routes.events import events_bp
 
     app.register_blueprint(health_bp)
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -18,3 +19,4 @@ def register_blueprints(app):
     app.register_blueprint(invoices_bp, url_prefix='/api/invoices')
     app.register_blueprint(tasks_bp, url_prefix='/api/tasks')
     app.register_blueprint(chat_bp, url_prefix='/api/chat')
+    app.register_blueprint(events_bp, url_prefix='/api/events')
@@ -1,30 +1,34 @@
+from datetime import date, datetime, timedelta
 from flask import Blueprint, request, jsonify
 from backend.middleware.auth_middleware import login_required
-from backend.services import appointment_service, catalog_service, patient_service
+from backend.services import (
+    appointment_service, availability_service, calendar_service, catalog_service, patient_service,
+    series_service,
+)
+from backend.routes.batch import add_batch_routes
+from backend.routes.export import add_export_route
 
 appointments_bp = Blueprint('appointments', __name__)
+add_batch_routes(appointments_bp, 'appointments')
+add_export_route(appointments_bp, 'appointments')
 
 
 def _flatten_appointment(a):
-    """Flatten nested patients/services joins into flat fields."""
+    """Flatten nested patients/services joins into flat fields (in place)."""
     if not a:
         return a
-    p = a.get('patients') or {}
-    s = a.get('services') or {}
-    return {
-        **{k: v for k, v in a.items() if k not in ('patients', 'services')},
-        'patient_name': f"{p.get('first_name', '')} {p.get('last_name', '')}".strip() if p else '',
-        'service_name': s.get('name', '') if isinstance(s, dict) else '',
-    }
+    p = a.pop('patients', None) or {}
+    s = a.pop('services', None) or {}
+    a['patient_name'] = f"{p.get('first_name', '')} {p.get('last_name', '')}".strip() if p else ''
+    a['service_name'] = s.get('name', '') if isinstance(s, dict) else ''
+    return a
 
 
 def _enrich_patient(p):
     if not p:
         return p
-    return {
-        **p,
-        'full_name': f"{p.get('first_name', '')} {p.get('last_name', '')}".strip(),
-    }
+    p['full_name'] = f"{p.get('first_name', '')} {p.get('last_name', '')}".strip()
+    return p
 
 
 @appointments_bp.route('/')
@@ -36,26 +40,102 @@ def list_appointments():
     result = appointment_service.get_appointments(
         search=search, status_filter=status_filter, page=page
     )
-    result = {**result, 'data': [_flatten_appointment(a) for a in result.get('data', [])]}
-    services = catalog_service.get_all_services()
-    patients = [_enrich_patient(p) for p in patient_service.get_patients(limit=100)['data']]
+    for a in result['data']:
+        _flatten_appointment(a)
+    result['services'] = catalog_service.get_all_services()
+    result['patients_list'] = [_enrich_patient(p) for p in patient_service.get_patients(limit=100)['data']]
     return jsonify({
         'success': True,
-        'data': {
-            **result,
-            'services': services,
-            'patients_list': patients,
-        },
+        'data': result,
         'search': search,
         'status_filter': status_filter,
     })
 
 
+def _requested_duration():
+    """Slot length from ?duration= or the duration of ?service_id=."""
+    if request.args.get('service_id'):
+        return catalog_service.get_service_durations().get(request.args['service_id'])
+    try:
+        duration = int(request.args.get('duration', 30))
+    except ValueError:
+        return None
+    return duration if 0 < duration <= 8 * 60 else None
+
+
+@appointments_bp.route('/calendar')
+@login_required
+def calendar():
+    try:
+        date_from = date.fromisoformat(request.args.get('from') or date.today().isoformat())
+        date_to = date.fromisoformat(request.args.get('to') or (date_from + timedelta(days=6)).isoformat())
+    except ValueError:
+        return jsonify({'success': False, 'error': 'תאריך לא תקין'}), 400
+    if date_to < date_from or date_to - date_from > timedelta(days=62):
+        return jsonify({'success': False, 'error': 'טווח תאריכים לא תקין'}), 400
+
+    data = calendar_service.get_calendar(date_from, date_to, doctor_id=request.args.get('doctor_id') or None)
+    return jsonify({
+        'success': True,
+        'data': data,
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+    })
+
+
+@appointments_bp.route('/availability')
+@login_required
+def availability():
+    duration = _requested_duration()
+    if not duration:
+        return jsonify({'success': False, 'error': 'משך או שירות לא תקין'}), 400
+    try:
+        date_from = date.fromisoformat(request.args.get('from') or date.today().isoformat())
+        date_to = date.fromisoformat(request.args.get('to') or date_from.isoformat())
+    except ValueError:
+        return jsonify({'success': False, 'error': 'תאריך לא תקין'}), 400
+    if date_to < date_from or date_to - date_from > timedelta(days=31):
+        return jsonify({'success': False, 'error': 'טווח תאריכים לא תקין'}), 400
+
+    slots = availability_service.find_free_slots(
+        date_from, date_to, duration, doctor_id=request.args.get('doctor_id') or None
+    )
+    return jsonify({'success': True, 'data': slots, 'duration': duration})
+
+
+@appointments_bp.route('/next-free')
+@login_required
+def next_free():
+    duration = _requested_duration()
+    if not duration:
+        return jsonify({'success': False, 'error': 'משך או שירות לא תקין'}), 400
+    try:
+        after = datetime.fromisoformat(request.args['after']) if request.args.get('after') else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'תאריך לא תקין'}), 400
+
+    slot = availability_service.next_free_slot(
+        duration, doctor_id=request.args.get('doctor_id') or None, after=after
+    )
+    return jsonify({'success': True, 'data': slot})
+
+
+def _conflict_response(e):
+    return jsonify({
+        'success': False,
+        'error': appointment_service.CONFLICT_ERROR,
+        'conflicts': e.conflicts,
+    }), 409
+
+
 @appointments_bp.route('/', methods=['POST'])
 @login_required
 def create():
     data = request.get_json()
-    appointment = appointment_service.create_appointment(data)
+    try:
+        appointment = appointment_service.create_appointment(data)
+    except appointment_service.AppointmentConflict as e:
+        return _conflict_response(e)
     if appointment:
         return jsonify({'success': True, 'data': appointment})
     return jsonify({'success': False, 'error': 'שגיאה ביצירת תור'}), 400
@@ -65,7 +145,10 @@ def create():
 @login_required
 def update(appointment_id):
     data = request.get_json()
-    appointment = appointment_service.update_appointment(appointment_id, data)
+    try:
+        appointment = appointment_service.update_appointment(appointment_id, data)
+    except appointment_service.AppointmentConflict as e:
+        return _conflict_response(e)
     if appointment:
         return jsonify({'success': True, 'data': appointment})
     return jsonify({'success': False, 'error': 'שגיאה בעדכון תור'}), 400
@@ -79,3 +162,59 @@ def delete(appointment_id):
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
+
+
+@appointments_bp.route('/series', methods=['POST'])
+@login_required
+def create_series():
+    data = request.get_json(silent=True) or {}
+    if not data.get('rrule') or not data.get('starts_at') or not data.get('patient_id'):
+        return jsonify({'success': False, 'error': 'חסרים פרטי סדרה'}), 400
+    try:
+        series, created, skipped = series_service.create_series(
+            data, skip_conflicts=bool(data.get('skip_conflicts'))
+        )
+    except appointment_service.AppointmentConflict as e:
+        return _conflict_response(e)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'חוק חזרה לא תקין: {e}'}), 400
+    return jsonify({
+        'success': True,
+        'data': {'series': series, 'appointments': created, 'skipped': skipped},
+    })
+
+
+def _series_scope():
+    """The "this and following" start date from ?from= (defaults to now)."""
+    value = request.args.get('from') or datetime.now().isoformat(timespec='seconds')
+    return datetime.fromisoformat(value).isoformat()
+
+
+@appointments_bp.route('/series/<series_id>', methods=['PUT'])
+@login_required
+def update_series(series_id):
+    data = request.get_json(silent=True) or {}
+    patch = {k: v for k, v in data.items() if k in series_service.EDITABLE_FIELDS}
+    try:
+        from_date = _series_scope()
+        shift_minutes = int(data.get('shift_minutes') or 0)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'ערך לא תקין'}), 400
+    if not patch and not shift_minutes:
+        return jsonify({'success': False, 'error': 'אין שינויים לעדכון'}), 400
+    try:
+        rows = series_service.update_following(series_id, from_date, patch, shift_minutes)
+    except appointment_service.AppointmentConflict as e:
+        return _conflict_response(e)
+    return jsonify({'success': True, 'data': rows, 'updated': len(rows)})
+
+
+@appointments_bp.route('/series/<series_id>', methods=['DELETE'])
+@login_required
+def cancel_series(series_id):
+    try:
+        from_date = _series_scope()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'תאריך לא תקין'}), 400
+    rows = series_service.cancel_following(series_id, from_date)
+    return jsonify({'success': True, 'cancelled': len(rows)})
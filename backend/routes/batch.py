@@ -0,0 +1,50 @@
+from flask import request, jsonify
+from backend.middleware.auth_middleware import login_required
+from backend.services import batch_service
+
+
+def _batch_response(results):
+    failed = sum(1 for r in results if not r['success'])
+    return jsonify({
+        'success': failed == 0,
+        'data': {
+            'results': results,
+            'succeeded': len(results) - failed,
+            'failed': failed,
+        },
+    })
+
+
+def _invalid(errors):
+    return jsonify({'success': False, 'error': 'הבקשה מכילה פריטים לא תקינים', 'errors': errors}), 400
+
+
+def add_batch_routes(blueprint, resource):
+    """Register POST/PUT/DELETE /batch on a resource blueprint."""
+
+    @blueprint.route('/batch', methods=['POST'], endpoint='batch_create')
+    @login_required
+    def batch_create():
+        items = (request.get_json(silent=True) or {}).get('items')
+        errors = batch_service.validate_batch(resource, items, 'create')
+        if errors:
+            return _invalid(errors)
+        return _batch_response(batch_service.create_many(resource, items))
+
+    @blueprint.route('/batch', methods=['PUT'], endpoint='batch_update')
+    @login_required
+    def batch_update():
+        items = (request.get_json(silent=True) or {}).get('items')
+        errors = batch_service.validate_batch(resource, items, 'update')
+        if errors:
+            return _invalid(errors)
+        return _batch_response(batch_service.update_many(resource, items))
+
+    @blueprint.route('/batch', methods=['DELETE'], endpoint='batch_delete')
+    @login_required
+    def batch_delete():
+        ids = (request.get_json(silent=True) or {}).get('ids')
+        errors = batch_service.validate_batch(resource, ids, 'delete')
+        if errors:
+            return _invalid(errors)
+        return _batch_response(batch_service.delete_many(resource, ids))
@@ -1,6 +1,9 @@
-from flask import Blueprint, jsonify, g
-from backend.middleware.auth_middleware import login_required
-from backend.services import dashboard_service
+import csv
+import io
+from datetime import date, timedelta
+from flask import Blueprint, Response, current_app, jsonify, g, request
+from backend.middleware.auth_middleware import login_required, role_required
+from backend.services import analytics_service, churn_service, dashboard_service, forecast_service, utilization_service
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -16,8 +19,7 @@ def kpis():
     churn_patients = []
     if g.user.get('role') == 'doctor':
         try:
-            from backend.services.churn_service import get_all_churn_scores
-            churn_patients = get_all_churn_scores()[:5]
+            churn_patients = churn_service.get_top_churn(5)
         except Exception:
             churn_patients = []
 
@@ -46,3 +48,101 @@ def revenue_chart():
 def appointment_chart():
     data = dashboard_service.get_appointment_status_distribution()
     return jsonify({'success': True, 'data': data})
+
+
+@dashboard_bp.route('/revenue')
+@login_required
+def revenue():
+    granularity = request.args.get('granularity', 'month')
+    group_by = request.args.get('group_by') or None
+    if granularity not in analytics_service.GRANULARITIES:
+        return jsonify({'success': False, 'error': 'רזולוציה לא נתמכת'}), 400
+    if group_by and group_by not in analytics_service.GROUP_BYS:
+        return jsonify({'success': False, 'error': 'קיבוץ לא נתמך'}), 400
+    try:
+        date_to = date.fromisoformat(request.args.get('to') or date.today().isoformat())
+        date_from = date.fromisoformat(request.args.get('from') or (date_to - timedelta(days=365)).isoformat())
+    except ValueError:
+        return jsonify({'success': False, 'error': 'תאריך לא תקין'}), 400
+    if date_to < date_from or (date_to - date_from).days > analytics_service.MAX_RANGE_DAYS[granularity]:
+        return jsonify({'success': False, 'error': 'טווח תאריכים לא תקין'}), 400
+
+    data = analytics_service.get_revenue(date_from, date_to, granularity, group_by)
+    return jsonify({'success': True, 'data': data})
+
+
+@dashboard_bp.route('/utilization')
+@login_required
+def utilization():
+    default_from, default_to = utilization_service.default_range()
+    try:
+        date_from = date.fromisoformat(request.args.get('from') or default_from.isoformat())
+        date_to = date.fromisoformat(request.args.get('to') or default_to.isoformat())
+    except ValueError:
+        return jsonify({'success': False, 'error': 'תאריך לא תקין'}), 400
+    if date_to < date_from or (date_to - date_from).days > 5 * 366:
+        return jsonify({'success': False, 'error': 'טווח תאריכים לא תקין'}), 400
+
+    data = utilization_service.get_utilization(date_from, date_to, request.args.get('doctor_id') or None)
+    return jsonify({'success': True, 'data': data})
+
+
+@dashboard_bp.route('/forecast')
+@login_required
+def forecast():
+    months = request.args.get('months', 3, type=int)
+    if not 1 <= months <= current_app.config['FORECAST_MONTHS']:
+        return jsonify({'success': False, 'error': 'מספר חודשים לא תקין'}), 400
+    return jsonify({'success': True, 'data': forecast_service.get_forecast(months)})
+
+
+@dashboard_bp.route('/churn')
+@login_required
+@role_required('doctor')
+def churn_top():
+    k = request.args.get('k', 10, type=int)
+    risk = request.args.get('risk') or None
+    if risk and risk not in churn_service.RISK_LEVELS:
+        return jsonify({'success': False, 'error': 'רמת סיכון לא תקינה'}), 400
+    if not 1 <= k <= churn_service.MAX_PAGE_SIZE:
+        return jsonify({'success': False, 'error': 'מספר מטופלים לא תקין'}), 400
+    return jsonify({'success': True, 'data': churn_service.get_top_churn(k, risk)})
+
+
+@dashboard_bp.route('/churn/report')
+@login_required
+@role_required('doctor')
+def churn_report():
+    page = request.args.get('page', 1, type=int)
+    limit = request.args.get('limit', 20, type=int)
+    risk = request.args.get('risk') or None
+    if risk and risk not in churn_service.RISK_LEVELS:
+        return jsonify({'success': False, 'error': 'רמת סיכון לא תקינה'}), 400
+    if page < 1 or not 1 <= limit <= churn_service.MAX_PAGE_SIZE:
+        return jsonify({'success': False, 'error': 'עמוד לא תקין'}), 400
+    return jsonify({'success': True, 'data': churn_service.get_churn_page(page, limit, risk)})
+
+
+AGING_COLUMNS = ['patient_name', 'phone', 'days_0_30', 'days_31_60', 'days_61_90', 'days_90_plus',
+                 'total', 'invoice_count', 'oldest_issued']
+
+
+@dashboard_bp.route('/aging')
+@login_required
+def aging():
+    try:
+        as_of = date.fromisoformat(request.args['as_of']) if request.args.get('as_of') else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'תאריך לא תקין'}), 400
+    report = dashboard_service.get_invoice_aging(as_of)
+
+    if request.args.get('format') == 'csv':
+        out = io.StringIO()
+        out.write('\ufeff')
+        writer = csv.DictWriter(out, fieldnames=AGING_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(report.get('patients') or [])
+        return Response(out.getvalue(), mimetype='text/csv; charset=utf-8', headers={
+            'Content-Disposition': f'attachment; filename="aging-{report.get("as_of", "")}.csv"',
+        })
+    return jsonify({'success': True, 'data': report})
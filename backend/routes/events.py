@@ -0,0 +1,80 @@
+import queue
+from flask import Blueprint, Response, current_app, g, request, jsonify, stream_with_context
+from backend.middleware.auth_middleware import login_required
+from backend.middleware.jwt_middleware import decode_token
+from backend.services import event_service
+
+events_bp = Blueprint('events', __name__)
+
+
+def _format(event):
+    data = current_app.json.dumps({
+        'topic': event['topic'],
+        'action': event['action'],
+        'id': event.get('row_id'),
+        'row': event.get('payload'),
+    })
+    event_id = f"id: {event['id']}\n" if event.get('id') else ''
+    return f"{event_id}event: {event['topic']}\ndata: {data}\n\n"
+
+
+@events_bp.route('/ticket', methods=['POST'])
+@login_required
+def ticket():
+    ttl = current_app.config['EVENTS_TICKET_SECONDS']
+    return jsonify({'success': True, 'data': {
+        'ticket': event_service.issue_ticket(g.user['user_id'], ttl),
+        'expires_in': ttl,
+    }})
+
+
+@events_bp.route('/stream')
+def stream():
+    # EventSource cannot send headers, so browsers pass a single-use ticket
+    # from POST /ticket instead; the JWT never appears in a URL or access log
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        authorized = decode_token(auth_header[7:]) is not None
+    else:
+        ticket = request.args.get('ticket', '')
+        authorized = bool(ticket) and event_service.redeem_ticket(ticket) is not None
+    if not authorized:
+        return jsonify({'success': False, 'error': 'אסימון הזדהות לא תקין'}), 401
+
+    topics = [t for t in request.args.get('topics', ','.join(event_service.TOPICS)).split(',')
+              if t in event_service.TOPICS]
+    if not topics:
+        return jsonify({'success': False, 'error': 'נושא לא מוכר'}), 400
+
+    q = event_service.subscribe(topics, limit=current_app.config['EVENTS_MAX_STREAMS'])
+    if q is None:
+        return jsonify({'success': False, 'error': 'יותר מדי חיבורים פתוחים, נסו שוב בעוד רגע'}), 503, \
+            {'Retry-After': '10'}
+
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    heartbeat = current_app.config['EVENTS_HEARTBEAT_SECONDS']
+    event_service.ensure_poller(current_app._get_current_object())
+
+    def generate():
+        yield 'retry: 3000\n\n'
+        if last_id and last_id.isdigit():
+            for event in event_service.events_since(int(last_id), topics):
+                yield _format(event)
+        while True:
+            try:
+                event = q.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            if event is None:
+                return
+            yield _format(event)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+    # Also runs when the client is gone before the generator ever started
+    response.call_on_close(lambda: event_service.unsubscribe(q))
+    return response
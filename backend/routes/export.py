@@ -0,0 +1,42 @@
+from datetime import date
+from flask import Response, request, jsonify, stream_with_context
+from backend.middleware.auth_middleware import login_required
+from backend.services import export_service
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', export_service.stream_csv),
+    'ndjson': ('application/x-ndjson; charset=utf-8', export_service.stream_ndjson),
+}
+
+
+def add_export_route(blueprint, resource):
+    """Register GET /export streaming the resource as CSV or NDJSON."""
+
+    @blueprint.route('/export', endpoint='export')
+    @login_required
+    def export():
+        fmt = request.args.get('format', 'csv')
+        if fmt not in FORMATS:
+            return jsonify({'success': False, 'error': 'פורמט לא נתמך'}), 400
+        mimetype, writer = FORMATS[fmt]
+        try:
+            date_from = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+            date_to = date.fromisoformat(request.args['to']) if request.args.get('to') else None
+        except ValueError:
+            return jsonify({'success': False, 'error': 'תאריך לא תקין'}), 400
+
+        rows = export_service.iter_rows(
+            resource,
+            date_from=date_from,
+            date_to=date_to,
+            status=request.args.get('status', ''),
+        )
+        filename = f'{resource}-{date.today().isoformat()}.{fmt}'
+        return Response(
+            stream_with_context(writer(resource, rows)),
+            mimetype=mimetype,
+            headers={
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                'X-Accel-Buffering': 'no',
+            },
+        )
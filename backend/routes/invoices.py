@@ -1,28 +1,29 @@
+from datetime import date
 from flask import Blueprint, request, jsonify
 from backend.middleware.auth_middleware import login_required
 from backend.services import invoice_service, patient_service, catalog_service
+from backend.routes.batch import add_batch_routes
+from backend.routes.export import add_export_route
 
 invoices_bp = Blueprint('invoices', __name__)
+add_batch_routes(invoices_bp, 'invoices')
+add_export_route(invoices_bp, 'invoices')
 
 
 def _flatten_invoice(inv):
-    """Flatten nested patients join into flat patient_name field."""
+    """Flatten nested patients join into flat patient_name field (in place)."""
     if not inv:
         return inv
-    p = inv.get('patients') or {}
-    return {
-        **{k: v for k, v in inv.items() if k != 'patients'},
-        'patient_name': f"{p.get('first_name', '')} {p.get('last_name', '')}".strip() if p else '',
-    }
+    p = inv.pop('patients', None) or {}
+    inv['patient_name'] = f"{p.get('first_name', '')} {p.get('last_name', '')}".strip() if p else ''
+    return inv
 
 
 def _enrich_patient(p):
     if not p:
         return p
-    return {
-        **p,
-        'full_name': f"{p.get('first_name', '')} {p.get('last_name', '')}".strip(),
-    }
+    p['full_name'] = f"{p.get('first_name', '')} {p.get('last_name', '')}".strip()
+    return p
 
 
 @invoices_bp.route('/')
@@ -34,16 +35,13 @@ def list_invoices():
     result = invoice_service.get_invoices(
         search=search, status_filter=status_filter, page=page
     )
-    result = {**result, 'data': [_flatten_invoice(inv) for inv in result.get('data', [])]}
-    patients = [_enrich_patient(p) for p in patient_service.get_patients(limit=100)['data']]
-    services = catalog_service.get_all_services()
+    for inv in result['data']:
+        _flatten_invoice(inv)
+    result['patients_list'] = [_enrich_patient(p) for p in patient_service.get_patients(limit=100)['data']]
+    result['services'] = catalog_service.get_all_services()
     return jsonify({
         'success': True,
-        'data': {
-            **result,
-            'patients_list': patients,
-            'services': services,
-        },
+        'data': result,
         'search': search,
         'status_filter': status_filter,
     })
@@ -59,6 +57,23 @@ def create():
     return jsonify({'success': False, 'error': 'שגיאה ביצירת חשבונית'}), 400
 
 
+@invoices_bp.route('/auto', methods=['POST'])
+@login_required
+def auto_invoice():
+    data = request.get_json(silent=True) or {}
+    try:
+        until = date.fromisoformat(data['until']) if data.get('until') else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'תאריך לא תקין'}), 400
+    created = invoice_service.auto_invoice(until)
+    return jsonify({
+        'success': True,
+        'data': created,
+        'created': len(created),
+        'total': sum(float(inv['amount']) for inv in created),
+    })
+
+
 @invoices_bp.route('/<invoice_id>', methods=['PUT'])
 @login_required
 def update(invoice_id):
@@ -1,8 +1,11 @@
-from flask import Blueprint, request, jsonify, g
+import io
+from flask import Blueprint, Response, current_app, request, jsonify, g, stream_with_context
 from backend.middleware.auth_middleware import login_required, role_required
-from backend.services import patient_service
+from backend.services import patient_service, import_service
+from backend.routes.export import add_export_route
 
 patients_bp = Blueprint('patients', __name__)
+add_export_route(patients_bp, 'patients')
 
 
 def _enrich_patient(p):
@@ -72,6 +75,22 @@ def create():
     return jsonify({'success': False, 'error': 'שגיאה ביצירת מטופל'}), 400
 
 
+@patients_bp.route('/import', methods=['POST'])
+@login_required
+def import_csv():
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'success': False, 'error': 'יש לצרף קובץ CSV'}), 400
+
+    lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+
+    def generate():
+        for event in import_service.import_patients(lines):
+            yield current_app.json.dumps(event) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @patients_bp.route('/<patient_id>', methods=['PUT'])
 @login_required
 def update(patient_id):
@@ -1,8 +1,10 @@
 from flask import Blueprint, request, jsonify
 from backend.middleware.auth_middleware import login_required
-from backend.services import catalog_service
+from backend.services import appointment_service, catalog_service
+from backend.routes.batch import add_batch_routes
 
 services_bp = Blueprint('services', __name__)
+add_batch_routes(services_bp, 'services')
 
 
 @services_bp.route('/')
@@ -28,7 +30,10 @@ def create():
 @login_required
 def update(service_id):
     data = request.get_json()
-    service = catalog_service.update_service(service_id, data)
+    try:
+        service = catalog_service.update_service(service_id, data)
+    except appointment_service.AppointmentConflict:
+        return jsonify({'success': False, 'error': 'משך השירות החדש יוצר חפיפה בתורים עתידיים'}), 409
     if service:
         return jsonify({'success': True, 'data': service})
     return jsonify({'success': False, 'error': 'שגיאה בעדכון שירות'}), 400
@@ -1,24 +1,45 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from backend.middleware.auth_middleware import login_required
 from backend.services import task_service
+from backend.routes.batch import add_batch_routes
 
 tasks_bp = Blueprint('tasks', __name__)
+add_batch_routes(tasks_bp, 'tasks')
 
 
 @tasks_bp.route('/')
 @login_required
 def list_tasks():
-    grouped = task_service.get_tasks_grouped()
+    limit = request.args.get('limit', current_app.config['TASK_BOARD_COLUMN_LIMIT'], type=int)
+    grouped, counts = task_service.get_tasks_grouped(limit_per_status=limit)
     users = task_service.get_users()
     return jsonify({
         'success': True,
         'data': {
             'tasks': grouped,
+            'counts': counts,
+            'has_more': {status: counts[status] > len(grouped[status]) for status in grouped},
             'users': users,
         },
     })
 
 
+@tasks_bp.route('/column/<status>')
+@login_required
+def column(status):
+    if status not in task_service.TASK_STATUSES:
+        return jsonify({'success': False, 'error': 'סטטוס לא חוקי'}), 400
+    limit = request.args.get('limit', current_app.config['TASK_BOARD_COLUMN_LIMIT'], type=int)
+    tasks = task_service.get_column_tasks(status, request.args.get('after', ''), limit=limit)
+    return jsonify({
+        'success': True,
+        'data': {
+            'tasks': tasks,
+            'has_more': len(tasks) == limit,
+        },
+    })
+
+
 @tasks_bp.route('/', methods=['POST'])
 @login_required
 def create():
@@ -44,13 +65,26 @@ def update(task_id):
 def update_status(task_id):
     data = request.get_json()
     new_status = data.get('status')
-    position = data.get('position', 0)
-    task = task_service.update_task_status(task_id, new_status, position)
+    task = task_service.update_task_status(
+        task_id, new_status, prev_id=data.get('prev_id'), next_id=data.get('next_id')
+    )
     if task:
         return jsonify({'success': True, 'data': task})
     return jsonify({'success': False, 'error': 'שגיאה בעדכון סטטוס'}), 400
 
 
+@tasks_bp.route('/reorder', methods=['PUT'])
+@login_required
+def reorder():
+    data = request.get_json() or {}
+    status = data.get('status')
+    task_ids = data.get('task_ids')
+    if status not in task_service.TASK_STATUSES or not isinstance(task_ids, list) or not task_ids:
+        return jsonify({'success': False, 'error': 'יש לשלוח סטטוס ורשימת משימות'}), 400
+    updated = task_service.reorder_tasks(status, task_ids)
+    return jsonify({'success': True, 'data': {'updated': updated}})
+
+
 @tasks_bp.route('/<task_id>', methods=['DELETE'])
 @login_required
 def delete(task_id):
@@ -0,0 +1,81 @@
+"""
+In-process background job runner.
+Jobs are registered with @job and run on a daemon thread in every gunicorn
+worker (started from post_worker_init in gunicorn.conf.py, i.e. after the
+fork). Each job is responsible for being safe to run concurrently from
+several workers, typically through an advisory lock in its RPC.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime
+from backend.extensions import get_supabase
+
+logger = logging.getLogger(__name__)
+
+_jobs = []      # (name, config key holding the interval in seconds, func)
+_thread = None
+_thread_pid = None
+_lock = threading.Lock()
+
+
+def job(name, interval_key):
+    """Register func to run every app.config[interval_key] seconds."""
+    def decorator(func):
+        _jobs.append((name, interval_key, func))
+        return func
+    return decorator
+
+
+def claim_daily(name):
+    """True for the first worker to claim `name` today (job_runs row)."""
+    return bool(get_supabase().rpc('claim_job_run', {'p_job': name}).execute().data)
+
+
+def release_daily(name):
+    """Undo today's claim after a failed run so a later tick retries it."""
+    get_supabase().table('job_runs').delete() \
+        .eq('job', name).eq('run_date', date.today().isoformat()).execute()
+
+
+def finish_daily(name, affected):
+    get_supabase().table('job_runs').update({
+        'affected': affected,
+        'finished_at': datetime.now().isoformat(),
+    }).eq('job', name).eq('run_date', date.today().isoformat()).execute()
+
+
+def _run_loop(app):
+    next_run = {name: 0.0 for name, _, _ in _jobs}
+    # Let the worker finish booting and spread workers apart a little
+    time.sleep(app.config['SCHEDULER_STARTUP_DELAY'] + os.getpid() % 10)
+    while True:
+        now = time.monotonic()
+        for name, interval_key, func in _jobs:
+            if now < next_run[name]:
+                continue
+            next_run[name] = now + app.config[interval_key]
+            try:
+                with app.app_context():
+                    result = func()
+                logger.info('Job %s finished: %s', name, result)
+            except Exception as e:
+                logger.warning('Job %s failed: %s', name, e)
+        time.sleep(app.config['SCHEDULER_TICK_SECONDS'])
+
+
+def start(app):
+    """Start this process's scheduler thread unless disabled or already running."""
+    global _thread, _thread_pid
+    if not app.config['SCHEDULER_ENABLED']:
+        return
+    # Import the modules that register jobs
+    from backend.services import forecast_service, invoice_service, no_show_service, task_service  # noqa: F401
+
+    with _lock:
+        if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+            return
+        _thread = threading.Thread(target=_run_loop, args=(app,), name='scheduler', daemon=True)
+        _thread_pid = os.getpid()
+        _thread.start()
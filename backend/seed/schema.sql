@@ -100,6 +100,14 @@ CREATE INDEX IF NOT EXISTS idx_invoices_status ON invoices(status);
 CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
 CREATE INDEX IF NOT EXISTS idx_medical_history_patient ON medical_history(patient_id);
 
+-- Calendar range reads per doctor (WHERE doctor_id = ? AND appointment_date in a week)
+CREATE INDEX IF NOT EXISTS idx_appointments_doctor_date ON appointments(doctor_id, appointment_date);
+
+-- Keyset pagination for streaming exports (ORDER BY <date>, id)
+CREATE INDEX IF NOT EXISTS idx_invoices_issued_id ON invoices(issued_date, id);
+CREATE INDEX IF NOT EXISTS idx_appointments_date_id ON appointments(appointment_date, id);
+CREATE INDEX IF NOT EXISTS idx_patients_created_id ON patients(created_at, id);
+
 -- RPC Function for RAG Chat (read-only SQL execution)
 CREATE OR REPLACE FUNCTION execute_readonly_query(query_text TEXT)
 RETURNS JSON
@@ -125,3 +133,1336 @@ BEGIN
     RETURN COALESCE(result, '[]'::JSON);
 END;
 $$;
+
+-- ──────────────────────────────────────────────
+-- List search (appointments / invoices)
+-- ──────────────────────────────────────────────
+-- A denormalized search_text column kept in sync by triggers, indexed with
+-- trigram GIN indexes so ILIKE '%q%' and similarity ranking stay indexed.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS search_text TEXT;
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS search_text TEXT;
+
+CREATE OR REPLACE FUNCTION appointments_set_search_text()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.search_text := concat_ws(' ',
+        (SELECT first_name || ' ' || last_name FROM patients WHERE id = NEW.patient_id),
+        (SELECT name FROM services WHERE id = NEW.service_id));
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION invoices_set_search_text()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.search_text := concat_ws(' ',
+        NEW.invoice_number,
+        (SELECT first_name || ' ' || last_name FROM patients WHERE id = NEW.patient_id));
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_appointments_search_text
+    BEFORE INSERT OR UPDATE OF patient_id, service_id ON appointments
+    FOR EACH ROW EXECUTE FUNCTION appointments_set_search_text();
+
+CREATE OR REPLACE TRIGGER trg_invoices_search_text
+    BEFORE INSERT OR UPDATE OF invoice_number, patient_id ON invoices
+    FOR EACH ROW EXECUTE FUNCTION invoices_set_search_text();
+
+-- Renaming a patient or service refreshes the rows that embed the name
+CREATE OR REPLACE FUNCTION refresh_search_text_for_patient()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE appointments SET patient_id = patient_id WHERE patient_id = NEW.id;
+    UPDATE invoices SET patient_id = patient_id WHERE patient_id = NEW.id;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION refresh_search_text_for_service()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE appointments SET service_id = service_id WHERE service_id = NEW.id;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_patients_refresh_search_text
+    AFTER UPDATE OF first_name, last_name ON patients
+    FOR EACH ROW EXECUTE FUNCTION refresh_search_text_for_patient();
+
+CREATE OR REPLACE TRIGGER trg_services_refresh_search_text
+    AFTER UPDATE OF name ON services
+    FOR EACH ROW EXECUTE FUNCTION refresh_search_text_for_service();
+
+-- Backfill rows created before the triggers existed
+UPDATE appointments SET patient_id = patient_id WHERE search_text IS NULL;
+UPDATE invoices SET patient_id = patient_id WHERE search_text IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_appointments_search_trgm ON appointments USING GIN (search_text gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_invoices_search_trgm ON invoices USING GIN (search_text gin_trgm_ops);
+
+-- Ranked, paginated search. Substring matches (ILIKE) and fuzzy matches (%)
+-- both use the trigram index; results are ordered by similarity.
+CREATE OR REPLACE FUNCTION search_appointments(
+    p_query TEXT, p_status TEXT DEFAULT '', p_limit INT DEFAULT 10, p_offset INT DEFAULT 0)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    WITH q AS (
+        SELECT '%' || replace(replace(replace(p_query, '\', '\\'), '%', '\%'), '_', '\_') || '%' AS pattern
+    ),
+    matches AS (
+        SELECT a.*, similarity(a.search_text, p_query) AS rank
+        FROM appointments a, q
+        WHERE (a.search_text ILIKE q.pattern OR a.search_text % p_query)
+          AND (p_status = '' OR a.status = p_status)
+    )
+    SELECT json_build_object(
+        'total', (SELECT count(*) FROM matches),
+        'data', COALESCE((
+            SELECT json_agg(t) FROM (
+                SELECT m.*,
+                       json_build_object('first_name', p.first_name, 'last_name', p.last_name) AS patients,
+                       json_build_object('name', s.name) AS services
+                FROM matches m
+                LEFT JOIN patients p ON p.id = m.patient_id
+                LEFT JOIN services s ON s.id = m.service_id
+                ORDER BY m.rank DESC, m.appointment_date DESC
+                LIMIT p_limit OFFSET p_offset
+            ) t
+        ), '[]'::JSON)
+    );
+$$;
+
+CREATE OR REPLACE FUNCTION search_invoices(
+    p_query TEXT, p_status TEXT DEFAULT '', p_limit INT DEFAULT 10, p_offset INT DEFAULT 0)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    WITH q AS (
+        SELECT '%' || replace(replace(replace(p_query, '\', '\\'), '%', '\%'), '_', '\_') || '%' AS pattern
+    ),
+    matches AS (
+        SELECT i.*, similarity(i.search_text, p_query) AS rank
+        FROM invoices i, q
+        WHERE (i.search_text ILIKE q.pattern OR i.search_text % p_query)
+          AND (p_status = '' OR i.status = p_status)
+    )
+    SELECT json_build_object(
+        'total', (SELECT count(*) FROM matches),
+        'data', COALESCE((
+            SELECT json_agg(t) FROM (
+                SELECT m.id, m.invoice_number, m.patient_id, m.appointment_id, m.amount, m.status,
+                       m.issued_date, m.paid_date, m.created_at, m.rank,
+                       json_build_object('first_name', p.first_name, 'last_name', p.last_name) AS patients
+                FROM matches m
+                LEFT JOIN patients p ON p.id = m.patient_id
+                ORDER BY m.rank DESC, m.issued_date DESC
+                LIMIT p_limit OFFSET p_offset
+            ) t
+        ), '[]'::JSON)
+    );
+$$;
+
+-- ──────────────────────────────────────────────
+-- Kanban ordering (fractional rank keys)
+-- ──────────────────────────────────────────────
+-- tasks.rank is a base-62 key compared byte-wise, so moving a card only
+-- rewrites that card (see backend/services/lexorank.py).
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS rank TEXT COLLATE "C";
+
+UPDATE tasks t SET rank = r.rank
+FROM (
+    SELECT id, lpad(to_hex(row_number() OVER (PARTITION BY status ORDER BY position, created_at)), 6, '0') || 'V' AS rank
+    FROM tasks
+) r
+WHERE t.id = r.id AND t.rank IS NULL;
+
+-- Rows inserted without a rank (seeds, direct SQL, other clients) go to the
+-- end of their column; same key as rank_between(last, None) in lexorank.py
+CREATE OR REPLACE FUNCTION rank_after(p_before TEXT)
+RETURNS TEXT
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+    v_digits CONSTANT TEXT := '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz';
+    v_key TEXT := '';
+    v_lo INT;
+    i INT := 1;
+BEGIN
+    LOOP
+        v_lo := CASE WHEN i <= length(COALESCE(p_before, ''))
+                     THEN strpos(v_digits, substr(p_before, i, 1)) - 1 ELSE 0 END;
+        IF 62 - v_lo > 1 THEN
+            RETURN v_key || substr(v_digits, (v_lo + 62) / 2 + 1, 1);
+        END IF;
+        v_key := v_key || substr(v_digits, v_lo + 1, 1);
+        i := i + 1;
+    END LOOP;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION tasks_default_rank()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.rank IS NULL THEN
+        NEW.rank := rank_after((SELECT max(rank) FROM tasks WHERE status = NEW.status));
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tasks_default_rank ON tasks;
+CREATE TRIGGER trg_tasks_default_rank
+    BEFORE INSERT ON tasks
+    FOR EACH ROW EXECUTE FUNCTION tasks_default_rank();
+
+ALTER TABLE tasks ALTER COLUMN rank SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_tasks_status_rank ON tasks(status, rank);
+
+-- Bulk rank assignment for reorder/rebalance in a single statement
+CREATE OR REPLACE FUNCTION set_task_ranks(p_ids UUID[], p_ranks TEXT[], p_status TEXT DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE tasks t
+        SET rank = u.rank, status = COALESCE(p_status, t.status)
+        FROM unnest(p_ids, p_ranks) AS u(id, rank)
+        WHERE t.id = u.id
+        RETURNING t.id
+    )
+    SELECT count(*)::INTEGER FROM updated;
+$$;
+
+-- ──────────────────────────────────────────────
+-- Change events (live updates outbox)
+-- ──────────────────────────────────────────────
+-- Written by the service layer on every task/appointment/invoice write and
+-- tailed by each gunicorn worker to fan events out to its SSE clients.
+-- Old rows are pruned by the workers (EVENTS_RETENTION_MINUTES).
+CREATE TABLE IF NOT EXISTS change_events (
+    id BIGSERIAL PRIMARY KEY,
+    topic VARCHAR(30) NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    row_id UUID,
+    payload JSONB,
+    origin VARCHAR(100),
+    created_at TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'utc')
+);
+
+CREATE INDEX IF NOT EXISTS idx_change_events_created ON change_events(created_at);
+
+-- Single-use tickets for opening an event stream. EventSource cannot send
+-- an Authorization header, so the browser trades its JWT for a ticket that
+-- goes in the URL instead; only the ticket's hash is stored.
+CREATE TABLE IF NOT EXISTS stream_tickets (
+    ticket_hash VARCHAR(64) PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    expires_at TIMESTAMP NOT NULL
+);
+
+-- Returns the ticket's user and deletes it (plus any expired tickets)
+CREATE OR REPLACE FUNCTION consume_stream_ticket(p_hash TEXT)
+RETURNS UUID
+LANGUAGE sql
+AS $$
+    WITH expired AS (
+        DELETE FROM stream_tickets
+        WHERE expires_at < NOW() AT TIME ZONE 'utc'
+    )
+    DELETE FROM stream_tickets
+    WHERE ticket_hash = p_hash AND expires_at >= NOW() AT TIME ZONE 'utc'
+    RETURNING user_id;
+$$;
+
+-- ──────────────────────────────────────────────
+-- Task board: bounded columns and archive
+-- ──────────────────────────────────────────────
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION tasks_set_completed_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.status = 'done' AND (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'done') THEN
+        NEW.completed_at := NOW();
+    ELSIF NEW.status <> 'done' THEN
+        NEW.completed_at := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_tasks_completed_at
+    BEFORE INSERT OR UPDATE OF status ON tasks
+    FOR EACH ROW EXECUTE FUNCTION tasks_set_completed_at();
+
+UPDATE tasks SET completed_at = created_at WHERE status = 'done' AND completed_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_tasks_done_completed ON tasks(completed_at) WHERE status = 'done';
+
+CREATE TABLE IF NOT EXISTS tasks_archive (
+    id UUID PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    description TEXT,
+    status VARCHAR(20),
+    priority VARCHAR(20),
+    assigned_to UUID REFERENCES users(id),
+    due_date DATE,
+    position INTEGER,
+    rank TEXT COLLATE "C",
+    created_at TIMESTAMP,
+    completed_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Move done tasks older than N days to tasks_archive in one statement;
+-- returns the archived ids so callers can publish delete events
+DROP FUNCTION IF EXISTS archive_done_tasks(INT);
+CREATE OR REPLACE FUNCTION archive_done_tasks(p_older_than_days INT)
+RETURNS UUID[]
+LANGUAGE sql
+AS $$
+    WITH moved AS (
+        DELETE FROM tasks
+        WHERE status = 'done' AND completed_at < NOW() - make_interval(days => p_older_than_days)
+        RETURNING id, title, description, status, priority, assigned_to, due_date, position, rank,
+                  created_at, completed_at
+    ),
+    inserted AS (
+        INSERT INTO tasks_archive (id, title, description, status, priority, assigned_to, due_date,
+                                   position, rank, created_at, completed_at)
+        SELECT * FROM moved
+        ON CONFLICT (id) DO NOTHING
+    )
+    SELECT COALESCE(array_agg(id), '{}') FROM moved;
+$$;
+
+-- The first p_limit tasks of every column plus per-column counts, in one call
+CREATE OR REPLACE FUNCTION get_task_board(p_limit INT)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT json_build_object(
+        'counts', COALESCE((SELECT json_object_agg(status, n) FROM (
+            SELECT status, count(*) AS n FROM tasks GROUP BY status
+        ) c), '{}'::JSON),
+        'tasks', COALESCE((SELECT json_agg(t ORDER BY t.rank, t.position) FROM (
+            SELECT tk.*, json_build_object('full_name', u.full_name) AS users
+            FROM (VALUES ('open'), ('in_progress'), ('done')) AS s(status)
+            CROSS JOIN LATERAL (
+                SELECT * FROM tasks
+                WHERE tasks.status = s.status
+                ORDER BY rank, position
+                LIMIT p_limit
+            ) tk
+            LEFT JOIN users u ON u.id = tk.assigned_to
+        ) t), '[]'::JSON)
+    );
+$$;
+
+-- ──────────────────────────────────────────────
+-- Cache versions (cross-worker invalidation)
+-- ──────────────────────────────────────────────
+-- backend/cache.py stamps cached entries with these versions; bumping a
+-- namespace makes every worker drop its entries on the next version check.
+CREATE TABLE IF NOT EXISTS cache_versions (
+    namespace VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION bump_cache_version(p_namespace TEXT)
+RETURNS BIGINT
+LANGUAGE sql
+AS $$
+    INSERT INTO cache_versions (namespace, version) VALUES (p_namespace, 1)
+    ON CONFLICT (namespace) DO UPDATE
+        SET version = cache_versions.version + 1, updated_at = NOW()
+    RETURNING version;
+$$;
+
+CREATE OR REPLACE FUNCTION cache_version_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM bump_cache_version(TG_ARGV[0]);
+    RETURN NULL;
+END;
+$$;
+
+-- Writes from outside the app (SQL editor, seed script) also invalidate
+CREATE OR REPLACE TRIGGER trg_services_cache_version
+    AFTER INSERT OR UPDATE OR DELETE ON services
+    FOR EACH STATEMENT EXECUTE FUNCTION cache_version_trigger('services');
+
+CREATE OR REPLACE TRIGGER trg_users_cache_version
+    AFTER INSERT OR UPDATE OR DELETE ON users
+    FOR EACH STATEMENT EXECUTE FUNCTION cache_version_trigger('users');
+
+-- ──────────────────────────────────────────────
+-- Appointment overlap protection
+-- ──────────────────────────────────────────────
+-- ends_at is derived from the service duration so a GiST exclusion
+-- constraint can reject double-booking a doctor at write time. tsrange
+-- (not tstzrange) because appointment_date is a local TIMESTAMP.
+-- Existing double bookings must be resolved before the constraint can be
+-- added; appointment_conflicts() lists them per appointment.
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS ends_at TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION appointment_duration(p_service_id UUID)
+RETURNS INTERVAL
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT make_interval(mins => COALESCE(
+        (SELECT duration_minutes FROM services WHERE id = p_service_id), 30
+    ));
+$$;
+
+CREATE OR REPLACE FUNCTION appointments_set_ends_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.ends_at := NEW.appointment_date + appointment_duration(NEW.service_id);
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_appointments_ends_at
+    BEFORE INSERT OR UPDATE OF appointment_date, service_id, ends_at ON appointments
+    FOR EACH ROW EXECUTE FUNCTION appointments_set_ends_at();
+
+UPDATE appointments SET ends_at = appointment_date + appointment_duration(service_id)
+WHERE ends_at IS NULL;
+
+-- A new service duration moves ends_at of the service's upcoming
+-- appointments; past ones keep the length they were booked with. If the
+-- longer duration double-books a doctor, appointments_no_overlap rejects
+-- the service update.
+CREATE OR REPLACE FUNCTION services_sync_ends_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE appointments
+    SET ends_at = appointment_date + make_interval(mins => COALESCE(NEW.duration_minutes, 30))
+    WHERE service_id = NEW.id AND appointment_date >= NOW();
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_services_ends_at
+    AFTER UPDATE OF duration_minutes ON services
+    FOR EACH ROW WHEN (OLD.duration_minutes IS DISTINCT FROM NEW.duration_minutes)
+    EXECUTE FUNCTION services_sync_ends_at();
+
+-- Busy appointments of a doctor overlapping [p_start, p_start + duration),
+-- served by the exclusion constraint's GiST index
+CREATE OR REPLACE FUNCTION appointment_conflicts(
+    p_doctor_id UUID,
+    p_start TIMESTAMP,
+    p_service_id UUID,
+    p_exclude_id UUID DEFAULT NULL
+)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(json_agg(json_build_object(
+        'id', a.id,
+        'appointment_date', a.appointment_date,
+        'ends_at', a.ends_at,
+        'status', a.status,
+        'patient_name', trim(COALESCE(p.first_name, '') || ' ' || COALESCE(p.last_name, '')),
+        'service_name', s.name
+    ) ORDER BY a.appointment_date), '[]'::JSON)
+    FROM appointments a
+    LEFT JOIN patients p ON p.id = a.patient_id
+    LEFT JOIN services s ON s.id = a.service_id
+    WHERE a.doctor_id = p_doctor_id
+      AND a.status IN ('scheduled', 'completed')
+      AND a.id IS DISTINCT FROM p_exclude_id
+      AND tsrange(a.appointment_date, a.ends_at)
+          && tsrange(p_start, p_start + appointment_duration(p_service_id));
+$$;
+
+-- Added after appointment_conflicts() so that, if existing double bookings
+-- make this fail, the function is there to list them
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'appointments_no_overlap') THEN
+        ALTER TABLE appointments ADD CONSTRAINT appointments_no_overlap
+            EXCLUDE USING gist (doctor_id WITH =, tsrange(appointment_date, ends_at) WITH &&)
+            WHERE (doctor_id IS NOT NULL AND status IN ('scheduled', 'completed'))
+            DEFERRABLE INITIALLY IMMEDIATE;
+    END IF;
+END;
+$$;
+
+-- ──────────────────────────────────────────────
+-- Recurring appointment series
+-- ──────────────────────────────────────────────
+-- A series stores the RRULE it was generated from; its occurrences are
+-- ordinary appointment rows linked by series_id, materialized in bulk.
+CREATE TABLE IF NOT EXISTS appointment_series (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    patient_id UUID REFERENCES patients(id) ON DELETE CASCADE,
+    service_id UUID REFERENCES services(id),
+    doctor_id UUID REFERENCES users(id),
+    rrule TEXT NOT NULL,
+    starts_at TIMESTAMP NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS series_id UUID
+    REFERENCES appointment_series(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_appointments_series ON appointments(series_id, appointment_date)
+    WHERE series_id IS NOT NULL;
+
+-- Shifting a series moves occurrences onto each other's old slots, so the
+-- overlap constraint must be checked at commit rather than per row.
+-- Re-create it as deferrable on databases that got the immediate version.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_constraint
+               WHERE conname = 'appointments_no_overlap' AND NOT condeferrable) THEN
+        ALTER TABLE appointments DROP CONSTRAINT appointments_no_overlap;
+        ALTER TABLE appointments ADD CONSTRAINT appointments_no_overlap
+            EXCLUDE USING gist (doctor_id WITH =, tsrange(appointment_date, ends_at) WITH &&)
+            WHERE (doctor_id IS NOT NULL AND status IN ('scheduled', 'completed'))
+            DEFERRABLE INITIALLY IMMEDIATE;
+    END IF;
+END;
+$$;
+
+-- Conflicts for every proposed occurrence in one pass: one row per start
+-- that overlaps a busy appointment of the doctor (other series excluded
+-- from the check when p_exclude_series is given)
+CREATE OR REPLACE FUNCTION series_conflicts(
+    p_doctor_id UUID,
+    p_service_id UUID,
+    p_starts TIMESTAMP[],
+    p_exclude_series UUID DEFAULT NULL
+)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(json_agg(json_build_object('start', o.start, 'conflicts', c.rows) ORDER BY o.start), '[]'::JSON)
+    FROM unnest(p_starts) AS o(start)
+    CROSS JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'id', a.id,
+            'appointment_date', a.appointment_date,
+            'ends_at', a.ends_at,
+            'status', a.status
+        ) ORDER BY a.appointment_date) AS rows
+        FROM appointments a
+        WHERE a.doctor_id = p_doctor_id
+          AND a.status IN ('scheduled', 'completed')
+          AND (p_exclude_series IS NULL OR a.series_id IS DISTINCT FROM p_exclude_series)
+          AND tsrange(a.appointment_date, a.ends_at)
+              && tsrange(o.start, o.start + appointment_duration(p_service_id))
+    ) c
+    WHERE c.rows IS NOT NULL;
+$$;
+
+-- Stored busy appointments overlapping each proposed batch item, in one
+-- pass; p_exclude_ids are rows the batch itself is moving
+CREATE OR REPLACE FUNCTION batch_conflicts(p_items JSONB, p_exclude_ids UUID[] DEFAULT '{}')
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(json_agg(json_build_object('item', i.item, 'conflicts', c.rows) ORDER BY i.item), '[]'::JSON)
+    FROM jsonb_to_recordset(p_items) AS i(item INT, doctor_id UUID, start TIMESTAMP, service_id UUID)
+    CROSS JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'id', a.id,
+            'appointment_date', a.appointment_date,
+            'ends_at', a.ends_at,
+            'status', a.status,
+            'patient_name', trim(COALESCE(p.first_name, '') || ' ' || COALESCE(p.last_name, '')),
+            'service_name', s.name
+        ) ORDER BY a.appointment_date) AS rows
+        FROM appointments a
+        LEFT JOIN patients p ON p.id = a.patient_id
+        LEFT JOIN services s ON s.id = a.service_id
+        WHERE a.doctor_id = i.doctor_id
+          AND a.status IN ('scheduled', 'completed')
+          AND a.id <> ALL(COALESCE(p_exclude_ids, '{}'))
+          AND tsrange(a.appointment_date, a.ends_at)
+              && tsrange(i.start, i.start + appointment_duration(i.service_id))
+    ) c
+    WHERE c.rows IS NOT NULL;
+$$;
+
+-- Move the scheduled occurrences from p_from onwards by p_minutes and apply
+-- p_patch (only the keys present) in one statement, so a double-booking
+-- rolls back the whole edit
+DROP FUNCTION IF EXISTS shift_series(UUID, TIMESTAMP, INT);
+CREATE OR REPLACE FUNCTION update_series_following(
+    p_series_id UUID, p_from TIMESTAMP, p_minutes INT DEFAULT 0, p_patch JSONB DEFAULT '{}'
+)
+RETURNS SETOF appointments
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    SET CONSTRAINTS appointments_no_overlap DEFERRED;
+    RETURN QUERY
+        UPDATE appointments a
+        SET appointment_date = a.appointment_date + make_interval(mins => p_minutes),
+            service_id = CASE WHEN p_patch ? 'service_id' THEN p.service_id ELSE a.service_id END,
+            doctor_id = CASE WHEN p_patch ? 'doctor_id' THEN p.doctor_id ELSE a.doctor_id END,
+            notes = CASE WHEN p_patch ? 'notes' THEN p.notes ELSE a.notes END,
+            status = CASE WHEN p_patch ? 'status' THEN p.status ELSE a.status END
+        FROM jsonb_populate_record(NULL::appointments, p_patch) p
+        WHERE a.series_id = p_series_id AND a.appointment_date >= p_from AND a.status = 'scheduled'
+        RETURNING a.*;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_appointments_cache_version
+    AFTER INSERT OR UPDATE OR DELETE ON appointments
+    FOR EACH STATEMENT EXECUTE FUNCTION cache_version_trigger('calendar');
+
+-- ──────────────────────────────────────────────
+-- Scheduled jobs
+-- ──────────────────────────────────────────────
+-- Every worker runs backend/scheduler.py; a job body runs once per day
+-- cluster-wide: the transaction-scoped advisory lock picks one leader and
+-- the (job, run_date) key makes later attempts that day no-ops.
+CREATE TABLE IF NOT EXISTS job_runs (
+    job VARCHAR(50) NOT NULL,
+    run_date DATE NOT NULL,
+    affected INTEGER,
+    started_at TIMESTAMP DEFAULT NOW(),
+    finished_at TIMESTAMP,
+    PRIMARY KEY (job, run_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_invoices_pending_issued ON invoices(issued_date) WHERE status = 'pending';
+
+-- Flip pending invoices issued more than p_due_days ago to overdue.
+-- p_force re-runs even if today's run is already recorded.
+CREATE OR REPLACE FUNCTION sweep_overdue_invoices(p_due_days INT, p_force BOOLEAN DEFAULT FALSE)
+RETURNS JSON
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_rows JSON;
+    v_count INTEGER;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('sweep_overdue_invoices')) THEN
+        RETURN json_build_object('ran', false, 'reason', 'locked');
+    END IF;
+
+    INSERT INTO job_runs (job, run_date) VALUES ('sweep_overdue_invoices', CURRENT_DATE)
+    ON CONFLICT (job, run_date) DO NOTHING;
+    IF NOT FOUND AND NOT p_force THEN
+        RETURN json_build_object('ran', false, 'reason', 'already_ran');
+    END IF;
+
+    WITH flipped AS (
+        UPDATE invoices SET status = 'overdue'
+        WHERE status = 'pending' AND issued_date < CURRENT_DATE - p_due_days
+        RETURNING *
+    )
+    SELECT count(*)::INTEGER, COALESCE(json_agg(flipped), '[]'::JSON) INTO v_count, v_rows FROM flipped;
+
+    UPDATE job_runs SET affected = v_count, finished_at = NOW()
+    WHERE job = 'sweep_overdue_invoices' AND run_date = CURRENT_DATE;
+
+    RETURN json_build_object('ran', true, 'updated', v_count, 'rows', v_rows);
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_invoices_cache_version
+    AFTER INSERT OR UPDATE OR DELETE ON invoices
+    FOR EACH STATEMENT EXECUTE FUNCTION cache_version_trigger('payments');
+
+-- Closed revenue periods (before today) are cached in 'revenue_closed', which
+-- only a write to a paid invoice dated before today bumps
+CREATE OR REPLACE FUNCTION revenue_closed_cache_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_closed BOOLEAN := FALSE;
+BEGIN
+    -- Separate statements: a transition table missing for TG_OP must not be planned
+    IF TG_OP <> 'DELETE' THEN
+        v_closed := EXISTS (SELECT 1 FROM new_rows WHERE status = 'paid' AND issued_date < CURRENT_DATE);
+    END IF;
+    IF NOT v_closed AND TG_OP <> 'INSERT' THEN
+        v_closed := EXISTS (SELECT 1 FROM old_rows WHERE status = 'paid' AND issued_date < CURRENT_DATE);
+    END IF;
+    IF v_closed THEN
+        PERFORM bump_cache_version('revenue_closed');
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Transition tables allow one event per trigger
+CREATE OR REPLACE TRIGGER trg_invoices_revenue_closed_insert
+    AFTER INSERT ON invoices REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION revenue_closed_cache_trigger();
+
+CREATE OR REPLACE TRIGGER trg_invoices_revenue_closed_update
+    AFTER UPDATE ON invoices REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION revenue_closed_cache_trigger();
+
+CREATE OR REPLACE TRIGGER trg_invoices_revenue_closed_delete
+    AFTER DELETE ON invoices REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION revenue_closed_cache_trigger();
+
+-- ──────────────────────────────────────────────
+-- Auto-invoicing of completed appointments
+-- ──────────────────────────────────────────────
+CREATE INDEX IF NOT EXISTS idx_invoices_appointment ON invoices(appointment_id);
+
+-- Invoice every completed appointment up to p_until that has no invoice
+-- yet, priced from its service, in one INSERT ... SELECT (anti-join on
+-- idx_invoices_appointment). Invoice numbers come from the numbering
+-- trigger below; the advisory lock serializes concurrent runs so an
+-- appointment is never billed twice.
+CREATE OR REPLACE FUNCTION auto_invoice_completed(p_until DATE DEFAULT CURRENT_DATE)
+RETURNS JSON
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_rows JSON;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('auto_invoice_completed'));
+
+    WITH created AS (
+        INSERT INTO invoices (patient_id, appointment_id, amount, status, issued_date)
+        SELECT a.patient_id, a.id, s.price, 'pending', CURRENT_DATE
+        FROM appointments a
+        JOIN services s ON s.id = a.service_id
+        WHERE a.status = 'completed'
+          AND a.appointment_date < p_until + 1
+          AND NOT EXISTS (SELECT 1 FROM invoices i WHERE i.appointment_id = a.id)
+        ORDER BY a.appointment_date, a.id
+        RETURNING *
+    )
+    SELECT COALESCE(json_agg(created ORDER BY created.invoice_number), '[]'::JSON) INTO v_rows FROM created;
+
+    RETURN v_rows;
+END;
+$$;
+
+-- ──────────────────────────────────────────────
+-- Invoice numbering
+-- ──────────────────────────────────────────────
+-- Numbers are allocated server-side as INV-<year>-<n> from one counter row
+-- per year. The counter is incremented inside the inserting transaction,
+-- so a rolled-back insert gives its number back (no gaps) and concurrent
+-- inserts queue on the row lock only until their transaction commits.
+-- A multi-row INSERT takes a contiguous block in a single transaction.
+-- Rows inserted with an explicit invoice_number keep it.
+CREATE TABLE IF NOT EXISTS invoice_counters (
+    year INTEGER PRIMARY KEY,
+    last_value BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION invoices_assign_number()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_year INTEGER := EXTRACT(YEAR FROM COALESCE(NEW.issued_date, CURRENT_DATE));
+    v_next BIGINT;
+BEGIN
+    IF NEW.invoice_number IS NULL OR NEW.invoice_number = '' THEN
+        INSERT INTO invoice_counters (year, last_value) VALUES (v_year, 1)
+        ON CONFLICT (year) DO UPDATE SET last_value = invoice_counters.last_value + 1
+        RETURNING last_value INTO v_next;
+        -- Pad to five digits but never truncate past 99999
+        NEW.invoice_number := 'INV-' || v_year || '-'
+            || lpad(v_next::TEXT, greatest(5, length(v_next::TEXT)), '0');
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_invoices_number
+    BEFORE INSERT ON invoices
+    FOR EACH ROW EXECUTE FUNCTION invoices_assign_number();
+
+-- ──────────────────────────────────────────────
+-- Invoice aging report
+-- ──────────────────────────────────────────────
+CREATE INDEX IF NOT EXISTS idx_invoices_status_issued ON invoices(status, issued_date);
+
+-- Outstanding (pending/overdue) amounts by age bucket as of p_as_of, per
+-- patient and overall, in one GROUPING SETS aggregate
+CREATE OR REPLACE FUNCTION invoice_aging(p_as_of DATE DEFAULT CURRENT_DATE)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    WITH open_invoices AS (
+        SELECT i.patient_id, i.amount, i.issued_date, p_as_of - i.issued_date AS age
+        FROM invoices i
+        WHERE i.status IN ('pending', 'overdue') AND i.issued_date <= p_as_of
+    ),
+    grouped AS (
+        SELECT
+            patient_id,
+            GROUPING(patient_id) = 1 AS is_total,
+            COALESCE(sum(amount) FILTER (WHERE age <= 30), 0) AS days_0_30,
+            COALESCE(sum(amount) FILTER (WHERE age BETWEEN 31 AND 60), 0) AS days_31_60,
+            COALESCE(sum(amount) FILTER (WHERE age BETWEEN 61 AND 90), 0) AS days_61_90,
+            COALESCE(sum(amount) FILTER (WHERE age > 90), 0) AS days_90_plus,
+            sum(amount) AS total,
+            count(*) AS invoice_count,
+            min(issued_date) AS oldest_issued
+        FROM open_invoices
+        GROUP BY GROUPING SETS ((patient_id), ())
+    )
+    SELECT json_build_object(
+        'as_of', p_as_of,
+        'overall', COALESCE((
+            SELECT json_build_object(
+                'days_0_30', days_0_30, 'days_31_60', days_31_60, 'days_61_90', days_61_90,
+                'days_90_plus', days_90_plus, 'total', COALESCE(total, 0),
+                'invoice_count', invoice_count, 'patient_count',
+                (SELECT count(*) FROM grouped WHERE NOT is_total)
+            ) FROM grouped WHERE is_total
+        ), json_build_object('total', 0, 'invoice_count', 0, 'patient_count', 0)),
+        'patients', COALESCE((
+            SELECT json_agg(json_build_object(
+                'patient_id', g.patient_id,
+                'patient_name', trim(COALESCE(p.first_name, '') || ' ' || COALESCE(p.last_name, '')),
+                'phone', p.phone,
+                'days_0_30', g.days_0_30, 'days_31_60', g.days_31_60,
+                'days_61_90', g.days_61_90, 'days_90_plus', g.days_90_plus,
+                'total', g.total, 'invoice_count', g.invoice_count, 'oldest_issued', g.oldest_issued
+            ) ORDER BY g.days_90_plus DESC, g.total DESC)
+            FROM grouped g
+            LEFT JOIN patients p ON p.id = g.patient_id
+            WHERE NOT g.is_total
+        ), '[]'::JSON)
+    );
+$$;
+
+-- ──────────────────────────────────────────────
+-- Revenue analytics
+-- ──────────────────────────────────────────────
+-- Paid revenue between two dates in calendar buckets (day, week starting
+-- Sunday, month, quarter), optionally split by service, doctor or patient.
+-- Every bucket in the range is listed, including empty ones.
+CREATE OR REPLACE FUNCTION revenue_bucket(p_day DATE, p_granularity TEXT)
+RETURNS DATE
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE
+        WHEN p_granularity = 'week' THEN (date_trunc('week', (p_day + 1)::TIMESTAMP) - INTERVAL '1 day')::DATE
+        ELSE date_trunc(p_granularity, p_day::TIMESTAMP)::DATE
+    END;
+$$;
+
+CREATE OR REPLACE FUNCTION revenue_analytics(
+    p_from DATE,
+    p_to DATE,
+    p_granularity TEXT,
+    p_group_by TEXT DEFAULT NULL
+)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    WITH buckets AS (
+        SELECT gs::DATE AS bucket
+        FROM generate_series(
+            revenue_bucket(p_from, p_granularity)::TIMESTAMP,
+            p_to::TIMESTAMP,
+            CASE WHEN p_granularity = 'quarter' THEN INTERVAL '3 months'
+                 ELSE ('1 ' || p_granularity)::INTERVAL END
+        ) gs
+    ),
+    paid AS (
+        SELECT
+            revenue_bucket(i.issued_date, p_granularity) AS bucket,
+            CASE p_group_by
+                WHEN 'service' THEN a.service_id::TEXT
+                WHEN 'doctor' THEN a.doctor_id::TEXT
+                WHEN 'patient' THEN i.patient_id::TEXT
+            END AS key,
+            CASE p_group_by
+                WHEN 'service' THEN s.name
+                WHEN 'doctor' THEN u.full_name
+                WHEN 'patient' THEN trim(COALESCE(p.first_name, '') || ' ' || COALESCE(p.last_name, ''))
+            END AS label,
+            i.amount
+        FROM invoices i
+        LEFT JOIN appointments a ON a.id = i.appointment_id
+        LEFT JOIN services s ON s.id = a.service_id
+        LEFT JOIN users u ON u.id = a.doctor_id
+        LEFT JOIN patients p ON p.id = i.patient_id
+        WHERE i.status = 'paid' AND i.issued_date BETWEEN p_from AND p_to
+    )
+    SELECT json_build_object(
+        'buckets', COALESCE((SELECT json_agg(bucket ORDER BY bucket) FROM buckets), '[]'::JSON),
+        'rows', COALESCE((SELECT json_agg(r ORDER BY r.bucket) FROM (
+            SELECT bucket, key, label, sum(amount) AS amount, count(*) AS invoices
+            FROM paid
+            GROUP BY bucket, key, label
+        ) r), '[]'::JSON)
+    );
+$$;
+
+-- ──────────────────────────────────────────────
+-- Utilization and no-show analytics
+-- ──────────────────────────────────────────────
+-- When the status last changed, for cancellation lead time
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS status_changed_at TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION appointments_set_status_changed_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.status IS DISTINCT FROM OLD.status THEN
+        NEW.status_changed_at := NOW();
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_appointments_status_changed_at
+    BEFORE UPDATE OF status ON appointments
+    FOR EACH ROW EXECUTE FUNCTION appointments_set_status_changed_at();
+
+-- Appointments in a date range as parallel arrays (one JSON array per
+-- column) so the API can load years of rows in one round trip straight
+-- into NumPy
+CREATE OR REPLACE FUNCTION appointment_facts(p_from DATE, p_to DATE, p_doctor_id UUID DEFAULT NULL)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT json_build_object(
+        'doctor_id', COALESCE(json_agg(a.doctor_id), '[]'::JSON),
+        'start', COALESCE(json_agg(extract(epoch FROM a.appointment_date)::BIGINT), '[]'::JSON),
+        'minutes', COALESCE(json_agg(COALESCE(
+            extract(epoch FROM a.ends_at - a.appointment_date)::INTEGER / 60, 30
+        )), '[]'::JSON),
+        'status', COALESCE(json_agg(a.status), '[]'::JSON),
+        'cancel_lead_minutes', COALESCE(json_agg(
+            CASE WHEN a.status = 'cancelled' AND a.status_changed_at IS NOT NULL
+                 THEN extract(epoch FROM a.appointment_date - a.status_changed_at)::INTEGER / 60
+            END
+        ), '[]'::JSON)
+    )
+    FROM appointments a
+    WHERE a.appointment_date >= p_from
+      AND a.appointment_date < p_to + 1
+      AND a.doctor_id IS NOT NULL
+      AND (p_doctor_id IS NULL OR a.doctor_id = p_doctor_id);
+$$;
+
+-- ──────────────────────────────────────────────
+-- No-show risk scoring
+-- ──────────────────────────────────────────────
+-- Written nightly by backend/services/no_show_service.py
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS no_show_risk REAL;
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS no_show_scored_at TIMESTAMP;
+
+-- Model features as parallel arrays. p_upcoming = false: attended/no-show
+-- appointments of the last p_days (training set, with labels);
+-- p_upcoming = true: scheduled appointments in the next p_days. Patient
+-- history only counts outcomes before each appointment.
+CREATE OR REPLACE FUNCTION no_show_features(p_upcoming BOOLEAN, p_days INT)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    WITH history AS (
+        SELECT
+            a.id, a.status, a.appointment_date, a.service_id,
+            GREATEST(extract(epoch FROM a.appointment_date - a.created_at) / 86400, 0) AS lead_days,
+            count(*) FILTER (WHERE a.status IN ('completed', 'no_show')) OVER w AS prior_visits,
+            count(*) FILTER (WHERE a.status = 'no_show') OVER w AS prior_no_shows
+        FROM appointments a
+        WINDOW w AS (PARTITION BY a.patient_id ORDER BY a.appointment_date
+                     ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING)
+    ),
+    selected AS (
+        SELECT * FROM history h
+        WHERE CASE WHEN p_upcoming
+            THEN h.status = 'scheduled'
+                 AND h.appointment_date >= NOW()::TIMESTAMP
+                 AND h.appointment_date < NOW()::TIMESTAMP + make_interval(days => p_days)
+            ELSE h.status IN ('completed', 'no_show')
+                 AND h.appointment_date >= NOW()::TIMESTAMP - make_interval(days => p_days)
+                 AND h.appointment_date < NOW()::TIMESTAMP
+        END
+    )
+    SELECT json_build_object(
+        'id', COALESCE(json_agg(id), '[]'::JSON),
+        'label', COALESCE(json_agg((status = 'no_show')::INT), '[]'::JSON),
+        'prior_visits', COALESCE(json_agg(prior_visits), '[]'::JSON),
+        'prior_no_shows', COALESCE(json_agg(prior_no_shows), '[]'::JSON),
+        'lead_days', COALESCE(json_agg(round(lead_days::NUMERIC, 2)), '[]'::JSON),
+        'weekday', COALESCE(json_agg(extract(dow FROM appointment_date)::INT), '[]'::JSON),
+        'hour', COALESCE(json_agg(extract(hour FROM appointment_date)::INT), '[]'::JSON),
+        'service_id', COALESCE(json_agg(service_id), '[]'::JSON)
+    )
+    FROM selected;
+$$;
+
+-- Bulk-store scores in one statement
+CREATE OR REPLACE FUNCTION set_no_show_risk(p_ids UUID[], p_scores REAL[])
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE appointments a
+        SET no_show_risk = s.score, no_show_scored_at = NOW()
+        FROM unnest(p_ids, p_scores) AS s(id, score)
+        WHERE a.id = s.id
+        RETURNING 1
+    )
+    SELECT count(*)::INTEGER FROM updated;
+$$;
+
+-- Claim a once-a-day job for jobs whose work happens in Python: only the
+-- first caller of the day gets true
+CREATE OR REPLACE FUNCTION claim_job_run(p_job TEXT)
+RETURNS BOOLEAN
+LANGUAGE sql
+AS $$
+    WITH claimed AS (
+        INSERT INTO job_runs (job, run_date) VALUES (p_job, CURRENT_DATE)
+        ON CONFLICT (job, run_date) DO NOTHING
+        RETURNING 1
+    )
+    SELECT EXISTS (SELECT 1 FROM claimed);
+$$;
+
+-- ──────────────────────────────────────────────
+-- Precomputed analytics
+-- ──────────────────────────────────────────────
+-- Results of background fits (e.g. the revenue forecast), one row per name.
+-- Requests only read these; the 'forecast' cache namespace is bumped on write.
+CREATE TABLE IF NOT EXISTS analytics_snapshots (
+    name VARCHAR(50) PRIMARY KEY,
+    payload JSONB NOT NULL,
+    computed_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE OR REPLACE TRIGGER trg_analytics_snapshots_cache_version
+    AFTER INSERT OR UPDATE OR DELETE ON analytics_snapshots
+    FOR EACH STATEMENT EXECUTE FUNCTION cache_version_trigger('forecast');
+
+-- ──────────────────────────────────────────────
+-- Churn model training
+-- ──────────────────────────────────────────────
+-- Churn features as of p_cutoff (same definitions as churn_service) for
+-- every patient seen before it, labelled 1 when the patient had no
+-- completed visit in the p_horizon days after. Parallel arrays.
+CREATE OR REPLACE FUNCTION churn_training_set(p_cutoff DATE, p_horizon INT)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    WITH history AS (
+        SELECT
+            patient_id,
+            count(*) AS total_appointments,
+            count(*) FILTER (WHERE status IN ('cancelled', 'no_show')) AS cancelled,
+            min(appointment_date) AS first_visit,
+            max(appointment_date) AS last_visit
+        FROM appointments
+        WHERE appointment_date < p_cutoff
+        GROUP BY patient_id
+    ),
+    revenue AS (
+        SELECT patient_id, sum(amount) AS total_revenue
+        FROM invoices
+        WHERE status = 'paid' AND issued_date < p_cutoff
+        GROUP BY patient_id
+    ),
+    returned AS (
+        SELECT DISTINCT patient_id
+        FROM appointments
+        WHERE status = 'completed'
+          AND appointment_date >= p_cutoff
+          AND appointment_date < p_cutoff + p_horizon
+    ),
+    rows AS (
+        SELECT
+            h.patient_id,
+            p_cutoff - h.last_visit::DATE AS days_since_last_visit,
+            h.total_appointments,
+            h.cancelled::REAL / h.total_appointments AS cancelled_ratio,
+            COALESCE(r.total_revenue, 0) AS total_revenue,
+            CASE WHEN h.total_appointments > 1
+                THEN extract(epoch FROM h.last_visit - h.first_visit) / 86400 / (h.total_appointments - 1)
+                ELSE p_cutoff - h.last_visit::DATE
+            END AS avg_interval,
+            (ret.patient_id IS NULL)::INT AS label
+        FROM history h
+        LEFT JOIN revenue r ON r.patient_id = h.patient_id
+        LEFT JOIN returned ret ON ret.patient_id = h.patient_id
+    )
+    SELECT json_build_object(
+        'patient_id', COALESCE(json_agg(patient_id), '[]'::JSON),
+        'days_since_last_visit', COALESCE(json_agg(days_since_last_visit), '[]'::JSON),
+        'total_appointments', COALESCE(json_agg(total_appointments), '[]'::JSON),
+        'cancelled_ratio', COALESCE(json_agg(cancelled_ratio), '[]'::JSON),
+        'total_revenue', COALESCE(json_agg(total_revenue), '[]'::JSON),
+        'avg_interval', COALESCE(json_agg(round(avg_interval::NUMERIC, 2)), '[]'::JSON),
+        'label', COALESCE(json_agg(label), '[]'::JSON)
+    )
+    FROM rows;
+$$;
+
+-- ──────────────────────────────────────────────
+-- Churn feature store
+-- ──────────────────────────────────────────────
+-- Per-patient aggregates for churn scoring, kept current by statement
+-- triggers on appointments and invoices. A write only re-aggregates the
+-- patients it touched (through idx_appointments_patient/idx_invoices_patient),
+-- so the cost follows the size of the change, not of the clinic's history.
+CREATE TABLE IF NOT EXISTS patient_features (
+    patient_id UUID PRIMARY KEY REFERENCES patients(id) ON DELETE CASCADE,
+    total_appointments INTEGER NOT NULL DEFAULT 0,
+    cancelled INTEGER NOT NULL DEFAULT 0,       -- cancelled + no_show
+    first_visit TIMESTAMP,
+    last_visit TIMESTAMP,
+    total_revenue DECIMAL(12,2) NOT NULL DEFAULT 0,   -- paid invoices
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Re-aggregate the given patients (NULL: every patient, for the backfill)
+CREATE OR REPLACE FUNCTION refresh_patient_features(p_ids UUID[])
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Concurrent writers for the same patient would each recompute from a
+    -- snapshot without the other's rows, and the last upsert would win.
+    -- Take the patients' locks in id order; once granted, the INSERT below
+    -- runs with a fresh snapshot that includes the earlier commit.
+    IF p_ids IS NOT NULL THEN
+        PERFORM pg_advisory_xact_lock(hashtext(id::TEXT))
+        FROM (SELECT DISTINCT id FROM unnest(p_ids) AS u(id) ORDER BY id) ids;
+    END IF;
+
+    INSERT INTO patient_features AS f
+        (patient_id, total_appointments, cancelled, first_visit, last_visit, total_revenue, updated_at)
+    SELECT p.id, COALESCE(a.n, 0), COALESCE(a.cancelled, 0), a.first_visit, a.last_visit,
+           COALESCE(i.revenue, 0), NOW()
+    FROM patients p
+    LEFT JOIN LATERAL (
+        SELECT count(*) AS n,
+               count(*) FILTER (WHERE status IN ('cancelled', 'no_show')) AS cancelled,
+               min(appointment_date) AS first_visit,
+               max(appointment_date) AS last_visit
+        FROM appointments WHERE patient_id = p.id
+    ) a ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT sum(amount) AS revenue
+        FROM invoices WHERE patient_id = p.id AND status = 'paid'
+    ) i ON TRUE
+    WHERE p_ids IS NULL OR p.id = ANY(p_ids)
+    ON CONFLICT (patient_id) DO UPDATE SET
+        total_appointments = EXCLUDED.total_appointments,
+        cancelled = EXCLUDED.cancelled,
+        first_visit = EXCLUDED.first_visit,
+        last_visit = EXCLUDED.last_visit,
+        total_revenue = EXCLUDED.total_revenue,
+        updated_at = EXCLUDED.updated_at;
+END;
+$$;
+
+-- Shared by the appointments and invoices triggers; transition tables are
+-- only visible for the operations that define them
+CREATE OR REPLACE FUNCTION patient_features_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_ids UUID[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT patient_id) INTO v_ids FROM new_rows WHERE patient_id IS NOT NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT patient_id) INTO v_ids FROM old_rows WHERE patient_id IS NOT NULL;
+    ELSE
+        SELECT array_agg(DISTINCT patient_id) INTO v_ids FROM (
+            SELECT patient_id FROM new_rows UNION SELECT patient_id FROM old_rows
+        ) changed WHERE patient_id IS NOT NULL;
+    END IF;
+    IF v_ids IS NOT NULL THEN
+        PERFORM refresh_patient_features(v_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_appointments_features_insert
+    AFTER INSERT ON appointments REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION patient_features_trigger();
+CREATE OR REPLACE TRIGGER trg_appointments_features_update
+    AFTER UPDATE ON appointments REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION patient_features_trigger();
+CREATE OR REPLACE TRIGGER trg_appointments_features_delete
+    AFTER DELETE ON appointments REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION patient_features_trigger();
+
+CREATE OR REPLACE TRIGGER trg_invoices_features_insert
+    AFTER INSERT ON invoices REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION patient_features_trigger();
+CREATE OR REPLACE TRIGGER trg_invoices_features_update
+    AFTER UPDATE ON invoices REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION patient_features_trigger();
+CREATE OR REPLACE TRIGGER trg_invoices_features_delete
+    AFTER DELETE ON invoices REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION patient_features_trigger();
+
+-- Backfill once; afterwards the triggers keep it current
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM patient_features) THEN
+        PERFORM refresh_patient_features(NULL);
+    END IF;
+END;
+$$;
+
+-- Scoring input: one narrow row per patient as parallel arrays, with the
+-- derived features computed the way churn_service always has (patients
+-- without appointments count as 365 days away)
+CREATE OR REPLACE FUNCTION churn_features()
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    WITH rows AS (
+        SELECT
+            p.id AS patient_id,
+            trim(COALESCE(p.first_name, '') || ' ' || COALESCE(p.last_name, '')) AS patient_name,
+            f.last_visit::DATE AS last_visit,
+            COALESCE(NOW()::DATE - f.last_visit::DATE, 365) AS days_since_last_visit,
+            COALESCE(f.total_appointments, 0) AS total_appointments,
+            COALESCE(f.cancelled::REAL / NULLIF(f.total_appointments, 0), 0) AS cancelled_ratio,
+            COALESCE(f.total_revenue, 0) AS total_revenue,
+            CASE
+                WHEN f.total_appointments > 1
+                    THEN extract(epoch FROM f.last_visit - f.first_visit) / 86400 / (f.total_appointments - 1)
+                ELSE COALESCE(NOW()::DATE - f.last_visit::DATE, 365)
+            END AS avg_interval
+        FROM patients p
+        LEFT JOIN patient_features f ON f.patient_id = p.id
+    )
+    SELECT json_build_object(
+        'patient_id', COALESCE(json_agg(patient_id), '[]'::JSON),
+        'patient_name', COALESCE(json_agg(patient_name), '[]'::JSON),
+        'last_visit', COALESCE(json_agg(last_visit), '[]'::JSON),
+        'days_since_last_visit', COALESCE(json_agg(days_since_last_visit), '[]'::JSON),
+        'total_appointments', COALESCE(json_agg(total_appointments), '[]'::JSON),
+        'cancelled_ratio', COALESCE(json_agg(cancelled_ratio), '[]'::JSON),
+        'total_revenue', COALESCE(json_agg(total_revenue), '[]'::JSON),
+        'avg_interval', COALESCE(json_agg(round(avg_interval::NUMERIC, 2)), '[]'::JSON)
+    )
+    FROM rows;
+$$;
+
+-- ──────────────────────────────────────────────
+-- Batch writes
+-- ──────────────────────────────────────────────
+-- Used by backend/services/batch_service.py so a whole batch is one
+-- statement in one transaction. Patches are merged into the current rows
+-- inside the UPDATE: columns an item's patch leaves out keep their value,
+-- and ids that no longer exist are simply not returned.
+CREATE OR REPLACE FUNCTION batch_update(p_table TEXT, p_columns TEXT[], p_items JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    assignments TEXT;
+    result JSONB;
+BEGIN
+    IF p_table NOT IN ('appointments', 'invoices', 'tasks', 'services') THEN
+        RAISE EXCEPTION 'batch_update: unsupported table %', p_table;
+    END IF;
+    IF p_table = 'appointments' THEN
+        -- Items may swap slots with each other; check overlaps at commit
+        SET CONSTRAINTS appointments_no_overlap DEFERRED;
+    END IF;
+
+    SELECT string_agg(format(
+        '%1$I = CASE WHEN i.patch ? %2$L THEN (jsonb_populate_record(NULL::%3$I, i.patch)).%1$I ELSE t.%1$I END',
+        c, c, p_table), ', ')
+    INTO assignments
+    FROM unnest(p_columns) c
+    WHERE c <> 'id';
+
+    EXECUTE format(
+        'WITH updated AS (
+            UPDATE %1$I t SET %2$s
+            FROM jsonb_to_recordset($1) AS i(id UUID, patch JSONB)
+            WHERE t.id = i.id
+            RETURNING t.*
+        )
+        SELECT COALESCE(jsonb_agg(to_jsonb(updated)), ''[]''::JSONB) FROM updated',
+        p_table, assignments)
+    INTO result
+    USING p_items;
+    RETURN result;
+END;
+$$;
+
+-- Returns the ids that were actually deleted
+CREATE OR REPLACE FUNCTION batch_delete(p_table TEXT, p_ids UUID[])
+RETURNS UUID[]
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    deleted UUID[];
+BEGIN
+    IF p_table NOT IN ('appointments', 'invoices', 'tasks', 'services') THEN
+        RAISE EXCEPTION 'batch_delete: unsupported table %', p_table;
+    END IF;
+    EXECUTE format(
+        'WITH gone AS (DELETE FROM %I WHERE id = ANY($1) RETURNING id)
+        SELECT COALESCE(array_agg(id), ''{}'') FROM gone',
+        p_table)
+    INTO deleted
+    USING p_ids;
+    RETURN deleted;
+END;
+$$;
@@ -8,6 +8,7 @@ from datetime import datetime, timedelta, date
 from werkzeug.security import generate_password_hash
 from dotenv import load_dotenv
 from supabase import create_client
+from backend.services.lexorank import spread_ranks
 
 load_dotenv()
 
@@ -136,7 +137,7 @@ def seed():
     # ── 3. Services ───────────────────────────
     print('  Creating services...')
     supabase.table('services').insert(SERVICES_DATA).execute()
-    services = supabase.table('services').select('id, price, name').execute().data
+    services = supabase.table('services').select('id, price, name, duration_minutes').execute().data
     service_ids = [s['id'] for s in services]
     print(f'  ✓ {len(services)} services created')
 
@@ -172,9 +173,11 @@ def seed():
     print('  Creating appointments...')
     now = datetime.now()
     statuses = ['completed', 'completed', 'completed', 'completed', 'scheduled', 'cancelled', 'no_show']
+    durations = {s['id']: s.get('duration_minutes') or 30 for s in services}
     appointments_data = []
+    booked = []  # (start, end) — one doctor, so slots must not overlap
 
-    for _ in range(60):
+    while len(appointments_data) < 60:
         days_ago = random.randint(-14, 180)  # -14 = future
         apt_date = now - timedelta(days=days_ago)
         apt_date = apt_date.replace(
@@ -182,6 +185,11 @@ def seed():
             minute=random.choice([0, 15, 30, 45]),
             second=0, microsecond=0
         )
+        service_id = random.choice(service_ids)
+        apt_end = apt_date + timedelta(minutes=durations[service_id])
+        if any(start < apt_end and apt_date < end for start, end in booked):
+            continue
+        booked.append((apt_date, apt_end))
 
         status = random.choice(statuses)
         if days_ago < 0:
@@ -189,7 +197,7 @@ def seed():
 
         appointments_data.append({
             'patient_id': random.choice(patient_ids),
-            'service_id': random.choice(service_ids),
+            'service_id': service_id,
             'doctor_id': doctor_id,
             'appointment_date': apt_date.isoformat(),
             'status': status,
@@ -247,6 +255,12 @@ def seed():
             'position': i,
         })
 
+    # One statement can't see its own rows, so rank the columns here
+    for status in {task['status'] for task in tasks_data}:
+        column = [task for task in tasks_data if task['status'] == status]
+        for task, rank in zip(column, spread_ranks(len(column))):
+            task['rank'] = rank
+
     supabase.table('tasks').insert(tasks_data).execute()
     print(f'  ✓ {len(tasks_data)} tasks created')
 
@@ -0,0 +1,119 @@
+"""
+Reporting queries for the dashboard.
+Aggregation happens in SQL functions (schema.sql); this module validates
+parameters, reshapes results for charts and caches them in the 'payments'
+namespace, which every invoice write invalidates. Closed periods go in
+'revenue_closed' instead, which only writes dated before today invalidate.
+"""
+from datetime import date, timedelta
+from backend import cache
+from backend.extensions import get_supabase
+from backend.services import event_service
+
+CLOSED_NAMESPACE = 'revenue_closed'
+
+GRANULARITIES = ('day', 'week', 'month', 'quarter')
+GROUP_BYS = ('service', 'doctor', 'patient')
+# Longest range allowed per granularity, in days
+MAX_RANGE_DAYS = {'day': 366, 'week': 3 * 366, 'month': 10 * 366, 'quarter': 20 * 366}
+
+
+def period_start(day, granularity):
+    """First day of the bucket containing `day` (weeks start on Sunday, as in SQL)."""
+    if granularity == 'week':
+        return day - timedelta(days=(day.weekday() + 1) % 7)
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day
+
+
+def period_end(day, granularity):
+    """Last day of the bucket containing `day`."""
+    start = period_start(day, granularity)
+    if granularity == 'week':
+        return start + timedelta(days=6)
+    if granularity in ('month', 'quarter'):
+        months = 3 if granularity == 'quarter' else 1
+        for _ in range(months):
+            start = (start + timedelta(days=32)).replace(day=1)
+        return start - timedelta(days=1)
+    return start
+
+
+def get_revenue(date_from, date_to, granularity='month', group_by=None):
+    """Paid revenue per calendar bucket, optionally split by a dimension.
+
+    The range is widened to whole buckets, so every bucket covers its full
+    period and ranges inside the same buckets share one cache entry. Ranges
+    whose last bucket ended before today are closed: they are cached without
+    expiry and only dropped when an invoice dated before today changes (or
+    evicted as least recently used).
+    """
+    date_from = period_start(date_from, granularity)
+    date_to = period_end(date_to, granularity)
+    closed = date_to < date.today()
+    key = ('revenue', date_from.isoformat(), date_to.isoformat(), granularity, group_by)
+    return cache.get_or_set(
+        CLOSED_NAMESPACE if closed else 'payments', key,
+        lambda: _load_revenue(date_from, date_to, granularity, group_by),
+        ttl=0 if closed else None,
+    )
+
+
+def _on_invoice_event(event):
+    # The trigger bumps the namespace for other workers; this one drops its
+    # copy right away. Deletes may not carry the row, so they always drop.
+    issued = (event.get('payload') or {}).get('issued_date')
+    if event['action'] == 'delete' or not issued or issued[:10] < date.today().isoformat():
+        cache.discard(CLOSED_NAMESPACE)
+
+
+event_service.on('invoices', _on_invoice_event)
+
+
+def _load_revenue(date_from, date_to, granularity, group_by):
+    supabase = get_supabase()
+    result = supabase.rpc('revenue_analytics', {
+        'p_from': date_from.isoformat(),
+        'p_to': date_to.isoformat(),
+        'p_granularity': granularity,
+        'p_group_by': group_by,
+    }).execute()
+    data = result.data or {}
+    buckets = data.get('buckets') or []
+    position = {bucket: i for i, bucket in enumerate(buckets)}
+
+    totals = [0.0] * len(buckets)
+    series = {}
+    for row in data.get('rows') or []:
+        i = position[row['bucket']]
+        amount = float(row['amount'])
+        totals[i] += amount
+        if group_by:
+            entry = series.setdefault(row['key'], {
+                'key': row['key'],
+                'label': row['label'] or '',
+                'values': [0.0] * len(buckets),
+                'total': 0.0,
+            })
+            entry['values'][i] += amount
+            entry['total'] += amount
+
+    return {
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'granularity': granularity,
+        'group_by': group_by,
+        'buckets': buckets,
+        'totals': totals,
+        'total': sum(totals),
+        'series': sorted(series.values(), key=lambda s: s['total'], reverse=True),
+    }
+
+
+def get_daily_totals(date_from, date_to):
+    """Paid revenue per day of [date_from, date_to] (uncached, for model fits)."""
+    report = _load_revenue(date_from, date_to, 'day', None)
+    return report['buckets'], report['totals']
@@ -1,8 +1,44 @@
+from postgrest.exceptions import APIError
 from backend.extensions import get_supabase
+from backend.services import event_service
+
+# SQLSTATE raised by the appointments_no_overlap exclusion constraint
+EXCLUSION_VIOLATION = '23P01'
+CONFLICT_ERROR = 'הרופא כבר משובץ לתור אחר בזמן זה'
+
+
+class AppointmentConflict(Exception):
+    """A write would double-book the doctor; `conflicts` lists the clashing rows."""
+
+    def __init__(self, conflicts):
+        super().__init__('appointment overlaps an existing booking')
+        self.conflicts = conflicts
+
+
+def is_overlap_error(error):
+    return isinstance(error, APIError) and error.code == EXCLUSION_VIOLATION
+
+
+def find_conflicts(row, exclude_id=None):
+    """Busy appointments of row's doctor overlapping row's time slot."""
+    if not row.get('doctor_id') or not row.get('appointment_date'):
+        return []
+    supabase = get_supabase()
+    result = supabase.rpc('appointment_conflicts', {
+        'p_doctor_id': row['doctor_id'],
+        'p_start': row['appointment_date'],
+        'p_service_id': row.get('service_id'),
+        'p_exclude_id': exclude_id,
+    }).execute()
+    return result.data or []
 
 
 def get_appointments(search='', status_filter='', page=1, limit=10):
     supabase = get_supabase()
+    search = search.strip()
+    if search:
+        return _search_appointments(search, status_filter, page, limit)
+
     query = supabase.table('appointments').select(
         '*, patients(first_name, last_name), services(name)',
         count='exact'
@@ -24,6 +60,23 @@ def get_appointments(search='', status_filter='', page=1, limit=10):
     }
 
 
+def _search_appointments(search, status_filter, page, limit):
+    supabase = get_supabase()
+    result = supabase.rpc('search_appointments', {
+        'p_query': search,
+        'p_status': status_filter or '',
+        'p_limit': limit,
+        'p_offset': (page - 1) * limit,
+    }).execute()
+    payload = result.data or {}
+    return {
+        'data': payload.get('data') or [],
+        'total': payload.get('total') or 0,
+        'page': page,
+        'limit': limit,
+    }
+
+
 def get_appointment(appointment_id: str):
     supabase = get_supabase()
     result = supabase.table('appointments').select(
@@ -34,16 +87,31 @@ def get_appointment(appointment_id: str):
 
 def create_appointment(data: dict):
     supabase = get_supabase()
-    result = supabase.table('appointments').insert(data).execute()
+    try:
+        result = supabase.table('appointments').insert(data).execute()
+    except APIError as e:
+        if is_overlap_error(e):
+            raise AppointmentConflict(find_conflicts(data)) from e
+        raise
+    event_service.publish('appointments', 'insert', result.data)
     return result.data[0] if result.data else None
 
 
 def update_appointment(appointment_id: str, data: dict):
     supabase = get_supabase()
-    result = supabase.table('appointments').update(data).eq('id', appointment_id).execute()
+    try:
+        result = supabase.table('appointments').update(data).eq('id', appointment_id).execute()
+    except APIError as e:
+        if not is_overlap_error(e):
+            raise
+        current = supabase.table('appointments').select('doctor_id, service_id, appointment_date') \
+            .eq('id', appointment_id).execute().data or [{}]
+        raise AppointmentConflict(find_conflicts({**current[0], **data}, exclude_id=appointment_id)) from e
+    event_service.publish('appointments', 'update', result.data)
     return result.data[0] if result.data else None
 
 
 def delete_appointment(appointment_id: str):
     supabase = get_supabase()
-    supabase.table('appointments').delete().eq('id', appointment_id).execute()
+    result = supabase.table('appointments').delete().eq('id', appointment_id).execute()
+    event_service.publish('appointments', 'delete', result.data)
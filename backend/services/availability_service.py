@@ -0,0 +1,250 @@
+"""
+Doctor availability and free-slot search.
+Busy intervals (appointment start + service duration) are kept in memory
+per (doctor, day) as sorted, merged lists, so checking whether a slot is
+free is a bisect. The index covers today..AVAILABILITY_HORIZON_DAYS, is
+built once per process and then updated incrementally from appointment
+change events (local writes immediately, other workers' via the poller).
+Days after the horizon are read from the database per request.
+"""
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from flask import current_app
+from backend.extensions import get_supabase
+from backend.services import catalog_service, event_service, task_service
+
+BUSY_STATUSES = ('scheduled', 'completed')
+
+
+def _parse_dt(value):
+    dt = datetime.fromisoformat(value) if isinstance(value, str) else value
+    return dt.replace(tzinfo=None)
+
+
+def _align_up(dt, step_minutes):
+    minutes = dt.hour * 60 + dt.minute
+    aligned = -(-minutes // step_minutes) * step_minutes
+    if aligned == minutes and not dt.second and not dt.microsecond:
+        return dt
+    base = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return base + timedelta(minutes=aligned)
+
+
+class ScheduleIndex:
+    """Per-(doctor, day) merged busy intervals with incremental updates."""
+
+    def __init__(self):
+        self._appointments = {}   # id -> (doctor_id, start, end)
+        self._by_day = {}         # (doctor_id, date) -> set of appointment ids
+        self._merged = {}         # (doctor_id, date) -> (starts, ends)
+
+    def _rebuild_day(self, day_key):
+        intervals = sorted(self._appointments[i][1:] for i in self._by_day.get(day_key, ()))
+        starts, ends = [], []
+        for start, end in intervals:
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        if starts:
+            self._merged[day_key] = (starts, ends)
+        else:
+            self._merged.pop(day_key, None)
+            self._by_day.pop(day_key, None)
+
+    def remove(self, appointment_id):
+        old = self._appointments.pop(appointment_id, None)
+        if old:
+            day_key = (old[0], old[1].date())
+            self._by_day[day_key].discard(appointment_id)
+            self._rebuild_day(day_key)
+
+    def upsert(self, appointment_id, doctor_id, start, end):
+        self.remove(appointment_id)
+        self._appointments[appointment_id] = (doctor_id, start, end)
+        day_key = (doctor_id, start.date())
+        self._by_day.setdefault(day_key, set()).add(appointment_id)
+        self._rebuild_day(day_key)
+
+    def is_free(self, doctor_id, start, end):
+        starts, ends = self._merged.get((doctor_id, start.date()), ((), ()))
+        i = bisect_right(starts, start)
+        if i and ends[i - 1] > start:
+            return False
+        return i >= len(starts) or starts[i] >= end
+
+    def free_slots(self, doctor_id, day, windows, duration, step, not_before=None):
+        """Free [start, end) slots of `duration` minutes on `day` within `windows`."""
+        starts, ends = self._merged.get((doctor_id, day), ((), ()))
+        length = timedelta(minutes=duration)
+        slots = []
+        for open_at, close_at in windows:
+            t = datetime.combine(day, open_at)
+            close = datetime.combine(day, close_at)
+            if not_before and t < not_before:
+                t = _align_up(not_before, step)
+            while t + length <= close:
+                i = bisect_right(starts, t)
+                if i and ends[i - 1] > t:
+                    t = _align_up(ends[i - 1], step)
+                elif i < len(starts) and starts[i] < t + length:
+                    t = _align_up(ends[i], step)
+                else:
+                    slots.append((t, t + length))
+                    t += timedelta(minutes=step)
+        return slots
+
+
+_lock = threading.Lock()
+_index = None
+_window = None
+_built_at = 0.0
+_listening = False
+_builds = 0       # rebuilds in progress
+_pending = []     # events seen while a rebuild runs, replayed onto its result
+
+
+def _working_windows(day):
+    hours = current_app.config['WORKING_HOURS'].get(day.weekday(), [])
+    return [
+        (datetime.strptime(start, '%H:%M').time(), datetime.strptime(end, '%H:%M').time())
+        for start, end in hours
+    ]
+
+
+def _apply_row(index, row, durations):
+    if row.get('status') not in BUSY_STATUSES or not row.get('doctor_id') or not row.get('appointment_date'):
+        index.remove(row['id'])
+        return
+    start = _parse_dt(row['appointment_date'])
+    end = start + timedelta(minutes=durations.get(row.get('service_id'), 30))
+    index.upsert(row['id'], row['doctor_id'], start, end)
+
+
+def _apply_event(index, event, durations):
+    row = event.get('payload') or {}
+    if event['action'] == 'delete' or 'status' not in row:
+        index.remove(event.get('row_id') or row.get('id'))
+    else:
+        _apply_row(index, row, durations)
+
+
+def _on_appointment_event(event):
+    durations = catalog_service.get_service_durations()
+    with _lock:
+        if _builds:
+            _pending.append(event)
+        if _index is not None:
+            _apply_event(_index, event, durations)
+
+
+def _build(window_start, window_end):
+    supabase = get_supabase()
+    durations = catalog_service.get_service_durations()
+    index = ScheduleIndex()
+    offset, page_size = 0, 1000
+    while True:
+        rows = supabase.table('appointments') \
+            .select('id, doctor_id, service_id, appointment_date, status') \
+            .gte('appointment_date', window_start.isoformat()) \
+            .lt('appointment_date', window_end.isoformat()) \
+            .in_('status', list(BUSY_STATUSES)) \
+            .order('appointment_date') \
+            .range(offset, offset + page_size - 1) \
+            .execute().data or []
+        for row in rows:
+            _apply_row(index, row, durations)
+        if len(rows) < page_size:
+            return index
+        offset += page_size
+
+
+def get_index():
+    """Return the process-wide index, building it when missing or expired.
+
+    The database is read outside the lock so lookups keep working during a
+    rebuild; events that arrive meanwhile are replayed onto the new index
+    before it replaces the old one, since the read may predate them.
+    """
+    global _index, _window, _built_at, _listening, _builds
+    config = current_app.config
+    today = date.today()
+    window = (today - timedelta(days=1), today + timedelta(days=config['AVAILABILITY_HORIZON_DAYS'] + 1))
+    with _lock:
+        fresh = time.monotonic() - _built_at < config['AVAILABILITY_REBUILD_SECONDS']
+        if _index is not None and _window == window and fresh:
+            return _index
+        if not _listening:
+            event_service.on('appointments', _on_appointment_event)
+            _listening = True
+        _builds += 1
+        mark = len(_pending)
+
+    try:
+        index = _build(*window)
+        durations = catalog_service.get_service_durations()
+        with _lock:
+            for event in _pending[mark:]:
+                _apply_event(index, event, durations)
+            _index, _window, _built_at = index, window, time.monotonic()
+    finally:
+        with _lock:
+            _builds -= 1
+            if not _builds:
+                _pending.clear()
+    event_service.ensure_poller(current_app._get_current_object())
+    return index
+
+
+def get_doctor_ids():
+    return [u['id'] for u in task_service.get_users() if u.get('role') == 'doctor']
+
+
+def find_free_slots(date_from, date_to, duration, doctor_id=None):
+    """Free slots per doctor for each day in [date_from, date_to]."""
+    index = get_index()
+    with _lock:
+        covered_until = _window[1]
+    # The shared index stops after the horizon; read later days directly
+    beyond = _build(max(date_from, covered_until), date_to + timedelta(days=1)) \
+        if date_to >= covered_until else None
+    step = current_app.config['AVAILABILITY_SLOT_MINUTES']
+    now = datetime.now()
+    doctors = [doctor_id] if doctor_id else get_doctor_ids()
+
+    result = {d: [] for d in doctors}
+    day = date_from
+    while day <= date_to:
+        windows = _working_windows(day)
+        day_index = beyond if day >= covered_until else index
+        if windows:
+            for d in doctors:
+                for start, end in day_index.free_slots(d, day, windows, duration, step, not_before=now):
+                    result[d].append({'start': start.isoformat(), 'end': end.isoformat()})
+        day += timedelta(days=1)
+    return result
+
+
+def next_free_slot(duration, doctor_id=None, after=None):
+    """Earliest free slot across the given doctor (or all doctors)."""
+    index = get_index()
+    step = current_app.config['AVAILABILITY_SLOT_MINUTES']
+    after = max(after or datetime.now(), datetime.now())
+    doctors = [doctor_id] if doctor_id else get_doctor_ids()
+
+    day = after.date()
+    last_day = date.today() + timedelta(days=current_app.config['AVAILABILITY_HORIZON_DAYS'])
+    while day <= last_day:
+        windows = _working_windows(day)
+        best = None
+        for d in doctors:
+            slots = index.free_slots(d, day, windows, duration, step, not_before=after) if windows else []
+            if slots and (best is None or slots[0][0] < best['start']):
+                best = {'doctor_id': d, 'start': slots[0][0], 'end': slots[0][1]}
+        if best:
+            return {**best, 'start': best['start'].isoformat(), 'end': best['end'].isoformat()}
+        day += timedelta(days=1)
+    return None
@@ -0,0 +1,326 @@
+"""
+Batch create/update/delete for the list resources.
+A batch is validated as a whole (columns, choices, id format, referenced
+rows and, for updates/deletes, target rows) before anything is written,
+and each write is then a single statement in a single transaction: one
+bulk INSERT, or the batch_update / batch_delete RPCs. A batch therefore
+commits completely or not at all; when the database rejects it, every
+item is reported as failed and overlapping bookings list their conflicts.
+Rows removed by someone else between validation and the write are
+reported as not found.
+"""
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from postgrest.exceptions import APIError
+from backend import cache
+from backend.extensions import get_supabase
+from backend.services import appointment_service, catalog_service, event_service
+
+# Per-resource write rules used to validate a whole batch before anything is
+# written. Columns outside `columns` are rejected so a typo cannot silently
+# turn into a PostgREST error that fails the whole batch; `references` are
+# foreign keys checked for existence up front.
+RESOURCES = {
+    'appointments': {
+        'columns': {'patient_id', 'service_id', 'doctor_id', 'appointment_date', 'status', 'notes'},
+        'required': {'patient_id', 'service_id', 'appointment_date'},
+        'choices': {'status': ('scheduled', 'completed', 'cancelled', 'no_show')},
+        'references': {'patient_id': 'patients', 'service_id': 'services', 'doctor_id': 'users'},
+    },
+    'invoices': {
+        # invoice_number is allocated by the database (one block per batch)
+        'columns': {'patient_id', 'appointment_id', 'amount', 'status', 'issued_date', 'paid_date'},
+        'required': {'patient_id', 'amount'},
+        'choices': {'status': ('paid', 'pending', 'overdue', 'cancelled')},
+        'references': {'patient_id': 'patients', 'appointment_id': 'appointments'},
+    },
+    'tasks': {
+        'columns': {'title', 'description', 'status', 'priority', 'assigned_to', 'due_date', 'position'},
+        'required': {'title'},
+        'choices': {
+            'status': ('open', 'in_progress', 'done'),
+            'priority': ('urgent', 'medium', 'normal'),
+        },
+        'references': {'assigned_to': 'users'},
+    },
+    'services': {
+        'columns': {'name', 'description', 'price', 'duration_minutes', 'is_active'},
+        'required': {'name', 'price'},
+        'choices': {},
+        'references': {},
+    },
+}
+
+
+NOT_FOUND_ERROR = 'לא נמצא'
+ABORTED_ERROR = 'הפעולה בוטלה כי פריט אחר בבקשה נכשל'
+LOOKUP_CHUNK = 200   # ids per existence lookup, to keep URLs short
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+def _validate_row(resource, row, partial=False):
+    rules = RESOURCES[resource]
+    if not isinstance(row, dict) or not row:
+        return 'פריט ריק או לא תקין'
+    unknown = set(row) - rules['columns']
+    if unknown:
+        return f"שדות לא מוכרים: {', '.join(sorted(unknown))}"
+    if not partial:
+        missing = [c for c in sorted(rules['required']) if row.get(c) in (None, '')]
+        if missing:
+            return f"שדות חובה חסרים: {', '.join(missing)}"
+    for column, allowed in rules['choices'].items():
+        if column in row and row[column] not in allowed:
+            return f'ערך לא חוקי בשדה {column}'
+    for column in rules['references']:
+        if row.get(column) not in (None, '') and not _is_uuid(row[column]):
+            return f'מזהה לא תקין בשדה {column}'
+    return None
+
+
+def _existing_ids(table, ids):
+    supabase = get_supabase()
+    found = set()
+    for chunk in _chunks(sorted(set(ids)), LOOKUP_CHUNK):
+        rows = supabase.table(table).select('id').in_('id', chunk).execute().data or []
+        found.update(row['id'] for row in rows)
+    return found
+
+
+def _check_existence(resource, items, mode, errors):
+    """Report targets and referenced rows that do not exist, per item."""
+    failed = {e['index'] for e in errors}
+    valid = [(i, item) for i, item in enumerate(items) if i not in failed]
+
+    if mode in ('update', 'delete'):
+        targets = [item['id'] if mode == 'update' else item for _, item in valid]
+        existing = _existing_ids(resource, targets)
+        for i, item in valid:
+            if (item['id'] if mode == 'update' else item) not in existing:
+                errors.append({'index': i, 'error': NOT_FOUND_ERROR})
+                failed.add(i)
+    if mode == 'delete':
+        return
+
+    for column, table in RESOURCES[resource]['references'].items():
+        rows = [(i, item if mode == 'create' else item['patch']) for i, item in valid if i not in failed]
+        values = [row[column] for _, row in rows if row.get(column) not in (None, '')]
+        if not values:
+            continue
+        existing = _existing_ids(table, values)
+        for i, row in rows:
+            if row.get(column) not in (None, '') and row[column] not in existing:
+                errors.append({'index': i, 'error': f'{column}: הרשומה המקושרת לא נמצאה'})
+                failed.add(i)
+
+
+def validate_batch(resource, items, mode):
+    """Validate every item of a batch; returns a list of {index, error} dicts."""
+    max_items = current_app.config.get('BATCH_MAX_ITEMS', 1000)
+    if not isinstance(items, list) or not items:
+        return [{'index': None, 'error': 'יש לשלוח רשימת פריטים'}]
+    if len(items) > max_items:
+        return [{'index': None, 'error': f'ניתן לשלוח עד {max_items} פריטים בבקשה'}]
+
+    errors = []
+    seen_ids = set()
+    for i, item in enumerate(items):
+        if mode == 'create':
+            error = _validate_row(resource, item)
+        elif mode == 'update':
+            if not isinstance(item, dict) or not item.get('id'):
+                error = 'חסר מזהה'
+            elif not _is_uuid(item['id']):
+                error = 'מזהה לא תקין'
+            elif item['id'] in seen_ids:
+                error = 'מזהה כפול'
+            else:
+                seen_ids.add(item['id'])
+                error = _validate_row(resource, item.get('patch'), partial=True)
+        else:
+            if not isinstance(item, str) or not _is_uuid(item):
+                error = 'מזהה לא תקין'
+            elif item in seen_ids:
+                error = 'מזהה כפול'
+            else:
+                seen_ids.add(item)
+                error = None
+        if error:
+            errors.append({'index': i, 'error': error})
+
+    _check_existence(resource, items, mode, errors)
+    return sorted(errors, key=lambda e: e['index'])
+
+
+def _failed_batch(resource, items, error, mode):
+    """Results for a batch the database rejected; nothing was written.
+
+    For double-bookings, items that clash with existing appointments or with
+    each other get their conflicts (other items are listed by `index`); the
+    rest only failed because the batch did.
+    """
+    ids = [item['id'] if mode == 'update' else None for item in items]
+    if not appointment_service.is_overlap_error(error) or resource != 'appointments':
+        # A services batch can clash too: a longer duration moves ends_at
+        message = appointment_service.CONFLICT_ERROR if appointment_service.is_overlap_error(error) \
+            else error.message or 'שגיאת מסד נתונים'
+        return [_with_id({'index': i, 'success': False, 'error': message}, ids[i]) for i in range(len(items))]
+
+    rows = items
+    if mode == 'update':
+        supabase = get_supabase()
+        current = {
+            row['id']: row
+            for chunk in _chunks(ids, LOOKUP_CHUNK)
+            for row in supabase.table(resource).select('id, doctor_id, service_id, appointment_date, status')
+            .in_('id', chunk).execute().data or []
+        }
+        rows = [{**current.get(item['id'], {}), **item['patch']} for item in items]
+
+    conflicts = _batch_overlaps(rows)
+    for index, existing in _existing_overlaps(rows, [i for i in ids if i]).items():
+        conflicts.setdefault(index, []).extend(existing)
+
+    results = []
+    for i in range(len(rows)):
+        if conflicts.get(i):
+            result = {'index': i, 'success': False, 'error': appointment_service.CONFLICT_ERROR,
+                      'conflicts': conflicts[i]}
+        else:
+            result = {'index': i, 'success': False, 'error': ABORTED_ERROR}
+        results.append(_with_id(result, ids[i]))
+    return results
+
+
+def _busy_slots(rows):
+    """(index, doctor_id, start, end) for the rows that would hold a doctor's time."""
+    durations = catalog_service.get_service_durations()
+    slots = []
+    for i, row in enumerate(rows):
+        if not row.get('doctor_id') or row.get('status', 'scheduled') not in ('scheduled', 'completed'):
+            continue
+        try:
+            start = datetime.fromisoformat(str(row['appointment_date'])).replace(tzinfo=None)
+        except (KeyError, ValueError):
+            continue
+        end = start + timedelta(minutes=durations.get(row.get('service_id'), 30))
+        slots.append((i, row['doctor_id'], start, end))
+    return slots
+
+
+def _batch_overlaps(rows):
+    """Pairs of batch items that double-book the same doctor, per item index."""
+    conflicts = {}
+    by_doctor = {}
+    for slot in _busy_slots(rows):
+        by_doctor.setdefault(slot[1], []).append(slot)
+    for slots in by_doctor.values():
+        slots.sort(key=lambda slot: slot[2])
+        for n, (i, _, start, end) in enumerate(slots):
+            for j, _, other_start, other_end in slots[n + 1:]:
+                if other_start >= end:
+                    break
+                conflicts.setdefault(i, []).append(
+                    {'index': j, 'appointment_date': other_start.isoformat(), 'ends_at': other_end.isoformat()})
+                conflicts.setdefault(j, []).append(
+                    {'index': i, 'appointment_date': start.isoformat(), 'ends_at': end.isoformat()})
+    return conflicts
+
+
+def _existing_overlaps(rows, batch_ids):
+    """Stored appointments each item would overlap, in one batch_conflicts call.
+
+    Rows being updated in this batch are left out: their new times are
+    checked against each other by _batch_overlaps.
+    """
+    slots = [{'item': i, 'doctor_id': doctor_id, 'start': start.isoformat(),
+              'service_id': rows[i].get('service_id')}
+             for i, doctor_id, start, _ in _busy_slots(rows)]
+    if not slots:
+        return {}
+    result = get_supabase().rpc('batch_conflicts', {'p_items': slots, 'p_exclude_ids': batch_ids}).execute()
+    return {entry['item']: entry['conflicts'] for entry in result.data or []}
+
+
+def _with_id(result, row_id):
+    return {**result, 'id': row_id} if row_id else result
+
+
+def _after_write(resource, action, rows):
+    if resource in event_service.TOPICS:
+        event_service.publish(resource, action, rows)
+    if resource == 'services':
+        cache.invalidate('services')
+
+
+def create_many(resource, items):
+    """Insert the whole batch with one INSERT (one transaction)."""
+    supabase = get_supabase()
+    if resource == 'tasks':
+        from backend.services.task_service import assign_ranks
+        items = assign_ranks([dict(item) for item in items])
+    try:
+        # Columns an item leaves out get their database defaults
+        rows = supabase.table(resource).insert(items, default_to_null=False).execute().data or []
+    except APIError as e:
+        return _failed_batch(resource, items, e, 'create')
+
+    _after_write(resource, 'insert', rows)
+    return [{'index': i, 'success': True, 'data': row} for i, row in enumerate(rows)]
+
+
+def update_many(resource, items):
+    """Apply per-item patches with one server-side UPDATE (batch_update RPC).
+
+    The patches are merged into the rows inside the UPDATE, so concurrent
+    edits to other columns are kept and deleted rows are not recreated.
+    """
+    supabase = get_supabase()
+    columns = sorted({column for item in items for column in item['patch']})
+    try:
+        rows = supabase.rpc('batch_update', {
+            'p_table': resource,
+            'p_columns': columns,
+            'p_items': [{'id': item['id'], 'patch': item['patch']} for item in items],
+        }).execute().data or []
+    except APIError as e:
+        return _failed_batch(resource, items, e, 'update')
+
+    _after_write(resource, 'update', rows)
+    updated = {row['id']: row for row in rows}
+    return [
+        {'index': i, 'id': item['id'], 'success': True, 'data': updated[item['id']]}
+        if item['id'] in updated else
+        {'index': i, 'id': item['id'], 'success': False, 'error': NOT_FOUND_ERROR}
+        for i, item in enumerate(items)
+    ]
+
+
+def delete_many(resource, ids):
+    """Delete the batch with one DELETE (batch_delete RPC)."""
+    supabase = get_supabase()
+    try:
+        deleted = set(supabase.rpc('batch_delete', {'p_table': resource, 'p_ids': ids}).execute().data or [])
+    except APIError as e:
+        message = e.message or 'שגיאת מסד נתונים'
+        return [{'index': i, 'id': row_id, 'success': False, 'error': message} for i, row_id in enumerate(ids)]
+
+    _after_write(resource, 'delete', [{'id': row_id} for row_id in deleted])
+    return [
+        {'index': i, 'id': row_id, 'success': True} if row_id in deleted else
+        {'index': i, 'id': row_id, 'success': False, 'error': NOT_FOUND_ERROR}
+        for i, row_id in enumerate(ids)
+    ]
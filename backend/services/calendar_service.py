@@ -0,0 +1,84 @@
+"""
+Week calendar reads.
+Appointments are read one week (Sunday..Saturday) at a time through the
+(doctor_id, appointment_date) index and cached per week and doctor in the
+'calendar' namespace. The appointments table bumps that namespace on every
+write (see schema.sql); this process also drops it as soon as it sees an
+appointment change event, so a worker never serves its own stale write.
+"""
+from datetime import timedelta
+from backend import cache
+from backend.extensions import get_supabase
+from backend.services import event_service
+
+COLUMNS = ('id', 'start', 'end', 'doctor_id', 'patient_id', 'patient_name',
+           'service_id', 'service_name', 'status', 'series_id')
+PAGE_SIZE = 1000
+
+event_service.on('appointments', lambda event: cache.discard('calendar'))
+
+
+def week_start(day):
+    """The Sunday on or before `day`."""
+    return day - timedelta(days=(day.weekday() + 1) % 7)
+
+
+def _load_week(start, doctor_id):
+    supabase = get_supabase()
+    end = start + timedelta(days=7)
+    rows = []
+    while True:
+        query = supabase.table('appointments').select(
+            'id, doctor_id, patient_id, service_id, appointment_date, ends_at, status, series_id, '
+            'patients(first_name, last_name), services(name)'
+        )
+        if doctor_id:
+            query = query.eq('doctor_id', doctor_id)
+        page = query.gte('appointment_date', start.isoformat()) \
+            .lt('appointment_date', end.isoformat()) \
+            .order('appointment_date') \
+            .range(len(rows), len(rows) + PAGE_SIZE - 1) \
+            .execute().data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+
+    # Tuples in COLUMNS order: compact and safe to share between requests
+    week = []
+    for a in rows:
+        p = a.get('patients') or {}
+        s = a.get('services') or {}
+        week.append((
+            a['id'],
+            a['appointment_date'],
+            a.get('ends_at'),
+            a.get('doctor_id'),
+            a.get('patient_id'),
+            f"{p.get('first_name', '')} {p.get('last_name', '')}".strip(),
+            a.get('service_id'),
+            s.get('name', ''),
+            a.get('status'),
+            a.get('series_id'),
+        ))
+    return tuple(week)
+
+
+def get_week(start, doctor_id=None):
+    return cache.get_or_set(
+        'calendar', (start.isoformat(), doctor_id), lambda: _load_week(start, doctor_id)
+    )
+
+
+def get_calendar(date_from, date_to, doctor_id=None):
+    """Appointments between two dates (inclusive) as {column: [values]}."""
+    rows = []
+    start = week_start(date_from)
+    lower = date_from.isoformat()
+    upper = (date_to + timedelta(days=1)).isoformat()
+    while start <= date_to:
+        rows.extend(r for r in get_week(start, doctor_id) if lower <= r[1] < upper)
+        start += timedelta(days=7)
+    return {
+        'count': len(rows),
+        'columns': {name: [r[i] for r in rows] for i, name in enumerate(COLUMNS)},
+    }
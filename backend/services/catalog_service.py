@@ -1,4 +1,7 @@
+from postgrest.exceptions import APIError
+from backend import cache
 from backend.extensions import get_supabase
+from backend.services import appointment_service
 
 
 def get_services(search='', page=1, limit=10):
@@ -21,12 +24,27 @@ def get_services(search='', page=1, limit=10):
     }
 
 
-def get_all_services():
+def _load_active_services():
     supabase = get_supabase()
     result = supabase.table('services').select('*').eq('is_active', True).order('name').execute()
     return result.data or []
 
 
+def get_all_services():
+    return cache.get_or_set('services', 'active', _load_active_services)
+
+
+def _load_service_durations():
+    supabase = get_supabase()
+    result = supabase.table('services').select('id, duration_minutes').execute()
+    return {s['id']: s['duration_minutes'] or 30 for s in (result.data or [])}
+
+
+def get_service_durations():
+    """Map of service id -> duration in minutes, including inactive services."""
+    return cache.get_or_set('services', 'durations', _load_service_durations)
+
+
 def get_service(service_id: str):
     supabase = get_supabase()
     result = supabase.table('services').select('*').eq('id', service_id).execute()
@@ -36,15 +54,25 @@ def get_service(service_id: str):
 def create_service(data: dict):
     supabase = get_supabase()
     result = supabase.table('services').insert(data).execute()
+    cache.invalidate('services')
     return result.data[0] if result.data else None
 
 
 def update_service(service_id: str, data: dict):
+    """Update a service; raises AppointmentConflict if a longer duration
+    would double-book upcoming appointments (see services_sync_ends_at)."""
     supabase = get_supabase()
-    result = supabase.table('services').update(data).eq('id', service_id).execute()
+    try:
+        result = supabase.table('services').update(data).eq('id', service_id).execute()
+    except APIError as e:
+        if appointment_service.is_overlap_error(e):
+            raise appointment_service.AppointmentConflict([]) from e
+        raise
+    cache.invalidate('services')
     return result.data[0] if result.data else None
 
 
 def delete_service(service_id: str):
     supabase = get_supabase()
     supabase.table('services').delete().eq('id', service_id).execute()
+    cache.invalidate('services')
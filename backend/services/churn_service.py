@@ -1,145 +1,172 @@
+import json
+import logging
+import os
+import threading
 import numpy as np
-from datetime import datetime
+from flask import current_app
 from backend.extensions import get_supabase
 
 try:
+    import joblib
     from sklearn.linear_model import LogisticRegression
     SKLEARN_AVAILABLE = True
 except ImportError:
     SKLEARN_AVAILABLE = False
 
+logger = logging.getLogger(__name__)
+
+# Model input columns, in order (shared with churn_training)
+FEATURES = ('days_since_last_visit', 'total_appointments', 'cancelled_ratio', 'total_revenue', 'avg_interval')
+MODEL_FILE = 'churn_model.joblib'
+METADATA_FILE = 'churn_model.json'
+RISK_LEVELS = ('low', 'medium', 'high')
+MAX_PAGE_SIZE = 100
+
+_model_lock = threading.Lock()
+_model = (None, None)   # (file mtime, fitted estimator)
+
+
+def model_paths():
+    model_dir = current_app.config['MODEL_DIR']
+    return os.path.join(model_dir, MODEL_FILE), os.path.join(model_dir, METADATA_FILE)
+
+
+def load_model():
+    """The model promoted by `flask train-churn`, or None if there is none.
+
+    Reloaded when the file on disk changes, so a promotion takes effect in
+    every worker without a restart.
+    """
+    global _model
+    if not SKLEARN_AVAILABLE:
+        return None
+    path, _ = model_paths()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _model_lock:
+        if _model[0] != mtime:
+            try:
+                _model = (mtime, joblib.load(path))
+            except Exception as e:
+                logger.warning('Could not load churn model %s: %s', path, e)
+                return None
+        return _model[1]
+
+
+def load_metadata():
+    _, path = model_paths()
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
 
 def _get_patient_features():
+    """Parallel per-patient columns from the trigger-maintained patient_features table."""
     supabase = get_supabase()
+    columns = supabase.rpc('churn_features', {}).execute().data or {}
+    return {name: columns.get(name) or [] for name in ('patient_id', 'patient_name', 'last_visit') + FEATURES}
 
-    patients = supabase.table('patients').select('id, first_name, last_name').execute().data or []
-
-    appointments = supabase.table('appointments').select(
-        'patient_id, appointment_date, status'
-    ).execute().data or []
-
-    invoices = supabase.table('invoices').select(
-        'patient_id, amount, status'
-    ).eq('status', 'paid').execute().data or []
-
-    now = datetime.now()
-    features = []
-
-    for patient in patients:
-        pid = patient['id']
-
-        patient_appts = [a for a in appointments if a['patient_id'] == pid]
-        patient_invs = [i for i in invoices if i['patient_id'] == pid]
-
-        total_appointments = len(patient_appts)
-        cancelled = sum(1 for a in patient_appts if a['status'] in ('cancelled', 'no_show'))
-        cancelled_ratio = cancelled / max(total_appointments, 1)
-        total_revenue = sum(float(i['amount']) for i in patient_invs)
-
-        if patient_appts:
-            dates = sorted(
-                [datetime.fromisoformat(a['appointment_date'].replace('Z', '+00:00').replace('+00:00', ''))
-                 for a in patient_appts if a['appointment_date']],
-                reverse=True
-            )
-            if dates:
-                last_visit = dates[0]
-                days_since_last = (now - last_visit.replace(tzinfo=None)).days
-
-                if len(dates) > 1:
-                    intervals = [(dates[i] - dates[i + 1]).days for i in range(len(dates) - 1)]
-                    avg_interval = sum(intervals) / len(intervals)
-                else:
-                    avg_interval = days_since_last
-            else:
-                days_since_last = 365
-                avg_interval = 365
-                last_visit = None
-        else:
-            days_since_last = 365
-            avg_interval = 365
-            last_visit = None
-
-        features.append({
-            'patient_id': pid,
-            'patient_name': f"{patient['first_name']} {patient['last_name']}",
-            'last_visit': last_visit.strftime('%Y-%m-%d') if last_visit else None,
-            'days_since_last_visit': days_since_last,
-            'total_appointments': total_appointments,
-            'cancelled_ratio': cancelled_ratio,
-            'total_revenue': total_revenue,
-            'avg_interval': avg_interval,
-        })
-
-    return features
 
+def score_patients():
+    """Feature columns and each patient's churn probability (0-100, one decimal)."""
+    columns = _get_patient_features()
+    X = np.column_stack([np.asarray(columns[name], dtype=np.float64) for name in FEATURES])
+    return columns, np.round(_score(X), 1)
 
-def get_all_churn_scores():
-    features = _get_patient_features()
-
-    if not features or not SKLEARN_AVAILABLE:
-        return _simple_heuristic(features)
-
-    X = np.array([
-        [
-            f['days_since_last_visit'],
-            f['total_appointments'],
-            f['cancelled_ratio'],
-            f['total_revenue'],
-            f['avg_interval'],
-        ]
-        for f in features
-    ])
+
+def _score(X):
+    if not len(X) or not SKLEARN_AVAILABLE:
+        return heuristic_score(X)
+
+    model = load_model()
+    if model is not None:
+        try:
+            return model.predict_proba(X)[:, 1] * 100
+        except Exception as e:
+            logger.warning('Promoted churn model failed, refitting: %s', e)
 
     if len(X) < 5:
-        return _simple_heuristic(features)
+        return heuristic_score(X)
 
-    y = np.array([1 if f['days_since_last_visit'] > 90 else 0 for f in features])
+    y = (X[:, FEATURES.index('days_since_last_visit')] > 90).astype(np.int64)
 
-    if len(set(y)) < 2:
-        return _simple_heuristic(features)
+    if y.min() == y.max():
+        return heuristic_score(X)
 
     try:
         model = LogisticRegression(max_iter=1000, random_state=42)
         model.fit(X, y)
 
-        probabilities = model.predict_proba(X)[:, 1]
+        return model.predict_proba(X)[:, 1] * 100
 
-        results = []
-        for i, f in enumerate(features):
-            prob = round(float(probabilities[i]) * 100, 1)
-            risk_level = 'high' if prob > 70 else ('medium' if prob > 40 else 'low')
-            results.append({
-                'patient_id': f['patient_id'],
-                'patient_name': f['patient_name'],
-                'last_visit': f['last_visit'],
-                'days_since_last_visit': f['days_since_last_visit'],
-                'churn_probability': prob,
-                'risk_level': risk_level,
-            })
+    except Exception:
+        return heuristic_score(X)
 
-        return sorted(results, key=lambda x: x['churn_probability'], reverse=True)
 
-    except Exception:
-        return _simple_heuristic(features)
+def heuristic_score(X):
+    """Rule-based score (0-100) for a FEATURES matrix, used without a model."""
+    days = X[:, FEATURES.index('days_since_last_visit')]
+    cancel_rate = X[:, FEATURES.index('cancelled_ratio')]
+    return np.minimum(100, (days / 180) * 60 + cancel_rate * 40)
+
+
+def risk_levels(scores):
+    return np.where(scores > 70, 'high', np.where(scores > 40, 'medium', 'low'))
+
+
+def _candidates(scores, risk):
+    if risk is None:
+        return np.arange(len(scores))
+    return np.flatnonzero(risk_levels(scores) == risk)
+
 
+def _ranked(scores, candidates, n):
+    """The n highest-scoring of `candidates`, highest first.
 
-def _simple_heuristic(features):
-    results = []
-    for f in features:
-        days = f['days_since_last_visit']
-        cancel_rate = f['cancelled_ratio']
+    argpartition picks them in linear time; only those n are sorted.
+    """
+    if n <= 0 or not len(candidates):
+        return candidates[:0]
+    if n < len(candidates):
+        candidates = candidates[np.argpartition(-scores[candidates], n - 1)[:n]]
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
 
-        score = min(100, (days / 180) * 60 + cancel_rate * 40)
-        risk_level = 'high' if score > 70 else ('medium' if score > 40 else 'low')
 
-        results.append({
-            'patient_id': f['patient_id'],
-            'patient_name': f['patient_name'],
-            'last_visit': f['last_visit'],
-            'days_since_last_visit': f['days_since_last_visit'],
-            'churn_probability': round(score, 1),
-            'risk_level': risk_level,
-        })
+def _rows(columns, scores, indices):
+    return [{
+        'patient_id': columns['patient_id'][i],
+        'patient_name': columns['patient_name'][i],
+        'last_visit': columns['last_visit'][i],
+        'days_since_last_visit': columns['days_since_last_visit'][i],
+        'churn_probability': float(scores[i]),
+        'risk_level': str(level),
+    } for i, level in zip(indices.tolist(), risk_levels(scores[indices]))]
 
-    return sorted(results, key=lambda x: x['churn_probability'], reverse=True)
+
+def get_top_churn(k=5, risk=None):
+    """The k patients most likely to churn, optionally within one risk level."""
+    columns, scores = score_patients()
+    return _rows(columns, scores, _ranked(scores, _candidates(scores, risk), k))
+
+
+def get_churn_page(page=1, limit=20, risk=None):
+    """One page of patients ordered by churn probability, for the churn report."""
+    columns, scores = score_patients()
+    candidates = _candidates(scores, risk)
+    offset = (page - 1) * limit
+    indices = _ranked(scores, candidates, offset + limit)[offset:]
+    return {
+        'data': _rows(columns, scores, indices),
+        'total': len(candidates),
+        'page': page,
+        'limit': limit,
+    }
+
+
+def get_all_churn_scores():
+    columns, scores = score_patients()
+    return _rows(columns, scores, _ranked(scores, np.arange(len(scores)), len(scores)))
@@ -0,0 +1,206 @@
+"""
+Offline churn model selection (run with `flask train-churn`).
+Training rows are patients' features as of several past cutoffs, labelled by
+whether they came back within CHURN_HORIZON_DAYS (the churn_training_set
+RPC). Every (model family, hyperparameters, CV fold) combination is fitted
+in parallel with joblib, the best configuration is refitted with
+calibrated probabilities, and it is promoted to MODEL_DIR only if it beats
+the current model (or the heuristic, when there is none) on the same
+held-out patients. Every run writes a JSON report under MODEL_DIR/reports.
+"""
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+import joblib
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.calibration import CalibratedClassifierCV, calibration_curve
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import brier_score_loss, log_loss, roc_auc_score
+from sklearn.model_selection import GroupKFold, GroupShuffleSplit, ParameterGrid
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from backend.extensions import get_supabase
+from backend.services import churn_service
+
+CHURN_HORIZON_DAYS = 90
+CUTOFFS = 4          # cutoffs, CHURN_HORIZON_DAYS apart, ending one horizon ago
+CV_FOLDS = 5
+HOLDOUT_SIZE = 0.2
+
+FAMILIES = {
+    'logistic_regression': (
+        lambda params: make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000, **params)),
+        ParameterGrid({'C': [0.01, 0.1, 1.0, 10.0]}),
+    ),
+    'gradient_boosting': (
+        lambda params: HistGradientBoostingClassifier(random_state=42, **params),
+        ParameterGrid({
+            'learning_rate': [0.05, 0.1],
+            'max_leaf_nodes': [15, 31],
+            'min_samples_leaf': [20, 100],
+        }),
+    ),
+}
+
+
+def load_training_set(today=None):
+    """Stack churn_training_set for each cutoff; groups are patient ids."""
+    today = today or date.today()
+    supabase = get_supabase()
+    parts = []
+    for i in range(1, CUTOFFS + 1):
+        cutoff = today - timedelta(days=i * CHURN_HORIZON_DAYS)
+        result = supabase.rpc('churn_training_set', {
+            'p_cutoff': cutoff.isoformat(),
+            'p_horizon': CHURN_HORIZON_DAYS,
+        }).execute()
+        parts.append(result.data or {})
+    X = np.array([
+        value
+        for part in parts
+        for value in zip(*(part.get(name) or [] for name in churn_service.FEATURES))
+    ], dtype=np.float64).reshape(-1, len(churn_service.FEATURES))
+    y = np.array([label for part in parts for label in part.get('label') or []], dtype=np.int64)
+    _, groups = np.unique([pid for part in parts for pid in part.get('patient_id') or []], return_inverse=True)
+    return X, y, groups
+
+
+def synthetic_training_set(n, seed=0):
+    """A synthetic dataset of `n` patients shaped like load_training_set's.
+
+    Churn depends non-linearly on how overdue a patient is relative to their
+    usual interval, so a good search should prefer a tree model.
+    """
+    rng = np.random.default_rng(seed)
+    visits = 1 + rng.poisson(6, n)
+    avg_interval = rng.lognormal(np.log(60), 0.5, n)
+    days_since = rng.exponential(avg_interval) * rng.uniform(0.3, 2.0, n)
+    cancelled_ratio = rng.beta(1, 6, n)
+    revenue = visits * rng.gamma(2, 150, n)
+    overdue = np.log1p(days_since / avg_interval)
+    logit = -2.5 + 3.0 * (overdue > 1.0) + 1.5 * overdue + 2.0 * cancelled_ratio - 0.1 * np.sqrt(visits)
+    y = (rng.random(n) < 1 / (1 + np.exp(-logit))).astype(np.int64)
+    X = np.column_stack([days_since.round(), visits, cancelled_ratio, revenue.round(2), avg_interval.round(2)])
+    return X, y, np.arange(n)
+
+
+def _evaluate(family, params, X, y, train_idx, test_idx):
+    started = time.perf_counter()
+    model = FAMILIES[family][0](params)
+    model.fit(X[train_idx], y[train_idx])
+    auc = roc_auc_score(y[test_idx], model.predict_proba(X[test_idx])[:, 1])
+    return family, json.dumps(params, sort_keys=True), auc, time.perf_counter() - started
+
+
+def search(X, y, groups, n_jobs=-1):
+    """Grouped cross-validated AUC for every candidate, best first."""
+    folds = list(GroupKFold(n_splits=CV_FOLDS).split(X, y, groups))
+    tasks = [
+        delayed(_evaluate)(family, params, X, y, train_idx, test_idx)
+        for family, (_, grid) in FAMILIES.items()
+        for params in grid
+        for train_idx, test_idx in folds
+    ]
+    scores = {}
+    for family, params, auc, seconds in Parallel(n_jobs=n_jobs)(tasks):
+        entry = scores.setdefault((family, params), {'aucs': [], 'fit_seconds': 0.0})
+        entry['aucs'].append(auc)
+        entry['fit_seconds'] += seconds
+    results = [{
+        'family': family,
+        'params': json.loads(params),
+        'mean_auc': round(float(np.mean(entry['aucs'])), 4),
+        'std_auc': round(float(np.std(entry['aucs'])), 4),
+        'fit_seconds': round(entry['fit_seconds'], 2),
+    } for (family, params), entry in scores.items()]
+    return sorted(results, key=lambda r: r['mean_auc'], reverse=True)
+
+
+def _holdout_metrics(y, probabilities):
+    prob_true, prob_pred = calibration_curve(y, probabilities, n_bins=10, strategy='quantile')
+    return {
+        'auc': round(float(roc_auc_score(y, probabilities)), 4),
+        'brier': round(float(brier_score_loss(y, probabilities)), 4),
+        'log_loss': round(float(log_loss(y, np.clip(probabilities, 1e-6, 1 - 1e-6))), 4),
+        'calibration': {
+            'predicted': np.round(prob_pred, 4).tolist(),
+            'observed': np.round(prob_true, 4).tolist(),
+        },
+    }
+
+
+def _current_auc(X, y):
+    """Holdout AUC of the promoted model, or of the heuristic if there is none."""
+    model = churn_service.load_model()
+    if model is not None:
+        try:
+            return 'model', float(roc_auc_score(y, model.predict_proba(X)[:, 1]))
+        except Exception:
+            pass
+    return 'heuristic', float(roc_auc_score(y, churn_service.heuristic_score(X)))
+
+
+def train(X, y, groups, n_jobs=-1, promote=True):
+    """Search, calibrate, evaluate and maybe promote; returns the report."""
+    started = time.perf_counter()
+    train_idx, holdout_idx = next(
+        GroupShuffleSplit(n_splits=1, test_size=HOLDOUT_SIZE, random_state=42).split(X, y, groups)
+    )
+    candidates = search(X[train_idx], y[train_idx], groups[train_idx], n_jobs)
+    search_seconds = time.perf_counter() - started
+
+    best = candidates[0]
+    calibrated = CalibratedClassifierCV(FAMILIES[best['family']][0](best['params']), method='isotonic', cv=3)
+    calibrated.fit(X[train_idx], y[train_idx])
+    holdout = _holdout_metrics(y[holdout_idx], calibrated.predict_proba(X[holdout_idx])[:, 1])
+    current_kind, current_auc = _current_auc(X[holdout_idx], y[holdout_idx])
+    wins = holdout['auc'] > current_auc
+
+    report = {
+        'trained_at': datetime.now().isoformat(timespec='seconds'),
+        'rows': int(len(y)),
+        'positive_rate': round(float(y.mean()), 4),
+        'holdout_rows': int(len(holdout_idx)),
+        'n_jobs': n_jobs,
+        'candidates': candidates,
+        'best': {'family': best['family'], 'params': best['params'], 'calibration': 'isotonic'},
+        'holdout': holdout,
+        'current': {'kind': current_kind, 'auc': round(current_auc, 4)},
+        'promoted': bool(promote and wins),
+        'timing': {
+            'search_seconds': round(search_seconds, 2),
+            'total_seconds': round(time.perf_counter() - started, 2),
+        },
+    }
+    if report['promoted']:
+        _promote(calibrated, report)
+    report['report_path'] = _write_report(report)
+    return report
+
+
+def _promote(model, report):
+    model_path, metadata_path = churn_service.model_paths()
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    # Write then rename so workers never load a half-written file
+    joblib.dump(model, model_path + '.tmp')
+    os.replace(model_path + '.tmp', model_path)
+    with open(metadata_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'features': list(churn_service.FEATURES),
+            'trained_at': report['trained_at'],
+            **report['best'],
+            'holdout_auc': report['holdout']['auc'],
+        }, f, indent=2)
+
+
+def _write_report(report):
+    model_path, _ = churn_service.model_paths()
+    report_dir = os.path.join(os.path.dirname(model_path), 'reports')
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"churn-{report['trained_at'].replace(':', '')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    return path
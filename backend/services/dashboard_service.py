@@ -1,5 +1,18 @@
 from datetime import datetime, timedelta
+from backend import cache
 from backend.extensions import get_supabase
+from backend.services import analytics_service, event_service
+
+MONTH_NAMES = {
+    '01': 'ינואר', '02': 'פברואר', '03': 'מרץ',
+    '04': 'אפריל', '05': 'מאי', '06': 'יוני',
+    '07': 'יולי', '08': 'אוגוסט', '09': 'ספטמבר',
+    '10': 'אוקטובר', '11': 'נובמבר', '12': 'דצמבר',
+}
+
+# Payment KPIs are cached in the 'payments' namespace, bumped by a trigger on
+# invoices; the writing worker drops its copy as soon as it sees the event
+event_service.on('invoices', lambda event: cache.discard('payments'))
 
 
 def get_total_patients():
@@ -22,6 +35,11 @@ def get_monthly_appointments():
 
 
 def get_monthly_revenue():
+    month = datetime.now().strftime('%Y-%m')
+    return cache.get_or_set('payments', ('monthly_revenue', month), _load_monthly_revenue)
+
+
+def _load_monthly_revenue():
     supabase = get_supabase()
     now = datetime.now()
     start = now.replace(day=1, hour=0, minute=0, second=0).isoformat()
@@ -35,6 +53,10 @@ def get_monthly_revenue():
 
 
 def get_pending_payments():
+    return cache.get_or_set('payments', 'pending', _load_pending_payments)
+
+
+def _load_pending_payments():
     supabase = get_supabase()
     result = supabase.table('invoices').select('amount') \
         .in_('status', ['pending', 'overdue']) \
@@ -47,36 +69,30 @@ def get_pending_payments():
     }
 
 
-def get_revenue_by_month(months=6):
+def get_invoice_aging(as_of=None):
+    """Outstanding amounts by age bucket, overall and per patient."""
+    as_of = as_of or datetime.now().date()
+    return cache.get_or_set('payments', ('aging', as_of.isoformat()), lambda: _load_invoice_aging(as_of))
+
+
+def _load_invoice_aging(as_of):
     supabase = get_supabase()
-    now = datetime.now()
-    start_date = (now - timedelta(days=months * 30)).replace(day=1)
+    result = supabase.rpc('invoice_aging', {'p_as_of': as_of.isoformat()}).execute()
+    return result.data or {}
 
-    result = supabase.table('invoices').select('amount, issued_date') \
-        .eq('status', 'paid') \
-        .gte('issued_date', start_date.strftime('%Y-%m-%d')) \
-        .execute()
 
-    monthly = {}
-    for inv in (result.data or []):
-        month_key = inv['issued_date'][:7]  # YYYY-MM
-        monthly[month_key] = monthly.get(month_key, 0) + float(inv['amount'])
-
-    labels = []
-    values = []
-    for i in range(months):
-        d = now - timedelta(days=(months - 1 - i) * 30)
-        key = d.strftime('%Y-%m')
-        month_names = {
-            '01': 'ינואר', '02': 'פברואר', '03': 'מרץ',
-            '04': 'אפריל', '05': 'מאי', '06': 'יוני',
-            '07': 'יולי', '08': 'אוגוסט', '09': 'ספטמבר',
-            '10': 'אוקטובר', '11': 'נובמבר', '12': 'דצמבר',
-        }
-        labels.append(month_names.get(key[5:7], key[5:7]))
-        values.append(monthly.get(key, 0))
-
-    return {'labels': labels, 'values': values}
+def get_revenue_by_month(months=6):
+    """Paid revenue for the last `months` calendar months (current included)."""
+    today = datetime.now().date()
+    start = today.replace(day=1)
+    for _ in range(months - 1):
+        start = (start - timedelta(days=1)).replace(day=1)
+
+    report = analytics_service.get_revenue(start, today, 'month')
+    return {
+        'labels': [MONTH_NAMES[bucket[5:7]] for bucket in report['buckets']],
+        'values': report['totals'],
+    }
 
 
 def get_appointment_status_distribution():
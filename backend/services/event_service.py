@@ -0,0 +1,220 @@
+"""
+Row-level change events for live updates.
+Service write functions call publish(); events are stored in the
+change_events table (the cross-worker outbox) and dispatched right away to
+subscribers in this process. A poller thread in every worker tails the
+table and dispatches events written by other workers, so SSE clients
+connected to any gunicorn worker see every change.
+
+Every open stream holds a request thread, so each worker accepts at most
+EVENTS_MAX_STREAMS of them. The app's client sends its JWT as a header;
+clients that can't (EventSource) authenticate a stream with a single-use
+ticket (issue_ticket) rather than putting the JWT in the URL.
+"""
+import hashlib
+import logging
+import os
+import queue
+import secrets
+import socket
+import threading
+import time
+from backend.extensions import get_supabase
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ('tasks', 'appointments', 'invoices')
+MAX_GAPS = 200      # unseen ids below the tail position re-checked per poll
+
+_lock = threading.Lock()
+_subscribers = {}   # queue -> set of topics
+_listeners = {}     # topic -> [callback(event)]
+_poller = None
+_poller_pid = None
+
+
+def _origin():
+    # Computed per call: with preload_app the module is imported before fork
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def publish(topic, action, rows):
+    """Record and dispatch change events for one row or a list of rows.
+
+    Never raises: a failed event must not fail the write that caused it.
+    """
+    if isinstance(rows, dict):
+        rows = [rows]
+    if not rows:
+        return
+    records = [{
+        'topic': topic,
+        'action': action,
+        'row_id': row.get('id'),
+        'payload': row,
+        'origin': _origin(),
+    } for row in rows]
+
+    try:
+        supabase = get_supabase()
+        stored = supabase.table('change_events').insert(records).execute().data or records
+    except Exception as e:
+        logger.warning('Could not store %s events: %s', topic, e)
+        stored = records
+    for event in stored:
+        _dispatch(event)
+
+
+def on(topic, callback):
+    """Register an in-process callback for every event on `topic`."""
+    with _lock:
+        _listeners.setdefault(topic, []).append(callback)
+
+
+def subscribe(topics, maxsize=1000, limit=None):
+    """A queue receiving events on `topics`, or None if `limit` are open."""
+    q = queue.Queue(maxsize=maxsize)
+    with _lock:
+        if limit is not None and len(_subscribers) >= limit:
+            return None
+        _subscribers[q] = set(topics)
+    return q
+
+
+def unsubscribe(q):
+    with _lock:
+        _subscribers.pop(q, None)
+
+
+def _dispatch(event):
+    topic = event['topic']
+    with _lock:
+        targets = [q for q, topics in _subscribers.items() if topic in topics]
+        callbacks = list(_listeners.get(topic, ()))
+
+    for q in targets:
+        try:
+            q.put_nowait(event)
+        except queue.Full:
+            # Slow client: drop it; it reconnects and replays via Last-Event-ID
+            unsubscribe(q)
+            with q.mutex:
+                q.queue.clear()
+            q.put_nowait(None)
+
+    for callback in callbacks:
+        try:
+            callback(event)
+        except Exception as e:
+            logger.warning('Event listener for %s failed: %s', topic, e)
+
+
+def _ticket_hash(ticket):
+    return hashlib.sha256(ticket.encode()).hexdigest()
+
+
+def issue_ticket(user_id, ttl):
+    """A random ticket that opens one stream within `ttl` seconds."""
+    ticket = secrets.token_urlsafe(32)
+    get_supabase().table('stream_tickets').insert({
+        'ticket_hash': _ticket_hash(ticket),
+        'user_id': user_id,
+        'expires_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(time.time() + ttl)),
+    }).execute()
+    return ticket
+
+
+def redeem_ticket(ticket):
+    """The ticket's user id, or None if it is unknown, used or expired."""
+    result = get_supabase().rpc('consume_stream_ticket', {'p_hash': _ticket_hash(ticket)}).execute()
+    return result.data or None
+
+
+def events_since(last_id, topics, limit=500):
+    supabase = get_supabase()
+    result = supabase.table('change_events').select('*') \
+        .gt('id', last_id) \
+        .in_('topic', list(topics)) \
+        .order('id') \
+        .limit(limit) \
+        .execute()
+    return result.data or []
+
+
+def _latest_id(supabase):
+    result = supabase.table('change_events').select('id').order('id', desc=True).limit(1).execute()
+    return result.data[0]['id'] if result.data else 0
+
+
+def _advance(rows, last_id, gaps, now):
+    """New events among `rows` (ordered by id) and the new tail position.
+
+    BIGSERIAL ids are taken at insert time, so a transaction that commits
+    late can show up below ids already read. Skipped ids are kept in `gaps`
+    (id -> when first missed) and fetched again until they appear.
+    """
+    fresh = []
+    for event in rows:
+        if event['id'] in gaps:
+            del gaps[event['id']]
+        elif event['id'] > last_id:
+            for missing in range(max(last_id + 1, event['id'] - MAX_GAPS), event['id']):
+                gaps[missing] = now
+            last_id = event['id']
+        else:
+            continue
+        fresh.append(event)
+    return fresh, last_id
+
+
+def _poll_loop(app):
+    with app.app_context():
+        interval = app.config['EVENTS_POLL_INTERVAL']
+        retention = app.config['EVENTS_RETENTION_MINUTES']
+        gap_seconds = app.config['EVENTS_GAP_SECONDS']
+        supabase = get_supabase()
+        last_id = None
+        gaps = {}
+        last_prune = 0.0
+
+        while True:
+            try:
+                if last_id is None:
+                    last_id = _latest_id(supabase)
+                query = supabase.table('change_events').select('*')
+                if gaps:
+                    query = query.or_(f"id.gt.{last_id},id.in.({','.join(map(str, gaps))})")
+                else:
+                    query = query.gt('id', last_id)
+                rows = query.order('id').limit(500).execute().data or []
+
+                now = time.monotonic()
+                fresh, last_id = _advance(rows, last_id, gaps, now)
+                origin = _origin()
+                for event in fresh:
+                    if event.get('origin') != origin:
+                        _dispatch(event)
+                # Ids still missing after EVENTS_GAP_SECONDS were rolled back
+                for missing in [i for i, first in gaps.items() if now - first > gap_seconds]:
+                    del gaps[missing]
+                for missing in sorted(gaps)[:-MAX_GAPS]:
+                    del gaps[missing]
+
+                if time.monotonic() - last_prune > 300:
+                    last_prune = time.monotonic()
+                    cutoff = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(time.time() - retention * 60))
+                    supabase.table('change_events').delete().lt('created_at', cutoff).execute()
+            except Exception as e:
+                logger.warning('Change event poll failed: %s', e)
+            time.sleep(interval)
+
+
+def ensure_poller(app):
+    """Start this process's poller thread if it is not running yet."""
+    global _poller, _poller_pid
+    with _lock:
+        if _poller is not None and _poller_pid == os.getpid() and _poller.is_alive():
+            return
+        _poller = threading.Thread(target=_poll_loop, args=(app,), name='change-events', daemon=True)
+        _poller_pid = os.getpid()
+        _poller.start()
@@ -0,0 +1,114 @@
+import csv
+import io
+from datetime import timedelta
+from flask import current_app
+from backend.extensions import get_supabase
+
+EXPORTS = {
+    'invoices': {
+        'select': 'id, invoice_number, patient_id, appointment_id, amount, status, issued_date, '
+                  'paid_date, created_at, patients(first_name, last_name)',
+        'date_column': 'issued_date',
+        'columns': ['id', 'invoice_number', 'patient_name', 'patient_id', 'appointment_id',
+                    'amount', 'status', 'issued_date', 'paid_date', 'created_at'],
+        'has_status': True,
+    },
+    'appointments': {
+        'select': 'id, patient_id, service_id, doctor_id, appointment_date, status, notes, created_at, '
+                  'patients(first_name, last_name), services(name)',
+        'date_column': 'appointment_date',
+        'columns': ['id', 'appointment_date', 'patient_name', 'patient_id', 'service_name',
+                    'service_id', 'doctor_id', 'status', 'notes', 'created_at'],
+        'has_status': True,
+    },
+    'patients': {
+        'select': 'id, first_name, last_name, id_number, date_of_birth, gender, phone, email, '
+                  'address, created_at',
+        'date_column': 'created_at',
+        'columns': ['id', 'first_name', 'last_name', 'id_number', 'date_of_birth', 'gender',
+                    'phone', 'email', 'address', 'created_at'],
+        'has_status': False,
+    },
+}
+
+
+def _flatten(row):
+    p = row.pop('patients', None)
+    s = row.pop('services', None)
+    if p is not None:
+        row['patient_name'] = f"{p.get('first_name', '')} {p.get('last_name', '')}".strip()
+    if isinstance(s, dict):
+        row['service_name'] = s.get('name', '')
+    return row
+
+
+def iter_rows(resource, date_from=None, date_to=None, status='', page_size=1000):
+    """Yield export rows page by page using keyset pagination on (date, id).
+
+    `date_from` and `date_to` are inclusive dates; timestamp columns match
+    any time on the last day. Rows without a date (an invoice's issued_date
+    may be NULL) come last when no range is given.
+
+    Only one page is held in memory at a time, and unlike offset paging the
+    cost of each page does not grow with how far into the table we are.
+    """
+    spec = EXPORTS[resource]
+    date_column = spec['date_column']
+    supabase = get_supabase()
+    last = None
+
+    while True:
+        query = supabase.table(resource).select(spec['select'])
+        if date_from:
+            query = query.gte(date_column, date_from.isoformat())
+        if date_to:
+            query = query.lt(date_column, (date_to + timedelta(days=1)).isoformat())
+        if status and spec['has_status']:
+            query = query.eq('status', status)
+        if last:
+            last_date, last_id = last
+            if last_date is None:
+                # Undated rows sort last, so only more of them can follow
+                query = query.is_(date_column, 'null').gt('id', last_id)
+            else:
+                query = query.or_(
+                    f'{date_column}.gt."{last_date}",'
+                    f'and({date_column}.eq."{last_date}",id.gt.{last_id}),'
+                    f'{date_column}.is.null'
+                )
+        rows = query.order(date_column, nullsfirst=False).order('id').limit(page_size).execute().data or []
+
+        for row in rows:
+            yield _flatten(row)
+
+        if len(rows) < page_size:
+            return
+        last = (rows[-1][date_column], rows[-1]['id'])
+
+
+def stream_csv(resource, rows):
+    columns = EXPORTS[resource]['columns']
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+
+    # BOM so Excel opens the Hebrew columns as UTF-8
+    buffer.write('\ufeff')
+    writer.writeheader()
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_ndjson(resource, rows):
+    columns = EXPORTS[resource]['columns']
+    dumps = current_app.json.dumps
+    for row in rows:
+        yield dumps({c: row.get(c) for c in columns}) + '\n'
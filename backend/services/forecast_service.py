@@ -0,0 +1,179 @@
+"""
+Revenue forecast.
+A ridge regression on daily paid-invoice totals (trend, weekday effects and,
+with a year of history, annual Fourier terms) is refitted at most once a day
+by a scheduler job and stored in analytics_snapshots. Requests only read the
+stored forecast through the 'forecast' cache namespace, which the snapshot
+table's trigger bumps on every refit.
+"""
+from datetime import date, datetime, timedelta
+import numpy as np
+from flask import current_app
+from backend import cache, scheduler
+from backend.extensions import get_supabase
+from backend.services import analytics_service
+
+SNAPSHOT = 'revenue_forecast'
+MIN_HISTORY_DAYS = 56
+FOURIER_TERMS = 3
+RIDGE_ALPHA = 1.0
+INTERVAL_Z = 1.96   # 95% intervals
+
+
+def _design(days, weekday, annual):
+    """Trend, weekday one-hot and (optionally) annual sin/cos columns."""
+    columns = [days / 365.25]
+    columns.extend((weekday == d).astype(np.float64) for d in range(7))
+    if annual:
+        angle = 2 * np.pi * days / 365.25
+        for k in range(1, FOURIER_TERMS + 1):
+            columns.extend((np.sin(k * angle), np.cos(k * angle)))
+    return np.column_stack(columns)
+
+
+def _month_end(day, months_ahead):
+    first = day.replace(day=1)
+    for _ in range(months_ahead + 1):
+        first = (first + timedelta(days=32)).replace(day=1)
+    return first - timedelta(days=1)
+
+
+def _trim_history(start, totals):
+    """Drop the zero-filled days before the first payment.
+
+    Daily totals cover the whole requested window, so without this a new
+    clinic would look like it had FORECAST_HISTORY_DAYS of history.
+    """
+    y = np.asarray(totals, dtype=np.float64)
+    paid = np.flatnonzero(y)
+    first = int(paid[0]) if paid.size else len(y)
+    return start + timedelta(days=first), y[first:]
+
+
+def fit_forecast(start, totals, months, today=None):
+    """Forecast daily revenue after the last history day through `months` months.
+
+    `totals` are paid amounts per day starting at `start`, ending yesterday;
+    history begins at the first day with revenue. Returns None with less
+    than MIN_HISTORY_DAYS of history. Intervals use the
+    residual spread of each weekday (closed days stay near zero); monthly
+    intervals assume independent daily errors.
+    """
+    start, y = _trim_history(start, totals)
+    if len(y) < MIN_HISTORY_DAYS:
+        return None
+    today = today or date.today()
+    annual = len(y) >= 365
+    days = np.arange(len(y), dtype=np.float64)
+    weekday = (start.weekday() + np.arange(len(y))) % 7
+    X = _design(days, weekday, annual)
+
+    # Closed-form ridge on centred data (the intercept is not penalized)
+    x_mean, y_mean = X.mean(axis=0), y.mean()
+    Xc = X - x_mean
+    coef = np.linalg.solve(Xc.T @ Xc + RIDGE_ALPHA * np.eye(X.shape[1]), Xc.T @ (y - y_mean))
+    residuals = y - (Xc @ coef + y_mean)
+    sigma = np.array([
+        residuals[weekday == d].std() if (weekday == d).any() else residuals.std()
+        for d in range(7)
+    ])
+
+    first = start + timedelta(days=len(y))
+    horizon = (_month_end(today, months) - first).days + 1
+    future = np.arange(len(y), len(y) + horizon, dtype=np.float64)
+    future_weekday = (first.weekday() + np.arange(horizon)) % 7
+    forecast = np.maximum((_design(future, future_weekday, annual) - x_mean) @ coef + y_mean, 0)
+    spread = INTERVAL_Z * sigma[future_weekday]
+    dates = [first + timedelta(days=i) for i in range(horizon)]
+
+    # The current month adds what has already been paid to its forecast
+    month_start = (first.replace(day=1) - start).days
+    paid_this_month = float(y[max(month_start, 0):].sum())
+    month_keys = np.array([d.strftime('%Y-%m') for d in dates])
+    month_rows = []
+    for key in dict.fromkeys(month_keys):
+        mask = month_keys == key
+        total = float(forecast[mask].sum())
+        band = INTERVAL_Z * float(np.sqrt((sigma[future_weekday[mask]] ** 2).sum()))
+        actual = paid_this_month if key == month_keys[0] else 0.0
+        month_rows.append({
+            'month': key,
+            'actual_to_date': round(actual, 2),
+            'forecast': round(actual + total, 2),
+            'lower': round(actual + max(total - band, 0), 2),
+            'upper': round(actual + total + band, 2),
+        })
+
+    return {
+        'history_from': start.isoformat(),
+        'history_days': len(y),
+        'annual_seasonality': annual,
+        'residual_std': round(float(residuals.std()), 2),
+        'days': {
+            'dates': [d.isoformat() for d in dates],
+            'forecast': np.round(forecast, 2).tolist(),
+            'lower': np.round(np.maximum(forecast - spread, 0), 2).tolist(),
+            'upper': np.round(forecast + spread, 2).tolist(),
+        },
+        'months': month_rows,
+    }
+
+
+def refit():
+    """Fit on FORECAST_HISTORY_DAYS of paid invoices and store the snapshot."""
+    today = date.today()
+    date_from = today - timedelta(days=current_app.config['FORECAST_HISTORY_DAYS'])
+    _, totals = analytics_service.get_daily_totals(date_from, today - timedelta(days=1))
+    report = fit_forecast(date_from, totals, current_app.config['FORECAST_MONTHS'], today)
+    if report is None:
+        _, history = _trim_history(date_from, totals)
+        return {'fitted': False, 'reason': 'not_enough_history', 'history_days': len(history)}
+
+    report['fitted_at'] = datetime.now().isoformat()
+    get_supabase().table('analytics_snapshots').upsert({
+        'name': SNAPSHOT,
+        'payload': report,
+        'computed_at': report['fitted_at'],
+    }).execute()
+    return {'fitted': True, 'history_days': report['history_days'], 'months': len(report['months'])}
+
+
+@scheduler.job('refit-revenue-forecast', 'FORECAST_REFIT_INTERVAL')
+def daily_refit():
+    """Refit once a day, in whichever worker claims it first."""
+    if not scheduler.claim_daily(SNAPSHOT):
+        return {'ran': False, 'reason': 'already_ran'}
+    try:
+        outcome = refit()
+    except Exception:
+        scheduler.release_daily(SNAPSHOT)
+        raise
+    scheduler.finish_daily(SNAPSHOT, outcome['history_days'])
+    return {'ran': True, **outcome}
+
+
+def _load_snapshot():
+    result = get_supabase().table('analytics_snapshots').select('payload') \
+        .eq('name', SNAPSHOT).limit(1).execute()
+    return result.data[0]['payload'] if result.data else None
+
+
+def get_forecast(months):
+    """The stored forecast cut to the current month plus `months` months.
+
+    None until the first background fit has run.
+    """
+    report = cache.get_or_set('forecast', SNAPSHOT, _load_snapshot)
+    if report is None:
+        return None
+    today = date.today().isoformat()
+    last = _month_end(date.today(), months).isoformat()
+    dates = report['days']['dates']
+    # A snapshot from an earlier day still covers days that have passed
+    first = sum(1 for d in dates if d < today)
+    keep = sum(1 for d in dates if d <= last)
+    return {
+        **report,
+        'days': {name: values[first:keep] for name, values in report['days'].items()},
+        'months': [m for m in report['months'] if m['month'] <= last[:7]],
+    }
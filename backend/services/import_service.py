@@ -0,0 +1,166 @@
+import csv
+import re
+from datetime import datetime
+from backend.extensions import get_supabase
+
+HEADER_ALIASES = {
+    'שם פרטי': 'first_name',
+    'שם משפחה': 'last_name',
+    'תעודת זהות': 'id_number',
+    'ת.ז': 'id_number',
+    'תאריך לידה': 'date_of_birth',
+    'מין': 'gender',
+    'טלפון': 'phone',
+    'אימייל': 'email',
+    'כתובת': 'address',
+}
+
+GENDERS = {
+    'male': 'male', 'm': 'male', 'ז': 'male', 'זכר': 'male',
+    'female': 'female', 'f': 'female', 'נ': 'female', 'נקבה': 'female',
+    'other': 'other', 'אחר': 'other',
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d.%m.%Y', '%d-%m-%Y')
+
+
+def normalize_id_number(value):
+    """Zero-pad to 9 digits and verify the Israeli ID check digit."""
+    digits = re.sub(r'\D', '', value or '')
+    if not digits or len(digits) > 9:
+        return None
+    digits = digits.zfill(9)
+    total = 0
+    for i, ch in enumerate(digits):
+        n = int(ch) * (1 if i % 2 == 0 else 2)
+        total += n - 9 if n > 9 else n
+    return digits if total % 10 == 0 else None
+
+
+def normalize_phone(value):
+    digits = re.sub(r'\D', '', value or '')
+    if digits.startswith('972'):
+        digits = '0' + digits[3:]
+    if len(digits) == 10 and digits.startswith('05'):
+        return f'{digits[:3]}-{digits[3:]}'
+    if len(digits) == 9 and digits.startswith('0'):
+        return f'{digits[:2]}-{digits[2:]}'
+    return None
+
+
+def normalize_date(value):
+    value = (value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def canonical_row(raw):
+    """Map Hebrew/English headers to column names and strip the values."""
+    return {HEADER_ALIASES.get(k.strip(), k.strip()): (v or '').strip()
+            for k, v in raw.items() if k}
+
+
+def normalize_row(raw):
+    """Return (record, error) for one CSV row."""
+    row = canonical_row(raw)
+
+    if not row.get('first_name') or not row.get('last_name'):
+        return None, 'שם פרטי ושם משפחה הם שדות חובה'
+
+    id_number = normalize_id_number(row.get('id_number'))
+    if not id_number:
+        return None, 'מספר תעודת זהות לא תקין'
+
+    record = {
+        'first_name': row['first_name'][:50],
+        'last_name': row['last_name'][:50],
+        'id_number': id_number,
+    }
+
+    if row.get('phone'):
+        record['phone'] = normalize_phone(row['phone'])
+        if not record['phone']:
+            return None, 'מספר טלפון לא תקין'
+    if row.get('date_of_birth'):
+        record['date_of_birth'] = normalize_date(row['date_of_birth'])
+        if not record['date_of_birth']:
+            return None, 'תאריך לידה לא תקין'
+    if row.get('gender'):
+        record['gender'] = GENDERS.get(row['gender'].lower())
+        if not record['gender']:
+            return None, 'ערך מין לא תקין'
+    if row.get('email'):
+        record['email'] = row['email'].lower()
+    if row.get('address'):
+        record['address'] = row['address']
+
+    return record, None
+
+
+def _flush(supabase, pending):
+    """Insert a chunk, skipping id_numbers that already exist in the table."""
+    ids = [record['id_number'] for _, record in pending]
+    existing = supabase.table('patients').select('id_number').in_('id_number', ids).execute().data or []
+    existing_ids = {row['id_number'] for row in existing}
+
+    to_insert = [(line, record) for line, record in pending if record['id_number'] not in existing_ids]
+    duplicates = [(line, record) for line, record in pending if record['id_number'] in existing_ids]
+
+    if to_insert:
+        supabase.table('patients').insert([record for _, record in to_insert]).execute()
+    return len(to_insert), duplicates
+
+
+def import_patients(lines, chunk_size=500):
+    """Stream-import patients from an iterable of CSV lines.
+
+    Yields event dicts ({'type': 'error' | 'progress' | 'summary', ...}) as it
+    goes, so callers can report progress and write the error file without
+    the importer holding more than one chunk of rows.
+    """
+    supabase = get_supabase()
+    reader = csv.DictReader(lines)
+    seen = set()
+    pending = []
+    stats = {'processed': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0}
+
+    def flush():
+        try:
+            inserted, duplicates = _flush(supabase, pending)
+        except Exception as e:
+            stats['invalid'] += len(pending)
+            return [{'type': 'error', 'line': line, 'id_number': record['id_number'], 'error': str(e)}
+                    for line, record in pending]
+        stats['inserted'] += inserted
+        stats['duplicates'] += len(duplicates)
+        events = [{'type': 'error', 'line': line, 'id_number': record['id_number'],
+                   'error': 'מטופל עם תעודת זהות זו כבר קיים'} for line, record in duplicates]
+        events.append({'type': 'progress', **stats})
+        return events
+
+    for raw in reader:
+        stats['processed'] += 1
+        line = reader.line_num
+        row = canonical_row(raw)
+        record, error = normalize_row(row)
+        if error is None and record['id_number'] in seen:
+            error = 'תעודת זהות כפולה בקובץ'
+        if error:
+            stats['invalid'] += 1
+            id_number = record['id_number'] if record else row.get('id_number', '')
+            yield {'type': 'error', 'line': line, 'id_number': id_number, 'error': error}
+            continue
+
+        seen.add(record['id_number'])
+        pending.append((line, record))
+        if len(pending) >= chunk_size:
+            yield from flush()
+            pending = []
+
+    if pending:
+        yield from flush()
+    yield {'type': 'summary', **stats}
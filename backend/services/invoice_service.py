@@ -1,8 +1,15 @@
+from flask import current_app
+from backend import cache, scheduler
 from backend.extensions import get_supabase
+from backend.services import event_service
 
 
 def get_invoices(search='', status_filter='', page=1, limit=10):
     supabase = get_supabase()
+    search = search.strip()
+    if search:
+        return _search_invoices(search, status_filter, page, limit)
+
     query = supabase.table('invoices').select(
         '*, patients(first_name, last_name)',
         count='exact'
@@ -24,6 +31,23 @@ def get_invoices(search='', status_filter='', page=1, limit=10):
     }
 
 
+def _search_invoices(search, status_filter, page, limit):
+    supabase = get_supabase()
+    result = supabase.rpc('search_invoices', {
+        'p_query': search,
+        'p_status': status_filter or '',
+        'p_limit': limit,
+        'p_offset': (page - 1) * limit,
+    }).execute()
+    payload = result.data or {}
+    return {
+        'data': payload.get('data') or [],
+        'total': payload.get('total') or 0,
+        'page': page,
+        'limit': limit,
+    }
+
+
 def get_invoice(invoice_id: str):
     supabase = get_supabase()
     result = supabase.table('invoices').select(
@@ -34,13 +58,19 @@ def get_invoice(invoice_id: str):
 
 def create_invoice(data: dict):
     supabase = get_supabase()
+    # Numbers are allocated by the invoices_assign_number trigger
+    data = {k: v for k, v in data.items() if k != 'invoice_number'}
     result = supabase.table('invoices').insert(data).execute()
+    event_service.publish('invoices', 'insert', result.data)
     return result.data[0] if result.data else None
 
 
 def update_invoice(invoice_id: str, data: dict):
     supabase = get_supabase()
+    # Numbers are allocated once, by the database; they never change
+    data = {k: v for k, v in data.items() if k != 'invoice_number'}
     result = supabase.table('invoices').update(data).eq('id', invoice_id).execute()
+    event_service.publish('invoices', 'update', result.data)
     return result.data[0] if result.data else None
 
 
@@ -51,9 +81,44 @@ def mark_as_paid(invoice_id: str):
         'status': 'paid',
         'paid_date': date.today().isoformat(),
     }).eq('id', invoice_id).execute()
+    event_service.publish('invoices', 'update', result.data)
     return result.data[0] if result.data else None
 
 
 def delete_invoice(invoice_id: str):
     supabase = get_supabase()
-    supabase.table('invoices').delete().eq('id', invoice_id).execute()
+    result = supabase.table('invoices').delete().eq('id', invoice_id).execute()
+    event_service.publish('invoices', 'delete', result.data)
+
+
+def auto_invoice(until=None):
+    """Invoice all completed, not yet invoiced appointments up to `until`.
+
+    Returns the created invoices.
+    """
+    supabase = get_supabase()
+    params = {'p_until': until.isoformat()} if until else {}
+    result = supabase.rpc('auto_invoice_completed', params).execute()
+    created = result.data or []
+    event_service.publish('invoices', 'insert', created)
+    return created
+
+
+@scheduler.job('sweep-overdue-invoices', 'INVOICE_SWEEP_INTERVAL')
+def sweep_overdue(force=False):
+    """Mark pending invoices past INVOICE_DUE_DAYS as overdue.
+
+    Safe to call from every worker: the RPC runs the update at most once a
+    day (unless forced) and only in the worker holding the advisory lock.
+    """
+    supabase = get_supabase()
+    result = supabase.rpc('sweep_overdue_invoices', {
+        'p_due_days': current_app.config['INVOICE_DUE_DAYS'],
+        'p_force': force,
+    }).execute()
+    outcome = result.data or {}
+    rows = outcome.pop('rows', None) or []
+    if rows:
+        event_service.publish('invoices', 'update', rows)
+        cache.invalidate('payments')
+    return outcome
@@ -0,0 +1,53 @@
+"""
+Lexicographic rank keys for ordered lists (kanban columns).
+Keys are base-62 strings in ASCII order, so they sort correctly as plain
+text (the tasks.rank column uses COLLATE "C"), and a key can always be
+generated between two neighbours without touching any other row.
+"""
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+
+
+def rank_between(before=None, after=None):
+    """Return a key that sorts strictly between `before` and `after`.
+
+    Either bound may be None for the start/end of the list.
+    """
+    before = before or ''
+    after = after or ''
+    if before and after and before >= after:
+        raise ValueError(f'{before!r} must sort before {after!r}')
+
+    key = []
+    bounded = bool(after)
+    i = 0
+    while True:
+        lo = DIGITS.index(before[i]) if i < len(before) else 0
+        hi = DIGITS.index(after[i]) if bounded else BASE
+        if hi - lo > 1:
+            key.append(DIGITS[(lo + hi) // 2])
+            return ''.join(key)
+        key.append(DIGITS[lo])
+        if hi > lo:
+            # We are now below `after` at this digit; the rest is unbounded
+            bounded = False
+        i += 1
+
+
+def spread_ranks(count):
+    """Return `count` evenly spaced, equal-length keys (used to rebalance)."""
+    width = 1
+    while BASE ** width < (count + 1) * BASE:
+        width += 1
+    step = BASE ** width // (count + 1)
+
+    keys = []
+    for n in range(1, count + 1):
+        value = step * n
+        digits = []
+        for _ in range(width):
+            value, d = divmod(value, BASE)
+            digits.append(DIGITS[d])
+        keys.append(''.join(reversed(digits)))
+    return keys
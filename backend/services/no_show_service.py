@@ -0,0 +1,115 @@
+"""
+Nightly no-show risk scoring.
+A logistic regression is fitted on the last NO_SHOW_HISTORY_DAYS of
+attended / no-show appointments and scores every scheduled appointment in
+the next NO_SHOW_HORIZON_DAYS in one vectorized pass. Scores are stored on
+the appointments (no_show_risk) and read back by the normal list queries,
+so nothing is computed on the request path. Appointments booked after the
+nightly run are scored the following night.
+"""
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from backend import scheduler
+from backend.extensions import get_supabase
+
+try:
+    from sklearn.linear_model import LogisticRegression
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+
+MIN_TRAINING_ROWS = 50
+# Pseudo-visits at the clinic-wide rate blended into each patient's own
+# no-show rate, so one missed visit doesn't make a newcomer "certain"
+PRIOR_WEIGHT = 3.0
+
+
+def _patient_rate(facts, base_rate):
+    visits = np.asarray(facts['prior_visits'], dtype=np.float64)
+    no_shows = np.asarray(facts['prior_no_shows'], dtype=np.float64)
+    return (no_shows + PRIOR_WEIGHT * base_rate) / (visits + PRIOR_WEIGHT)
+
+
+def build_features(facts, services, base_rate):
+    """Model matrix for parallel-array `facts` (see no_show_features in schema.sql).
+
+    Columns: log visit count, smoothed patient no-show rate, log lead time,
+    weekday and hour one-hots, and a one-hot of `services` (unknown or
+    missing services get all zeros).
+    """
+    n = len(facts['id'])
+    visits = np.asarray(facts['prior_visits'], dtype=np.float64)
+    lead = np.asarray(facts['lead_days'], dtype=np.float64)
+    weekday = np.asarray(facts['weekday'], dtype=np.int64)
+    hour = np.asarray(facts['hour'], dtype=np.int64)
+    position = {service_id: i for i, service_id in enumerate(services)}
+    service = np.fromiter((position.get(s, -1) for s in facts['service_id']), dtype=np.int64, count=n)
+
+    X = np.zeros((n, 3 + 7 + 24 + len(services)))
+    X[:, 0] = np.log1p(visits)
+    X[:, 1] = _patient_rate(facts, base_rate)
+    X[:, 2] = np.log1p(np.maximum(lead, 0))
+    rows = np.arange(n)
+    X[rows, 3 + weekday] = 1
+    X[rows, 10 + hour] = 1
+    known = service >= 0
+    X[rows[known], 34 + service[known]] = 1
+    return X
+
+
+def score(history, upcoming):
+    """No-show probability for each upcoming appointment and the method used.
+
+    Falls back to the smoothed per-patient rate when there is too little
+    history (or only one outcome) to fit a model.
+    """
+    labels = np.asarray(history['label'], dtype=np.int64)
+    base_rate = float(labels.mean()) if len(labels) else 0.0
+    if (not SKLEARN_AVAILABLE or len(labels) < MIN_TRAINING_ROWS
+            or labels.min(initial=0) == labels.max(initial=0)):
+        return _patient_rate(upcoming, base_rate), 'heuristic'
+
+    services = list(dict.fromkeys(s for s in history['service_id'] if s is not None))
+    X = build_features(history, services, base_rate)
+    model = LogisticRegression(max_iter=1000, random_state=42)
+    model.fit(X, labels)
+    return model.predict_proba(build_features(upcoming, services, base_rate))[:, 1], 'model'
+
+
+def _load_facts(upcoming, days):
+    supabase = get_supabase()
+    result = supabase.rpc('no_show_features', {'p_upcoming': upcoming, 'p_days': days}).execute()
+    return result.data or {'id': []}
+
+
+def score_upcoming():
+    """Fit on recent history and store scores for upcoming appointments."""
+    upcoming = _load_facts(True, current_app.config['NO_SHOW_HORIZON_DAYS'])
+    if not upcoming['id']:
+        return {'scored': 0, 'method': None}
+    history = _load_facts(False, current_app.config['NO_SHOW_HISTORY_DAYS'])
+    probabilities, method = score(history, upcoming)
+
+    supabase = get_supabase()
+    result = supabase.rpc('set_no_show_risk', {
+        'p_ids': upcoming['id'],
+        'p_scores': np.round(probabilities, 4).tolist(),
+    }).execute()
+    return {'scored': result.data or 0, 'method': method, 'training_rows': len(history['id'])}
+
+
+@scheduler.job('score-no-shows', 'NO_SHOW_SCORE_INTERVAL')
+def nightly_score():
+    """Run score_upcoming once a day, after NO_SHOW_SCORE_HOUR, in one worker."""
+    if datetime.now().hour < current_app.config['NO_SHOW_SCORE_HOUR']:
+        return {'ran': False, 'reason': 'too_early'}
+    if not scheduler.claim_daily('score_no_shows'):
+        return {'ran': False, 'reason': 'already_ran'}
+    try:
+        outcome = score_upcoming()
+    except Exception:
+        scheduler.release_daily('score_no_shows')
+        raise
+    scheduler.finish_daily('score_no_shows', outcome['scored'])
+    return {'ran': True, **outcome}
@@ -0,0 +1,144 @@
+"""
+Recurring appointment series.
+A series is an RRULE (RFC 5545 subset via dateutil) plus the fields shared
+by its occurrences. Occurrences are expanded up to the booking horizon,
+checked for conflicts in one RPC and inserted in one bulk write; edits to
+"this and following" occurrences are single set-based updates.
+"""
+from datetime import datetime, timedelta
+from dateutil.rrule import rrulestr
+from flask import current_app
+from postgrest.exceptions import APIError
+from backend.extensions import get_supabase
+from backend.services import appointment_service, event_service
+from backend.services.appointment_service import AppointmentConflict
+
+SHARED_FIELDS = ('patient_id', 'service_id', 'doctor_id', 'notes')
+EDITABLE_FIELDS = ('service_id', 'doctor_id', 'notes', 'status')
+
+
+def expand_occurrences(rule, start, until, max_count):
+    """Occurrence datetimes of `rule` from `start` up to and including `until`.
+
+    Raises ValueError for an unparsable rule or more than `max_count` dates.
+    """
+    try:
+        recurrence = rrulestr(rule, dtstart=start, ignoretz=True)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'invalid recurrence rule: {e}') from e
+
+    occurrences = []
+    for occurrence in recurrence:
+        if occurrence > until:
+            break
+        if len(occurrences) == max_count:
+            raise ValueError(f'rule produces more than {max_count} occurrences')
+        occurrences.append(occurrence)
+    return occurrences
+
+
+def _conflicts(doctor_id, service_id, starts, exclude_series=None):
+    if not doctor_id or not starts:
+        return []
+    supabase = get_supabase()
+    result = supabase.rpc('series_conflicts', {
+        'p_doctor_id': doctor_id,
+        'p_service_id': service_id,
+        'p_starts': [s.isoformat() if isinstance(s, datetime) else s for s in starts],
+        'p_exclude_series': exclude_series,
+    }).execute()
+    return result.data or []
+
+
+def create_series(data: dict, skip_conflicts=False):
+    """Create a series and materialize its occurrences.
+
+    Returns (series, appointments, skipped). Raises AppointmentConflict
+    listing every clashing occurrence unless skip_conflicts is set, in
+    which case those occurrences are left out and returned as `skipped`.
+    """
+    config = current_app.config
+    start = datetime.fromisoformat(data['starts_at']).replace(tzinfo=None)
+    until = start + timedelta(days=config['SERIES_HORIZON_DAYS'])
+    occurrences = expand_occurrences(data['rrule'], start, until, config['SERIES_MAX_OCCURRENCES'])
+    if not occurrences:
+        raise ValueError('rule produces no occurrences')
+
+    conflicts = _conflicts(data.get('doctor_id'), data.get('service_id'), occurrences)
+    if conflicts and not skip_conflicts:
+        raise AppointmentConflict(conflicts)
+    clashing = {datetime.fromisoformat(c['start']) for c in conflicts}
+    occurrences = [o for o in occurrences if o not in clashing]
+
+    supabase = get_supabase()
+    series_row = {field: data.get(field) for field in SHARED_FIELDS}
+    series_row.update(rrule=data['rrule'], starts_at=start.isoformat())
+    series = supabase.table('appointment_series').insert(series_row).execute().data[0]
+
+    rows = [{
+        **{field: data.get(field) for field in SHARED_FIELDS},
+        'series_id': series['id'],
+        'appointment_date': occurrence.isoformat(),
+        'status': 'scheduled',
+    } for occurrence in occurrences]
+    created = []
+    try:
+        if rows:
+            created = supabase.table('appointments').insert(rows).execute().data or []
+    except APIError as e:
+        # Lost a race with another booking: undo the series and report it
+        supabase.table('appointment_series').delete().eq('id', series['id']).execute()
+        if appointment_service.is_overlap_error(e):
+            raise AppointmentConflict(
+                _conflicts(data.get('doctor_id'), data.get('service_id'), occurrences)
+            ) from e
+        raise
+
+    event_service.publish('appointments', 'insert', created)
+    return series, created, [c['start'] for c in conflicts]
+
+
+def update_following(series_id, from_date, patch, shift_minutes=0):
+    """Apply `patch` (and an optional time shift) to scheduled occurrences
+    of the series on or after `from_date`. Returns the updated rows.
+
+    Shift and patch run in one database function, so a double-booking
+    leaves every occurrence as it was."""
+    supabase = get_supabase()
+    try:
+        rows = supabase.rpc('update_series_following', {
+            'p_series_id': series_id,
+            'p_from': from_date,
+            'p_minutes': shift_minutes,
+            'p_patch': patch,
+        }).execute().data or []
+    except APIError as e:
+        if not appointment_service.is_overlap_error(e):
+            raise
+        raise AppointmentConflict(_following_conflicts(series_id, from_date, patch, shift_minutes)) from e
+
+    event_service.publish('appointments', 'update', rows)
+    return rows
+
+
+def _following_conflicts(series_id, from_date, patch, shift_minutes):
+    supabase = get_supabase()
+    rows = supabase.table('appointments').select('doctor_id, service_id, appointment_date') \
+        .eq('series_id', series_id) \
+        .gte('appointment_date', from_date) \
+        .eq('status', 'scheduled') \
+        .order('appointment_date') \
+        .execute().data or []
+    if not rows:
+        return []
+    doctor_id = patch.get('doctor_id', rows[0]['doctor_id'])
+    service_id = patch.get('service_id', rows[0]['service_id'])
+    starts = [
+        datetime.fromisoformat(row['appointment_date']) + timedelta(minutes=shift_minutes)
+        for row in rows
+    ]
+    return _conflicts(doctor_id, service_id, starts, exclude_series=series_id)
+
+
+def cancel_following(series_id, from_date):
+    return update_following(series_id, from_date, {'status': 'cancelled'})
@@ -1,23 +1,63 @@
+from flask import current_app
+from backend import cache, scheduler
 from backend.extensions import get_supabase
+from backend.services import event_service
+from backend.services.lexorank import rank_between, spread_ranks
 
 
-def get_tasks_grouped():
+TASK_STATUSES = ('open', 'in_progress', 'done')
+# PostgREST caps a response at 1000 rows
+PAGE_SIZE = 1000
+
+
+def get_tasks_grouped(limit_per_status=50):
+    """First `limit_per_status` tasks of each column plus full column counts."""
     supabase = get_supabase()
-    result = supabase.table('tasks').select('*, users!tasks_assigned_to_fkey(full_name)') \
-        .order('position') \
-        .execute()
+    result = supabase.rpc('get_task_board', {'p_limit': limit_per_status}).execute()
+    board = result.data or {}
 
-    grouped = {
-        'open': [],
-        'in_progress': [],
-        'done': [],
-    }
-    for task in (result.data or []):
+    grouped = {status: [] for status in TASK_STATUSES}
+    for task in (board.get('tasks') or []):
         status = task.get('status', 'open')
         if status in grouped:
             grouped[status].append(task)
 
-    return grouped
+    counts = {status: (board.get('counts') or {}).get(status, 0) for status in TASK_STATUSES}
+    return grouped, counts
+
+
+def get_column_tasks(status: str, after_rank: str = '', limit=50):
+    """Next page of one column, keyset-paginated on rank."""
+    supabase = get_supabase()
+    query = supabase.table('tasks').select('*, users!tasks_assigned_to_fkey(full_name)') \
+        .eq('status', status)
+    if after_rank:
+        query = query.gt('rank', after_rank)
+    result = query.order('rank').order('position').limit(limit).execute()
+    return result.data or []
+
+
+def archive_done_tasks(older_than_days: int):
+    """Move done tasks older than `older_than_days` to tasks_archive; returns the count."""
+    supabase = get_supabase()
+    result = supabase.rpc('archive_done_tasks', {'p_older_than_days': older_than_days}).execute()
+    archived = result.data or []
+    event_service.publish('tasks', 'delete', [{'id': task_id} for task_id in archived])
+    return len(archived)
+
+
+@scheduler.job('archive-done-tasks', 'TASK_ARCHIVE_INTERVAL')
+def daily_archive():
+    """Archive old done tasks once a day, in whichever worker claims it first."""
+    if not scheduler.claim_daily('archive_done_tasks'):
+        return {'ran': False, 'reason': 'already_ran'}
+    try:
+        archived = archive_done_tasks(current_app.config['TASK_ARCHIVE_AFTER_DAYS'])
+    except Exception:
+        scheduler.release_daily('archive_done_tasks')
+        raise
+    scheduler.finish_daily('archive_done_tasks', archived)
+    return {'ran': True, 'archived': archived}
 
 
 def get_task(task_id: str):
@@ -26,33 +66,127 @@ def get_task(task_id: str):
     return result.data[0] if result.data else None
 
 
+def _edge_rank(status, last=False):
+    supabase = get_supabase()
+    result = supabase.table('tasks').select('rank') \
+        .eq('status', status) \
+        .order('rank', desc=last) \
+        .limit(1) \
+        .execute()
+    return result.data[0]['rank'] if result.data else None
+
+
+def assign_ranks(rows: list):
+    """Give new rows ranks after the current end of their column.
+
+    Appending `spread_ranks` suffixes to the last key keeps bulk inserts at a
+    fixed key length instead of chaining rank_between calls.
+    """
+    by_status = {}
+    for row in rows:
+        if not row.get('rank'):
+            by_status.setdefault(row.get('status', 'open'), []).append(row)
+    for status, pending in by_status.items():
+        last = _edge_rank(status, last=True) or ''
+        for row, suffix in zip(pending, spread_ranks(len(pending))):
+            row['rank'] = last + suffix
+    return rows
+
+
 def create_task(data: dict):
     supabase = get_supabase()
+    if not data.get('rank'):
+        data = {**data, 'rank': rank_between(_edge_rank(data.get('status', 'open'), last=True), None)}
     result = supabase.table('tasks').insert(data).execute()
+    event_service.publish('tasks', 'insert', result.data)
     return result.data[0] if result.data else None
 
 
 def update_task(task_id: str, data: dict):
     supabase = get_supabase()
     result = supabase.table('tasks').update(data).eq('id', task_id).execute()
+    event_service.publish('tasks', 'update', result.data)
     return result.data[0] if result.data else None
 
 
-def update_task_status(task_id: str, new_status: str, position: int = 0):
+def update_task_status(task_id: str, new_status: str, prev_id: str = None, next_id: str = None):
+    """Move a task into `new_status` between two neighbouring cards.
+
+    Only the moved task is written. With no neighbours given the task goes
+    to the top of the column.
+    """
     supabase = get_supabase()
+    neighbour_ids = [i for i in (prev_id, next_id) if i]
+    ranks = {}
+    if neighbour_ids:
+        rows = supabase.table('tasks').select('id, rank').in_('id', neighbour_ids).execute().data or []
+        ranks = {row['id']: row['rank'] for row in rows}
+
+    prev_rank = ranks.get(prev_id)
+    next_rank = ranks.get(next_id) if next_id else (None if prev_id else _edge_rank(new_status))
+    try:
+        rank = rank_between(prev_rank, next_rank)
+    except ValueError:
+        # Neighbours out of order (stale client view): fall back to the top
+        rank = rank_between(None, _edge_rank(new_status))
+
     result = supabase.table('tasks').update({
         'status': new_status,
-        'position': position,
+        'rank': rank,
     }).eq('id', task_id).execute()
+    event_service.publish('tasks', 'update', result.data)
+
+    if len(rank) > current_app.config['TASK_RANK_MAX_LENGTH']:
+        rebalance_column(new_status)
+        return get_task(task_id)
     return result.data[0] if result.data else None
 
 
+def reorder_tasks(status: str, task_ids: list):
+    """Give `task_ids` fresh, evenly spaced ranks in one statement."""
+    supabase = get_supabase()
+    ranks = spread_ranks(len(task_ids))
+    result = supabase.rpc('set_task_ranks', {
+        'p_ids': task_ids,
+        'p_ranks': ranks,
+        'p_status': status,
+    }).execute()
+    event_service.publish('tasks', 'reorder', [
+        {'id': task_id, 'status': status, 'rank': rank} for task_id, rank in zip(task_ids, ranks)
+    ])
+    return result.data or 0
+
+
+def rebalance_column(status: str):
+    supabase = get_supabase()
+    ids = []
+    while True:
+        page = supabase.table('tasks').select('id') \
+            .eq('status', status) \
+            .order('rank') \
+            .order('position') \
+            .order('id') \
+            .range(len(ids), len(ids) + PAGE_SIZE - 1) \
+            .execute().data or []
+        ids.extend(row['id'] for row in page)
+        if len(page) < PAGE_SIZE:
+            break
+    if not ids:
+        return 0
+    return reorder_tasks(status, ids)
+
+
 def delete_task(task_id: str):
     supabase = get_supabase()
-    supabase.table('tasks').delete().eq('id', task_id).execute()
+    result = supabase.table('tasks').delete().eq('id', task_id).execute()
+    event_service.publish('tasks', 'delete', result.data)
 
 
-def get_users():
+def _load_users():
     supabase = get_supabase()
     result = supabase.table('users').select('id, full_name, role').execute()
     return result.data or []
+
+
+def get_users():
+    return cache.get_or_set('users', 'all', _load_users)
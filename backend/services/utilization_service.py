@@ -0,0 +1,162 @@
+"""
+Doctor utilization, no-show and cancellation analytics.
+Appointments for the range are fetched once as parallel arrays (the
+appointment_facts RPC) and aggregated with NumPy group-bys: every metric is
+a bincount / add.at over integer group codes, so years of appointments
+take milliseconds. Results are cached for UTILIZATION_REFRESH_SECONDS.
+"""
+from datetime import date, datetime, timedelta
+import numpy as np
+from flask import current_app
+from backend import cache
+from backend.extensions import get_supabase
+from backend.services import task_service
+
+STATUSES = ('scheduled', 'completed', 'cancelled', 'no_show')
+SCHEDULED, COMPLETED, CANCELLED, NO_SHOW = range(len(STATUSES))
+STATUS_CODES = {name: code for code, name in enumerate(STATUSES)}
+LATE_CANCEL_MINUTES = 24 * 60
+
+
+def _week_start(day):
+    return day - timedelta(days=(day.weekday() + 1) % 7)
+
+
+def _factorize(values):
+    """Distinct values (in first-seen order) and each value's integer code.
+
+    Hashing beats np.unique here: sorting string/object arrays is slow.
+    """
+    codes = {}
+    idx = np.fromiter((codes.setdefault(v, len(codes)) for v in values), dtype=np.int64, count=len(values))
+    return list(codes), idx
+
+
+def _available_minutes(date_from, date_to, working_hours):
+    """Open clinic minutes per day of [date_from, date_to] as an array."""
+    per_weekday = [
+        sum(
+            (datetime.strptime(end, '%H:%M') - datetime.strptime(start, '%H:%M')).seconds // 60
+            for start, end in working_hours.get(weekday, [])
+        )
+        for weekday in range(7)
+    ]
+    days = (date_to - date_from).days + 1
+    weekdays = (date_from.weekday() + np.arange(days)) % 7
+    return np.asarray(per_weekday, dtype=np.float64)[weekdays]
+
+
+def compute_utilization(facts, date_from, date_to, working_hours):
+    """Aggregate appointment facts into per-doctor, per-week and heatmap metrics.
+
+    `facts` holds parallel lists: doctor_id, start (epoch seconds, local
+    time), minutes, status and cancel_lead_minutes (None when unknown).
+    """
+    doctors, doctor_idx = _factorize(facts['doctor_id'])
+    n_doctors = len(doctors)
+    start = np.asarray(facts['start'], dtype='datetime64[s]')
+    minutes = np.asarray(facts['minutes'], dtype=np.float64)
+    labels, status_idx = _factorize(facts['status'])
+    status = np.asarray([STATUS_CODES.get(label, -1) for label in labels] or [-1], dtype=np.int64)[status_idx]
+
+    day = (start.astype('datetime64[D]') - np.datetime64(date_from, 'D')).astype(np.int64)
+    first_week = _week_start(date_from)
+    week = (day + (date_from - first_week).days) // 7
+    n_weeks = (date_to - first_week).days // 7 + 1
+    hour = (start - start.astype('datetime64[D]')).astype('timedelta64[h]').astype(np.int64)
+    weekday = (day + date_from.weekday()) % 7   # Python weekday, Monday=0
+
+    busy = (status == SCHEDULED) | (status == COMPLETED)
+    attended = status == COMPLETED
+    no_show = status == NO_SHOW
+    cancelled = status == CANCELLED
+
+    # Booked vs. open minutes per doctor and week
+    cell = doctor_idx * n_weeks + week
+    booked = np.bincount(cell, weights=minutes * busy, minlength=n_doctors * n_weeks).reshape(n_doctors, n_weeks)
+    open_per_day = _available_minutes(date_from, date_to, working_hours)
+    open_week = np.bincount(
+        (np.arange(len(open_per_day)) + (date_from - first_week).days) // 7,
+        weights=open_per_day, minlength=n_weeks,
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        utilization = np.where(open_week > 0, booked / open_week, 0.0)
+
+    # Per-doctor rates
+    def per_doctor(mask):
+        return np.bincount(doctor_idx, weights=mask, minlength=n_doctors)
+
+    appointments = np.bincount(doctor_idx, minlength=n_doctors)
+    outcomes = per_doctor(attended) + per_doctor(no_show)
+    no_shows = per_doctor(no_show)
+    cancels = per_doctor(cancelled)
+    lead = np.asarray(facts['cancel_lead_minutes'], dtype=np.float64)   # None -> nan
+    known_lead = cancelled & ~np.isnan(lead)
+    lead_count = per_doctor(known_lead)
+    lead_sum = np.bincount(doctor_idx[known_lead], weights=lead[known_lead], minlength=n_doctors)
+    late = per_doctor(known_lead & (np.nan_to_num(lead) < LATE_CANCEL_MINUTES))
+
+    # Weekday x hour heatmap of booked appointments and no-show rate
+    grid_booked = np.zeros((7, 24))
+    grid_outcomes = np.zeros((7, 24))
+    grid_no_show = np.zeros((7, 24))
+    np.add.at(grid_booked, (weekday, hour), busy | no_show)
+    np.add.at(grid_outcomes, (weekday, hour), attended | no_show)
+    np.add.at(grid_no_show, (weekday, hour), no_show)
+
+    def ratio(num, den):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.round(np.where(den > 0, num / den, 0.0), 4).tolist()
+
+    total_open = open_week.sum()
+    # Rows ordered Sunday..Saturday for display
+    display = [6, 0, 1, 2, 3, 4, 5]
+    return {
+        'weeks': [(first_week + timedelta(weeks=i)).isoformat() for i in range(n_weeks)],
+        'doctors': [{
+            'doctor_id': doctors[d],
+            'utilization': round(float(booked[d].sum() / total_open), 4) if total_open else 0.0,
+            'weekly_utilization': np.round(utilization[d], 4).tolist(),
+            'booked_minutes': float(booked[d].sum()),
+            'appointments': int(appointments[d]),
+            'no_show_rate': ratio(no_shows[d], outcomes[d]),
+            'cancellations': int(cancels[d]),
+            'avg_cancel_lead_hours': round(float(lead_sum[d] / lead_count[d]) / 60, 1) if lead_count[d] else None,
+            'late_cancel_rate': ratio(late[d], lead_count[d]),
+        } for d in range(n_doctors)],
+        'available_minutes_per_week': open_week.tolist(),
+        'heatmap': {
+            'weekdays': display,
+            'hours': list(range(24)),
+            'booked': grid_booked[display].astype(int).tolist(),
+            'no_show_rate': ratio(grid_no_show[display], grid_outcomes[display]),
+        },
+    }
+
+
+def _load(date_from, date_to, doctor_id):
+    supabase = get_supabase()
+    result = supabase.rpc('appointment_facts', {
+        'p_from': date_from.isoformat(),
+        'p_to': date_to.isoformat(),
+        'p_doctor_id': doctor_id,
+    }).execute()
+    facts = result.data or {}
+    report = compute_utilization(facts, date_from, date_to, current_app.config['WORKING_HOURS'])
+    names = {u['id']: u['full_name'] for u in task_service.get_users()}
+    for d in report['doctors']:
+        d['doctor_name'] = names.get(d['doctor_id'], '')
+    return report
+
+
+def get_utilization(date_from, date_to, doctor_id=None):
+    key = (date_from.isoformat(), date_to.isoformat(), doctor_id)
+    return cache.get_or_set(
+        'utilization', key, lambda: _load(date_from, date_to, doctor_id),
+        ttl=current_app.config['UTILIZATION_REFRESH_SECONDS'],
+    )
+
+
+def default_range():
+    today = date.today()
+    return today - timedelta(weeks=12), today
@@ -0,0 +1,77 @@
+"""
+Benchmark server-side invoice number allocation under concurrent writers.
+Each writer thread inserts invoices without an invoice_number (single rows
+and small batches), then the run checks the allocated numbers are unique
+and gap-free. Invoices are issued in a far-future year so the run uses its
+own counter row, and everything it creates is deleted afterwards.
+Needs SUPABASE_URL/SUPABASE_KEY of a development database.
+Run: python -m benchmarks.bench_invoice_numbers [--writers 8] [--per-writer 50] [--batch 1]
+"""
+import argparse
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from supabase import create_client
+
+BENCH_YEAR = 2099
+
+
+def _client():
+    return create_client(os.environ['SUPABASE_URL'], os.environ.get('SUPABASE_SERVICE_KEY') or os.environ['SUPABASE_KEY'])
+
+
+def _writer(patient_id, count, batch, created, latencies):
+    supabase = _client()
+    row = {
+        'patient_id': patient_id,
+        'amount': 100,
+        'status': 'cancelled',
+        'issued_date': f'{BENCH_YEAR}-01-01',
+    }
+    for _ in range(0, count, batch):
+        started = time.perf_counter()
+        result = supabase.table('invoices').insert([row] * batch).execute()
+        latencies.append(time.perf_counter() - started)
+        created.extend(inv['invoice_number'] for inv in result.data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--per-writer', type=int, default=50)
+    parser.add_argument('--batch', type=int, default=1, help='rows per INSERT')
+    args = parser.parse_args()
+
+    load_dotenv()
+    supabase = _client()
+    patient_id = supabase.table('patients').select('id').limit(1).execute().data[0]['id']
+
+    created, latencies = [], []
+    threads = [
+        threading.Thread(target=_writer, args=(patient_id, args.per_writer, args.batch, created, latencies))
+        for _ in range(args.writers)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    try:
+        numbers = sorted(int(n.rsplit('-', 1)[1]) for n in created)
+        latencies.sort()
+        print(f'writers={args.writers} batch={args.batch} invoices={len(created)}')
+        print(f'throughput: {len(created) / elapsed:,.0f} invoices/s over {elapsed:.2f}s')
+        print(f'insert latency p50={latencies[len(latencies) // 2] * 1000:.1f}ms '
+              f'p95={latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms')
+        print(f'unique: {len(set(numbers)) == len(numbers)}  '
+              f'gap-free: {numbers == list(range(numbers[0], numbers[0] + len(numbers)))}')
+    finally:
+        supabase.table('invoices').delete().like('invoice_number', f'INV-{BENCH_YEAR}-%').execute()
+        supabase.table('invoice_counters').delete().eq('year', BENCH_YEAR).execute()
+
+
+if __name__ == '__main__':
+    main()
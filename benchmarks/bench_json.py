@@ -0,0 +1,118 @@
+"""
+Benchmark JSON serialization of the largest API payloads.
+Compares Flask's stdlib provider with backend.json_provider.FastJSONProvider
+on synthetic data shaped like the real responses. No database needed.
+Run: python -m benchmarks.bench_json
+"""
+import random
+import timeit
+import uuid
+from datetime import date, datetime, timedelta
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from backend.json_provider import FastJSONProvider, ORJSON_AVAILABLE
+
+FIRST = ['דוד', 'יוסף', 'משה', 'שרה', 'מיכל', 'רחל', 'נועה', 'תמר']
+LAST = ['כהן', 'לוי', 'מזרחי', 'פרץ', 'ביטון', 'אזולאי', 'שפירא', 'רוזנברג']
+SERVICES = ['ייעוץ כללי', 'בדיקת דם', 'א.ק.ג', 'אולטרסאונד', 'מעקב כרוני']
+
+
+def _patient():
+    first, last = random.choice(FIRST), random.choice(LAST)
+    return {
+        'id': str(uuid.uuid4()),
+        'first_name': first,
+        'last_name': last,
+        'full_name': f'{first} {last}',
+        'id_number': f'{random.randint(100000000, 999999999)}',
+        'date_of_birth': date(1950 + random.randint(0, 50), 1, 1),
+        'gender': 'male',
+        'phone': f'052-{random.randint(1000000, 9999999)}',
+        'email': 'patient@example.com',
+        'address': 'רחוב הרצל 10, תל אביב',
+        'created_at': datetime.now(),
+    }
+
+
+def appointments_payload(rows=10, patients=100):
+    now = datetime.now()
+    return {
+        'success': True,
+        'data': {
+            'data': [{
+                'id': str(uuid.uuid4()),
+                'patient_id': str(uuid.uuid4()),
+                'service_id': str(uuid.uuid4()),
+                'doctor_id': str(uuid.uuid4()),
+                'appointment_date': now - timedelta(days=i),
+                'status': 'completed',
+                'notes': 'מטופל במעקב שוטף',
+                'patient_name': 'דוד כהן',
+                'service_name': random.choice(SERVICES),
+            } for i in range(rows)],
+            'total': 5000,
+            'page': 1,
+            'limit': rows,
+            'services': [{'id': str(uuid.uuid4()), 'name': s, 'price': 350.0,
+                          'duration_minutes': 30, 'is_active': True} for s in SERVICES],
+            'patients_list': [_patient() for _ in range(patients)],
+        },
+    }
+
+
+def tasks_payload(tasks=300):
+    statuses = ['open', 'in_progress', 'done']
+    grouped = {s: [] for s in statuses}
+    for i in range(tasks):
+        grouped[statuses[i % 3]].append({
+            'id': str(uuid.uuid4()),
+            'title': 'מעקב תוצאות בדיקות דם דחופות',
+            'description': 'תיאור המשימה: מעקב תוצאות בדיקות דם דחופות',
+            'status': statuses[i % 3],
+            'priority': 'urgent',
+            'due_date': date.today(),
+            'position': i,
+            'users': {'full_name': 'מירב לוי'},
+        })
+    return {'success': True, 'data': {'tasks': grouped, 'users': [
+        {'id': str(uuid.uuid4()), 'full_name': 'ד"ר אבי כהן', 'role': 'doctor'},
+    ]}}
+
+
+def churn_payload(patients=2000):
+    return {'success': True, 'data': [{
+        'patient_id': str(uuid.uuid4()),
+        'patient_name': 'שרה לוי',
+        'last_visit': '2024-01-01',
+        'days_since_last_visit': random.randint(0, 400),
+        'churn_probability': round(random.random() * 100, 1),
+        'risk_level': 'medium',
+    } for _ in range(patients)]}
+
+
+def main():
+    random.seed(42)
+    app = Flask(__name__)
+    providers = {
+        'stdlib': DefaultJSONProvider(app),
+        'fast': FastJSONProvider(app),
+    }
+    payloads = {
+        'appointments list + patients_list': appointments_payload(),
+        'tasks board (300 tasks)': tasks_payload(),
+        'churn list (2000 patients)': churn_payload(),
+    }
+
+    print(f'orjson available: {ORJSON_AVAILABLE}\n')
+    print(f"{'payload':<36}{'provider':<10}{'bytes':>10}{'ms/op':>10}")
+    with app.app_context():
+        for name, payload in payloads.items():
+            for label, provider in providers.items():
+                body = provider.response(payload).get_data()
+                runs = 200
+                seconds = timeit.timeit(lambda: provider.response(payload).get_data(), number=runs)
+                print(f'{name:<36}{label:<10}{len(body):>10}{seconds / runs * 1000:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
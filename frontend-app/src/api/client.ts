@@ -37,3 +37,105 @@ export async function apiFetch<T>(
 
   return data
 }
+
+export interface ChangeEvent<T> {
+  topic: string
+  action: 'insert' | 'update' | 'delete' | 'reorder'
+  id: string
+  row: T
+}
+
+const STREAM_RETRY_MIN_MS = 3000
+const STREAM_RETRY_MAX_MS = 60000
+
+// Read a text/event-stream body, calling onMessage for each complete event
+async function readEventStream(
+  body: ReadableStream<Uint8Array>,
+  onMessage: (event: string, id: string, data: string) => void,
+): Promise<void> {
+  const reader = body.pipeThrough(new TextDecoderStream()).getReader()
+  let buffer = ''
+  for (;;) {
+    const { value, done } = await reader.read()
+    if (done) return
+    buffer += value
+    let end = buffer.indexOf('\n\n')
+    while (end >= 0) {
+      let event = 'message'
+      let id = ''
+      const data: string[] = []
+      for (const line of buffer.slice(0, end).split('\n')) {
+        const colon = line.indexOf(':')
+        if (colon === 0) continue
+        const field = colon < 0 ? line : line.slice(0, colon)
+        const text = colon < 0 ? '' : line.slice(colon + 1).replace(/^ /, '')
+        if (field === 'event') event = text
+        else if (field === 'id') id = text
+        else if (field === 'data') data.push(text)
+      }
+      if (data.length) onMessage(event, id, data.join('\n'))
+      buffer = buffer.slice(end + 2)
+      end = buffer.indexOf('\n\n')
+    }
+  }
+}
+
+function retryAfterMs(header: string | null): number {
+  const seconds = Number(header)
+  if (header && Number.isFinite(seconds)) return seconds * 1000
+  const at = header ? Date.parse(header) : NaN
+  return Number.isNaN(at) ? 0 : Math.max(at - Date.now(), 0)
+}
+
+export function subscribeEvents<T>(
+  topics: string[],
+  onEvent: (event: ChangeEvent<T>) => void,
+): () => void {
+  const controller = new AbortController()
+  let retry: ReturnType<typeof setTimeout> | undefined
+  let lastEventId = ''
+  let failures = 0
+
+  // fetch rather than EventSource: the JWT travels in a header (no ticket
+  // per attempt) and a full worker's 503 and Retry-After are visible here
+  const connect = async () => {
+    let retryAfter = 0
+    try {
+      const headers: Record<string, string> = { Accept: 'text/event-stream' }
+      const token = getToken()
+      if (token) headers['Authorization'] = `Bearer ${token}`
+      if (lastEventId) headers['Last-Event-ID'] = lastEventId
+      const params = new URLSearchParams({ topics: topics.join(',') })
+      const response = await fetch(`${BASE_URL}/api/events/stream?${params}`, {
+        headers,
+        signal: controller.signal,
+      })
+      // An expired session is handled by the next apiFetch call
+      if (response.status === 401) return
+      if (response.ok && response.body) {
+        failures = 0
+        await readEventStream(response.body, (event, id, data) => {
+          lastEventId = id || lastEventId
+          if (topics.includes(event)) onEvent(JSON.parse(data))
+        })
+      } else {
+        retryAfter = retryAfterMs(response.headers.get('Retry-After'))
+      }
+    } catch {
+      // Network error or dropped stream; retried below
+    }
+    if (controller.signal.aborted) return
+
+    // Exponential backoff with jitter, never sooner than the server asked
+    failures += 1
+    const ceiling = Math.min(STREAM_RETRY_MIN_MS * 2 ** (failures - 1), STREAM_RETRY_MAX_MS)
+    const delay = Math.max(retryAfter, ceiling / 2 + Math.random() * ceiling / 2)
+    retry = setTimeout(connect, delay)
+  }
+
+  connect()
+  return () => {
+    controller.abort()
+    clearTimeout(retry)
+  }
+}
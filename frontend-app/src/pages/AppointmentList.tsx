@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react'
-import { apiFetch } from '../api/client'
+import { apiFetch, subscribeEvents } from '../api/client'
 import { useToast } from '../components/Toast'
 import Header from '../components/Header'
 import Modal from '../components/Modal'
@@ -43,6 +43,13 @@ export default function AppointmentList() {
 
   useEffect(() => { fetchData() }, [page, search, statusFilter])
 
+  // Patch visible rows in place; inserts only matter if they land on this page
+  useEffect(() => subscribeEvents<Appointment>(['appointments'], ({ action, id, row }) => {
+    if (action === 'delete') { setItems((prev) => prev.filter((a) => a.id !== id)); return }
+    if (action === 'update') { setItems((prev) => prev.map((a) => (a.id === id ? { ...a, ...row } : a))); return }
+    if (page === 1 && !search) fetchData()
+  }), [page, search, statusFilter])
+
   const openCreate = () => { setEditItem(null); setForm({ patient_id: '', service_id: '', appointment_date: '', status: 'scheduled', notes: '' }); setModalOpen(true) }
   const openEdit = (a: Appointment) => { setEditItem(a); setForm({ patient_id: a.patient_id, service_id: a.service_id, appointment_date: a.appointment_date?.slice(0, 16) || '', status: a.status, notes: a.notes || '' }); setModalOpen(true) }
 
@@ -100,7 +107,14 @@ export default function AppointmentList() {
                   <td className="px-6 py-4 font-medium text-gray-800">{a.patient_name || '-'}</td>
                   <td className="px-6 py-4 text-gray-600">{a.service_name || '-'}</td>
                   <td className="px-6 py-4 text-gray-600">{a.appointment_date ? formatDate(a.appointment_date) : '-'}</td>
-                  <td className="px-6 py-4">{a.status}</td>
+                  <td className="px-6 py-4">
+                    {a.status}
+                    {a.status === 'scheduled' && a.no_show_risk != null && a.no_show_risk >= 0.3 && (
+                      <span title="סיכון לאי-הגעה" className={`mr-2 px-2 py-0.5 rounded-full text-xs ${a.no_show_risk >= 0.5 ? 'bg-red-100 text-red-700' : 'bg-amber-100 text-amber-700'}`}>
+                        {Math.round(a.no_show_risk * 100)}%
+                      </span>
+                    )}
+                  </td>
                   <td className="px-6 py-4">
                     <div className="flex gap-2">
                       <button onClick={() => openEdit(a)} className="text-gray-400 hover:text-primary"><span className="material-symbols-outlined text-lg">edit</span></button>
@@ -1,12 +1,12 @@
-import { useState, useEffect } from 'react'
-import { apiFetch } from '../api/client'
+import { useState, useEffect, useRef } from 'react'
+import { apiFetch, subscribeEvents } from '../api/client'
 import { useToast } from '../components/Toast'
 import Header from '../components/Header'
 import Modal from '../components/Modal'
 import type { Task, ApiResponse } from '../types'
 
 const columns = [
-  { status: 'todo', label: 'לביצוע', color: 'border-t-gray-400' },
+  { status: 'open', label: 'לביצוע', color: 'border-t-gray-400' },
   { status: 'in_progress', label: 'בתהליך', color: 'border-t-primary' },
   { status: 'done', label: 'הושלם', color: 'border-t-success' },
 ]
@@ -19,26 +19,91 @@ const priorityColors: Record<string, string> = {
 
 interface TasksData {
   tasks: Record<string, Task[]>
+  counts: Record<string, number>
+  has_more: Record<string, boolean>
   users: Array<{ id: string; full_name: string }>
 }
 
+interface ColumnPage {
+  tasks: Task[]
+  has_more: boolean
+}
+
+const findTask = (tasks: Record<string, Task[]>, id: string) =>
+  Object.values(tasks).flat().find((t) => t.id === id)
+
 export default function KanbanBoard() {
   const [tasks, setTasks] = useState<Record<string, Task[]>>({})
+  const [counts, setCounts] = useState<Record<string, number>>({})
+  const [hasMore, setHasMore] = useState<Record<string, boolean>>({})
   const [users, setUsers] = useState<Array<{ id: string; full_name: string }>>([])
   const [modalOpen, setModalOpen] = useState(false)
   const [editItem, setEditItem] = useState<Task | null>(null)
-  const [form, setForm] = useState({ title: '', description: '', priority: 'medium', assigned_to: '', status: 'todo' })
+  const [form, setForm] = useState({ title: '', description: '', priority: 'medium', assigned_to: '', status: 'open' })
   const { showToast } = useToast()
+  // The event handler is registered once; it reads the latest board here
+  const board = useRef({ tasks, hasMore })
+  board.current = { tasks, hasMore }
 
   const fetchData = () => {
     apiFetch<ApiResponse<TasksData>>('/api/tasks/').then((res) => {
-      if (res.data) { setTasks(res.data.tasks); setUsers(res.data.users) }
+      if (res.data) {
+        setTasks(res.data.tasks); setCounts(res.data.counts); setHasMore(res.data.has_more); setUsers(res.data.users)
+      }
     })
   }
 
   useEffect(() => { fetchData() }, [])
 
-  const openCreate = () => { setEditItem(null); setForm({ title: '', description: '', priority: 'medium', assigned_to: '', status: 'todo' }); setModalOpen(true) }
+  const loadMore = async (status: string) => {
+    const loaded = tasks[status] || []
+    const after = loaded.length ? loaded[loaded.length - 1].rank : ''
+    try {
+      const res = await apiFetch<ApiResponse<ColumnPage>>(`/api/tasks/column/${status}?after=${encodeURIComponent(after)}`)
+      if (!res.data) return
+      const page = res.data
+      setTasks((prev) => {
+        const seen = new Set((prev[status] || []).map((t) => t.id))
+        return { ...prev, [status]: [...(prev[status] || []), ...page.tasks.filter((t) => !seen.has(t.id))] }
+      })
+      setHasMore((prev) => ({ ...prev, [status]: page.has_more }))
+    } catch (err) { showToast(err instanceof Error ? err.message : 'שגיאה', 'danger') }
+  }
+
+  useEffect(() => subscribeEvents<Task>(['tasks'], ({ action, id, row }) => {
+    const existing = findTask(board.current.tasks, id)
+    // Reorder events carry only id/status/rank; a card we never loaded
+    // has nothing to merge them into
+    if (action === 'reorder' && !existing) return
+
+    // Column totals: an unloaded card's old column is unknown, so only
+    // inserts, and changes to loaded cards, move the counts
+    const from = action === 'insert' ? undefined : existing?.status
+    const to = action === 'delete' ? undefined : row.status
+    if (from !== to && (action === 'insert' || existing)) {
+      setCounts((prev) => {
+        const next = { ...prev }
+        if (from) next[from] = Math.max((next[from] || 0) - 1, 0)
+        if (to) next[to] = (next[to] || 0) + 1
+        return next
+      })
+    }
+
+    setTasks((prev) => {
+      const next: Record<string, Task[]> = {}
+      for (const [status, list] of Object.entries(prev)) next[status] = list.filter((t) => t.id !== id)
+      if (action === 'delete') return next
+      const merged = { ...existing, ...row } as Task
+      const column = next[merged.status] || []
+      // Past the last loaded card of a paged column it arrives with "load more"
+      const last = column[column.length - 1]
+      if (board.current.hasMore[merged.status] && last && merged.rank > last.rank) return next
+      next[merged.status] = [...column, merged].sort((a, b) => (a.rank < b.rank ? -1 : 1))
+      return next
+    })
+  }), [])
+
+  const openCreate = () => { setEditItem(null); setForm({ title: '', description: '', priority: 'medium', assigned_to: '', status: 'open' }); setModalOpen(true) }
   const openEdit = (t: Task) => { setEditItem(t); setForm({ title: t.title, description: t.description || '', priority: t.priority, assigned_to: t.assigned_to || '', status: t.status }); setModalOpen(true) }
 
   const handleSubmit = async (e: React.FormEvent) => {
@@ -81,7 +146,7 @@ export default function KanbanBoard() {
             <div key={col.status} className={`bg-white rounded-xl shadow-sm border border-gray-100 border-t-4 ${col.color}`}>
               <div className="p-4 border-b border-gray-100">
                 <h3 className="font-bold text-gray-800">{col.label}</h3>
-                <span className="text-xs text-gray-400">{(tasks[col.status] || []).length} משימות</span>
+                <span className="text-xs text-gray-400">{counts[col.status] ?? (tasks[col.status] || []).length} משימות</span>
               </div>
               <div className="p-3 space-y-3 min-h-[200px]">
                 {(tasks[col.status] || []).map((task) => (
@@ -93,13 +158,13 @@ export default function KanbanBoard() {
                     {task.description && <p className="text-xs text-gray-500 mb-3">{task.description}</p>}
                     <div className="flex items-center justify-between">
                       <div className="flex gap-1">
-                        {col.status !== 'todo' && (
-                          <button onClick={() => moveTask(task.id, col.status === 'done' ? 'in_progress' : 'todo')} className="text-gray-400 hover:text-primary" title="הזז שמאלה">
+                        {col.status !== 'open' && (
+                          <button onClick={() => moveTask(task.id, col.status === 'done' ? 'in_progress' : 'open')} className="text-gray-400 hover:text-primary" title="הזז שמאלה">
                             <span className="material-symbols-outlined text-lg">arrow_forward</span>
                           </button>
                         )}
                         {col.status !== 'done' && (
-                          <button onClick={() => moveTask(task.id, col.status === 'todo' ? 'in_progress' : 'done')} className="text-gray-400 hover:text-success" title="הזז ימינה">
+                          <button onClick={() => moveTask(task.id, col.status === 'open' ? 'in_progress' : 'done')} className="text-gray-400 hover:text-success" title="הזז ימינה">
                             <span className="material-symbols-outlined text-lg">arrow_back</span>
                           </button>
                         )}
@@ -111,6 +176,9 @@ export default function KanbanBoard() {
                     </div>
                   </div>
                 ))}
+                {hasMore[col.status] && (
+                  <button onClick={() => loadMore(col.status)} className="w-full text-sm text-primary hover:underline py-2">טען עוד</button>
+                )}
               </div>
             </div>
           ))}
@@ -127,7 +195,7 @@ export default function KanbanBoard() {
             <option value="">לא מוקצה</option>{users.map((u) => <option key={u.id} value={u.id}>{u.full_name}</option>)}
           </select>
           <select value={form.status} onChange={(e) => setForm({ ...form, status: e.target.value })} className="w-full px-4 py-2.5 border border-gray-200 rounded-lg text-sm">
-            <option value="todo">לביצוע</option><option value="in_progress">בתהליך</option><option value="done">הושלם</option>
+            <option value="open">לביצוע</option><option value="in_progress">בתהליך</option><option value="done">הושלם</option>
           </select>
           <button type="submit" className="w-full bg-primary text-white py-2.5 rounded-lg text-sm font-medium hover:bg-primary/90">{editItem ? 'עדכן' : 'צור'}</button>
         </form>
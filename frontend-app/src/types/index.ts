@@ -46,6 +46,7 @@ export interface Appointment {
   notes: string
   patient_name?: string
   service_name?: string
+  no_show_risk?: number | null
 }
 
 export interface Invoice {
@@ -64,10 +65,11 @@ export interface Task {
   id: string
   title: string
   description: string
-  status: 'todo' | 'in_progress' | 'done'
+  status: 'open' | 'in_progress' | 'done'
   priority: 'low' | 'medium' | 'high'
   assigned_to: string
   position: number
+  rank: string
   created_at: string
 }
 
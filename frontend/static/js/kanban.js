@@ -13,7 +13,8 @@ document.addEventListener('DOMContentLoaded', () => {
             onEnd: async (evt) => {
                 const taskId = evt.item.dataset.taskId;
                 const newStatus = evt.to.dataset.status;
-                const newIndex = evt.newIndex;
+                const prev = evt.item.previousElementSibling;
+                const next = evt.item.nextElementSibling;
 
                 try {
                     await fetch(`/api/tasks/${taskId}/status`, {
@@ -21,7 +22,8 @@ document.addEventListener('DOMContentLoaded', () => {
                         headers: { 'Content-Type': 'application/json' },
                         body: JSON.stringify({
                             status: newStatus,
-                            position: newIndex,
+                            prev_id: prev ? prev.dataset.taskId : null,
+                            next_id: next ? next.dataset.taskId : null,
                         }),
                     });
                 } catch (e) {
@@ -2,7 +2,9 @@ import os
 
 bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
 workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
-threads = int(os.environ.get('WEB_THREADS', '4'))
+# Each open SSE stream holds a mostly idle thread, so there are enough for one
+# per open dashboard; EVENTS_MAX_STREAMS keeps EVENTS_RESERVED_THREADS free
+threads = int(os.environ.get('WEB_THREADS', '16'))
 timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
 graceful_timeout = 30
 accesslog = '-'
@@ -10,3 +12,9 @@ errorlog = '-'
 loglevel = os.environ.get('LOG_LEVEL', 'info')
 preload_app = True
 worker_class = 'gthread'
+
+
+def post_worker_init(worker):
+    # Background threads must start after the fork (preload_app)
+    from backend import scheduler
+    scheduler.start(worker.wsgi)
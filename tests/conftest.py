@@ -1,6 +1,8 @@
 """
 Shared fixtures for CRM Doctor E2E tests.
-Uses real Supabase database — no mocking.
+The CRUD and database tests use the real Supabase database. Route tests
+that patch the service layer authenticate with doctor_headers /
+secretary_headers, which need no database.
 """
 import os
 import uuid
@@ -75,6 +77,25 @@ def secretary_client(app, secretary_user):
     return c
 
 
+def _bearer_headers(app, role):
+    from backend.middleware.jwt_middleware import create_token
+    user = {'id': str(uuid.uuid4()), 'email': f'{role}@test.local', 'full_name': role, 'role': role}
+    with app.app_context():
+        return {'Authorization': f'Bearer {create_token(user)}'}
+
+
+@pytest.fixture(scope='session')
+def doctor_headers(app):
+    """Bearer headers for the API as a doctor (a signed token, no DB lookup)."""
+    return _bearer_headers(app, 'doctor')
+
+
+@pytest.fixture(scope='session')
+def secretary_headers(app):
+    """Bearer headers for the API as a secretary."""
+    return _bearer_headers(app, 'secretary')
+
+
 @pytest.fixture(scope='session')
 def sample_patient_id(supabase_client):
     """Get an existing patient ID from seed data."""
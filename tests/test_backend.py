@@ -4,9 +4,18 @@ Authentication, RBAC, CRUD for all entities, dashboard, churn, RAG chat.
 """
 import json
 import uuid
+from datetime import date, datetime, time, timedelta
+import numpy as np
 import pytest
 from unittest.mock import patch, MagicMock
 from backend.services.chat_service import validate_sql, BLOCKED_PATTERNS
+from backend.services import import_service
+from backend.services.lexorank import rank_between, spread_ranks
+from backend.services.availability_service import ScheduleIndex
+from backend.services.series_service import expand_occurrences
+from backend.services.calendar_service import week_start
+from backend.services.utilization_service import compute_utilization
+from backend.services import churn_service, churn_training, forecast_service, no_show_service
 
 pytestmark = pytest.mark.backend
 
@@ -722,3 +731,1237 @@ class TestErrorHandling:
         FIX APPLIED: Added try/except in patients detail route."""
         resp = doctor_client.get('/patients/not-a-uuid', follow_redirects=True)
         assert resp.status_code == 200  # Redirects to patients list with flash message
+
+
+# ============================================================
+# 2.11 Patient Import Normalization
+# ============================================================
+
+class TestImportNormalization:
+    """Test CSV row normalization for bulk patient import (no DB needed)."""
+
+    def test_id_number_zero_padded(self):
+        """Short ID numbers are zero-padded to 9 digits."""
+        assert import_service.normalize_id_number('18') == '000000018'
+
+    def test_id_number_bad_checksum(self):
+        """ID number with a wrong check digit is rejected."""
+        assert import_service.normalize_id_number('123456789') is None
+
+    def test_phone_international_prefix(self):
+        """+972 mobile numbers are normalized to 05X-XXXXXXX."""
+        assert import_service.normalize_phone('+972-52-1234567') == '052-1234567'
+
+    def test_date_formats(self):
+        """Israeli DD/MM/YYYY dates are converted to ISO."""
+        assert import_service.normalize_date('01/02/1980') == '1980-02-01'
+        assert import_service.normalize_date('1980-02-01') == '1980-02-01'
+        assert import_service.normalize_date('not a date') is None
+
+    def test_hebrew_headers_and_gender(self):
+        """Hebrew column headers and gender values are mapped."""
+        record, error = import_service.normalize_row({
+            'שם פרטי': 'דוד', 'שם משפחה': 'כהן', 'ת.ז': '000000018', 'מין': 'ז',
+        })
+        assert error is None
+        assert record['first_name'] == 'דוד'
+        assert record['gender'] == 'male'
+
+    def test_missing_name_rejected(self):
+        """Rows without a first or last name are rejected."""
+        record, error = import_service.normalize_row({'first_name': '', 'last_name': 'כהן', 'id_number': '18'})
+        assert record is None
+        assert error
+
+    def test_error_keeps_id_with_hebrew_headers(self):
+        """Error events carry the id number even when the header is Hebrew."""
+        lines = ['שם פרטי,שם משפחה,תעודת זהות,טלפון\n', 'דוד,כהן, 18 ,abc\n']
+        with patch.object(import_service, 'get_supabase'):
+            events = list(import_service.import_patients(lines))
+        assert events[0]['type'] == 'error'
+        assert events[0]['id_number'] == '18'
+
+
+# ============================================================
+# 2.12 Kanban Rank Keys
+# ============================================================
+
+class TestRankKeys:
+    """Test fractional rank key generation (no DB needed)."""
+
+    def test_rank_between_bounds(self):
+        """Generated key sorts strictly between its neighbours."""
+        key = rank_between('V', 'W')
+        assert 'V' < key < 'W'
+
+    def test_rank_at_edges(self):
+        """Keys can be generated before the first and after the last card."""
+        assert rank_between(None, '1') < '1'
+        assert rank_between('z', None) > 'z'
+
+    def test_rank_rejects_inverted_neighbours(self):
+        """Out-of-order neighbours raise ValueError."""
+        with pytest.raises(ValueError):
+            rank_between('W', 'V')
+
+    def test_repeated_inserts_stay_ordered(self):
+        """Many inserts at random positions keep the list sorted."""
+        import random
+        rnd = random.Random(7)
+        keys = [rank_between()]
+        for _ in range(500):
+            i = rnd.randint(0, len(keys))
+            before = keys[i - 1] if i > 0 else None
+            after = keys[i] if i < len(keys) else None
+            keys.insert(i, rank_between(before, after))
+        assert keys == sorted(keys)
+        assert len(set(keys)) == len(keys)
+
+    def test_spread_ranks_sorted_and_equal_length(self):
+        """Rebalanced keys are ascending and share one length."""
+        keys = spread_ranks(1000)
+        assert keys == sorted(keys)
+        assert len({len(k) for k in keys}) == 1
+
+    def test_rebalance_reads_past_one_page(self):
+        """A column longer than one PostgREST page is rebalanced in full."""
+        from backend.services import task_service
+        ids = [f'task-{n}' for n in range(task_service.PAGE_SIZE + 5)]
+        query = MagicMock()
+        for method in ('select', 'eq', 'order', 'range'):
+            getattr(query, method).return_value = query
+        query.execute.side_effect = [
+            MagicMock(data=[{'id': i} for i in ids[:task_service.PAGE_SIZE]]),
+            MagicMock(data=[{'id': i} for i in ids[task_service.PAGE_SIZE:]]),
+        ]
+        supabase = MagicMock()
+        supabase.table.return_value = query
+        with patch.object(task_service, 'get_supabase', return_value=supabase), \
+                patch.object(task_service, 'reorder_tasks', return_value=len(ids)) as reorder:
+            task_service.rebalance_column('open')
+        reorder.assert_called_once_with('open', ids)
+        assert query.range.call_args_list[1].args == (task_service.PAGE_SIZE, 2 * task_service.PAGE_SIZE - 1)
+
+
+# ============================================================
+# 2.13 Availability Index
+# ============================================================
+
+class TestScheduleIndex:
+    """Test busy-interval bookkeeping and free-slot search (no DB needed)."""
+
+    DAY = date(2026, 3, 1)
+    HOURS = [(time(8, 0), time(12, 0))]
+
+    def _at(self, hh, mm=0):
+        return datetime.combine(self.DAY, time(hh, mm))
+
+    def test_is_free_respects_busy_intervals(self):
+        """Overlapping ranges are busy; touching ranges are free."""
+        idx = ScheduleIndex()
+        idx.upsert('a1', 'doc', self._at(9), self._at(9, 30))
+        assert not idx.is_free('doc', self._at(9, 15), self._at(9, 45))
+        assert not idx.is_free('doc', self._at(8, 45), self._at(9, 15))
+        assert idx.is_free('doc', self._at(9, 30), self._at(10))
+        assert idx.is_free('doc', self._at(8, 30), self._at(9))
+        assert idx.is_free('other', self._at(9), self._at(9, 30))
+
+    def test_free_slots_skip_busy_time(self):
+        """Slots never overlap an appointment and stay inside working hours."""
+        idx = ScheduleIndex()
+        idx.upsert('a1', 'doc', self._at(8, 10), self._at(9))
+        idx.upsert('a2', 'doc', self._at(10), self._at(11, 50))
+        slots = idx.free_slots('doc', self.DAY, self.HOURS, 30, 15)
+        assert [s for s, _ in slots] == [self._at(9), self._at(9, 15), self._at(9, 30)]
+
+    def test_upsert_moves_and_remove_frees(self):
+        """Rescheduling replaces the old interval; removing frees it."""
+        idx = ScheduleIndex()
+        idx.upsert('a1', 'doc', self._at(9), self._at(10))
+        idx.upsert('a1', 'doc', self._at(11), self._at(12))
+        assert idx.is_free('doc', self._at(9), self._at(10))
+        assert not idx.is_free('doc', self._at(11), self._at(11, 30))
+        idx.remove('a1')
+        assert idx.is_free('doc', self._at(11), self._at(12))
+
+    def test_not_before_aligns_to_step(self):
+        """Search starting mid-morning begins at the next aligned slot."""
+        idx = ScheduleIndex()
+        slots = idx.free_slots('doc', self.DAY, self.HOURS, 60, 15, not_before=self._at(10, 7))
+        assert slots[0][0] == self._at(10, 15)
+        assert slots[-1][1] == self._at(12)
+
+    def test_days_after_horizon_read_from_db(self, app):
+        """Days past the index window come from a direct query, not the empty index."""
+        from backend.services import availability_service
+        today = date.today()
+        covered_until = today + timedelta(days=3)
+        beyond = ScheduleIndex()
+        far = covered_until + timedelta(days=(7 - covered_until.weekday()) % 7)   # a Monday
+        beyond.upsert('a1', 'doc', datetime.combine(far, time(8)), datetime.combine(far, time(17)))
+        with app.app_context(), \
+                patch.object(availability_service, 'get_index', return_value=ScheduleIndex()), \
+                patch.object(availability_service, '_window', (today - timedelta(days=1), covered_until)), \
+                patch.object(availability_service, '_build', return_value=beyond) as build:
+            slots = availability_service.find_free_slots(far, far, 30, doctor_id='doc')
+        build.assert_called_once_with(far, far + timedelta(days=1))
+        assert slots['doc'][0]['start'] == datetime.combine(far, time(17)).isoformat()
+
+    def test_events_during_rebuild_are_kept(self, app):
+        """A booking made while the index is being read from the DB is not lost."""
+        from backend.services import availability_service, catalog_service, event_service
+        start = datetime.combine(date.today() + timedelta(days=1), time(9))
+        event = {'action': 'insert', 'row_id': 'a1', 'payload': {
+            'id': 'a1', 'doctor_id': 'doc', 'service_id': 's1',
+            'appointment_date': start.isoformat(), 'status': 'scheduled'}}
+
+        def build(*window):
+            # The snapshot was read before the booking committed
+            availability_service._on_appointment_event(event)
+            return ScheduleIndex()
+
+        with app.app_context(), \
+                patch.object(availability_service, '_index', None), \
+                patch.object(availability_service, '_listening', True), \
+                patch.object(availability_service, '_build', side_effect=build), \
+                patch.object(catalog_service, 'get_service_durations', return_value={'s1': 30}), \
+                patch.object(event_service, 'ensure_poller'):
+            index = availability_service.get_index()
+        assert not index.is_free('doc', start, start + timedelta(minutes=30))
+        assert availability_service._pending == []
+
+    def test_week_view_for_all_doctors_is_fast(self, app):
+        """A full week of free slots for every doctor takes well under 50 ms."""
+        import time as clock
+        from backend.services import availability_service
+        today = date.today()
+        doctors = [f'doc-{n}' for n in range(20)]
+        idx = ScheduleIndex()
+        for n, doctor in enumerate(doctors):
+            for offset in range(1, 8):
+                day = today + timedelta(days=offset)
+                for slot in range(12):
+                    start = datetime.combine(day, time(8)) + timedelta(minutes=45 * slot + n % 3 * 5)
+                    idx.upsert(f'{doctor}-{offset}-{slot}', doctor, start, start + timedelta(minutes=30))
+        timings = []
+        with app.app_context(), \
+                patch.object(availability_service, 'get_index', return_value=idx), \
+                patch.object(availability_service, 'get_doctor_ids', return_value=doctors), \
+                patch.object(availability_service, '_window', (today - timedelta(days=1), today + timedelta(days=30))):
+            for _ in range(5):
+                started = clock.perf_counter()
+                result = availability_service.find_free_slots(today + timedelta(days=1), today + timedelta(days=7), 30)
+                timings.append(clock.perf_counter() - started)
+        assert set(result) == set(doctors)
+        assert min(timings) < 0.05
+
+
+# ============================================================
+# 2.14 Recurring Series Expansion
+# ============================================================
+
+class TestSeriesExpansion:
+    """Test RRULE expansion for appointment series (no DB needed)."""
+
+    START = datetime(2026, 1, 4, 10, 0)
+    UNTIL = datetime(2027, 1, 4, 10, 0)
+
+    def test_biweekly_year_of_follow_ups(self):
+        """Every two weeks for a year yields 27 occurrences at the same time."""
+        dates = expand_occurrences('FREQ=WEEKLY;INTERVAL=2', self.START, self.UNTIL, 120)
+        assert len(dates) == 27
+        assert dates[0] == self.START
+        assert all(d.time() == self.START.time() for d in dates)
+        assert all((b - a).days == 14 for a, b in zip(dates, dates[1:]))
+
+    def test_count_and_byday(self):
+        """COUNT limits the series and BYDAY picks the weekdays."""
+        dates = expand_occurrences('RRULE:FREQ=WEEKLY;BYDAY=SU,WE;COUNT=4', self.START, self.UNTIL, 120)
+        assert [d.weekday() for d in dates] == [6, 2, 6, 2]
+
+    def test_horizon_caps_open_rules(self):
+        """A rule without COUNT/UNTIL stops at the horizon."""
+        until = self.START.replace(month=2)
+        dates = expand_occurrences('FREQ=WEEKLY', self.START, until, 120)
+        assert dates[-1] <= until
+
+    def test_invalid_rules_rejected(self):
+        """Unparsable rules and rules over the limit raise ValueError."""
+        with pytest.raises(ValueError):
+            expand_occurrences('FREQ=SOMETIMES', self.START, self.UNTIL, 120)
+        with pytest.raises(ValueError):
+            expand_occurrences('FREQ=DAILY', self.START, self.UNTIL, 120)
+
+    def test_following_edit_is_one_call_on_original_dates(self):
+        """Shift and patch go to one RPC; a clash is re-checked from the original date."""
+        from postgrest.exceptions import APIError
+        from backend.services import appointment_service, series_service
+        supabase = MagicMock()
+        supabase.rpc.return_value.execute.side_effect = [
+            APIError({'message': 'conflicting key value', 'code': appointment_service.EXCLUSION_VIOLATION}),
+            MagicMock(data=[{'start': '2026-01-11T09:00:00'}]),
+        ]
+        query = supabase.table.return_value.select.return_value
+        for method in ('eq', 'gte', 'order'):
+            getattr(query, method).return_value = query
+        query.execute.return_value.data = [
+            {'doctor_id': 'd1', 'service_id': 's1', 'appointment_date': '2026-01-11T10:00:00'}]
+        with patch.object(series_service, 'get_supabase', return_value=supabase), \
+                pytest.raises(appointment_service.AppointmentConflict):
+            series_service.update_following('series-1', '2026-01-11T10:00:00', {'notes': 'x'}, -60)
+        update = supabase.rpc.call_args_list[0]
+        assert update.args == ('update_series_following', {
+            'p_series_id': 'series-1', 'p_from': '2026-01-11T10:00:00', 'p_minutes': -60, 'p_patch': {'notes': 'x'}})
+        query.gte.assert_called_once_with('appointment_date', '2026-01-11T10:00:00')
+        assert supabase.rpc.call_args_list[1].args[1]['p_starts'] == ['2026-01-11T09:00:00']
+
+
+# ============================================================
+# 2.15 Calendar Weeks
+# ============================================================
+
+class TestCalendarWeeks:
+    """Test week bucketing for the calendar cache (no DB needed)."""
+
+    def test_week_starts_on_sunday(self):
+        """Every day of a week maps to the Sunday that opens it."""
+        sunday = date(2026, 11, 1)
+        for day in range(1, 8):
+            assert week_start(date(2026, 11, day)) == sunday
+
+    def test_saturday_belongs_to_previous_sunday(self):
+        """Saturday closes the week; the next day starts a new one."""
+        assert week_start(date(2026, 11, 7)) == date(2026, 11, 1)
+        assert week_start(date(2026, 11, 8)) == date(2026, 11, 8)
+
+
+# ============================================================
+# 2.16 Utilization Analytics
+# ============================================================
+
+class TestUtilization:
+    """Test the vectorized utilization / no-show aggregation (no DB needed)."""
+
+    HOURS = {6: [('08:00', '18:00')], 0: [('08:00', '18:00')]}   # Sun + Mon, 20h/week
+
+    def _facts(self, rows):
+        epoch = datetime(1970, 1, 1)
+        return {
+            'doctor_id': [r[0] for r in rows],
+            'start': [int((r[1] - epoch).total_seconds()) for r in rows],
+            'minutes': [r[2] for r in rows],
+            'status': [r[3] for r in rows],
+            'cancel_lead_minutes': [r[4] for r in rows],
+        }
+
+    def test_booked_minutes_and_rates(self):
+        """Utilization counts busy minutes; no-show rate uses past outcomes."""
+        facts = self._facts([
+            ('doc', datetime(2026, 3, 1, 9), 60, 'completed', None),
+            ('doc', datetime(2026, 3, 1, 10), 60, 'no_show', None),
+            ('doc', datetime(2026, 3, 2, 9), 60, 'scheduled', None),
+            ('doc', datetime(2026, 3, 2, 11), 30, 'cancelled', 120),
+            ('doc', datetime(2026, 3, 2, 12), 30, 'cancelled', 3000),
+        ])
+        report = compute_utilization(facts, date(2026, 3, 1), date(2026, 3, 7), self.HOURS)
+        doc = report['doctors'][0]
+        assert report['weeks'] == ['2026-03-01']
+        assert doc['booked_minutes'] == 120
+        assert doc['utilization'] == round(120 / 1200, 4)
+        assert doc['no_show_rate'] == 0.5
+        assert doc['cancellations'] == 2
+        assert doc['late_cancel_rate'] == 0.5
+
+    def test_heatmap_cells(self):
+        """Appointments land in their weekday/hour cell (rows start Sunday)."""
+        facts = self._facts([('doc', datetime(2026, 3, 2, 9, 30), 30, 'completed', None)])
+        report = compute_utilization(facts, date(2026, 3, 1), date(2026, 3, 7), self.HOURS)
+        booked = report['heatmap']['booked']
+        assert booked[1][9] == 1   # Monday row, 09:00 column
+        assert sum(map(sum, booked)) == 1
+
+    def test_empty_range(self):
+        """No appointments yields empty doctors and zeroed weeks."""
+        facts = self._facts([])
+        report = compute_utilization(facts, date(2026, 3, 1), date(2026, 3, 14), self.HOURS)
+        assert report['doctors'] == []
+        assert report['available_minutes_per_week'] == [1200.0, 1200.0]
+
+
+# ============================================================
+# 2.17 No-show Scoring
+# ============================================================
+
+class TestNoShowScoring:
+    """Test no-show feature building and scoring (no DB needed)."""
+
+    def _facts(self, rows):
+        keys = ('id', 'label', 'prior_visits', 'prior_no_shows', 'lead_days', 'weekday', 'hour', 'service_id')
+        return {key: [r[i] for r in rows] for i, key in enumerate(keys)}
+
+    def test_feature_matrix(self):
+        """One-hots land in the right columns; unknown services stay zero."""
+        facts = self._facts([
+            ('a', 0, 3, 1, 7.0, 0, 9, 'svc1'),
+            ('b', 0, 0, 0, 0.0, 4, 15, 'other'),
+        ])
+        X = no_show_service.build_features(facts, ['svc1'], 0.1)
+        assert X.shape == (2, 35)
+        assert X[0, 3] == 1 and X[0, 10 + 9] == 1 and X[0, 34] == 1
+        assert X[1, 3 + 4] == 1 and X[1, 10 + 15] == 1 and X[1, 34] == 0
+        assert X[0, 1] == pytest.approx((1 + 3 * 0.1) / (3 + 3))
+
+    def test_heuristic_with_little_history(self):
+        """Too few labelled outcomes falls back to the smoothed patient rate."""
+        history = self._facts([('h', 1, 0, 0, 1.0, 1, 10, 's'), ('h2', 0, 0, 0, 1.0, 1, 10, 's')])
+        upcoming = self._facts([('u1', None, 4, 4, 2.0, 2, 9, 's'), ('u2', None, 4, 0, 2.0, 2, 9, 's')])
+        scores, method = no_show_service.score(history, upcoming)
+        assert method == 'heuristic'
+        assert scores[0] > scores[1]
+
+    def test_model_ranks_repeat_no_shows_higher(self):
+        """With enough history the model learns that past no-shows predict more."""
+        rows = []
+        for i in range(200):
+            flaky = i % 2 == 0
+            rows.append((str(i), int(flaky and i % 3 != 0), 5, 4 if flaky else 0, 10.0, 1, 10, 's'))
+        upcoming = self._facts([('u1', None, 5, 4, 10.0, 1, 10, 's'), ('u2', None, 5, 0, 10.0, 1, 10, 's')])
+        scores, method = no_show_service.score(self._facts(rows), upcoming)
+        assert method == 'model'
+        assert scores[0] > 0.5 > scores[1]
+
+    def test_failed_run_releases_day(self, app):
+        """If scoring fails the day's claim is released so a later tick retries."""
+        from backend import scheduler
+        with app.app_context(), \
+                patch.dict(app.config, {'NO_SHOW_SCORE_HOUR': 0}), \
+                patch.object(no_show_service, 'score_upcoming', side_effect=RuntimeError('db down')), \
+                patch.object(scheduler, 'claim_daily', return_value=True), \
+                patch.object(scheduler, 'release_daily') as release, \
+                patch.object(scheduler, 'finish_daily') as finish:
+            with pytest.raises(RuntimeError):
+                no_show_service.nightly_score()
+        release.assert_called_once_with('score_no_shows')
+        finish.assert_not_called()
+
+
+# ============================================================
+# 2.18 Revenue Forecast
+# ============================================================
+
+class TestRevenueForecast:
+    """Test the ridge revenue forecast on synthetic history (no DB needed)."""
+
+    START = date(2025, 1, 5)   # a Sunday
+
+    def _history(self, days):
+        # 1000 on weekdays, closed Saturdays, plus a small deterministic wobble
+        return [0.0 if (self.START.toordinal() + i) % 7 == 6 else 1000.0 + (i % 5) * 10 for i in range(days)]
+
+    def test_not_enough_history(self):
+        """Less than MIN_HISTORY_DAYS of data yields no forecast."""
+        assert forecast_service.fit_forecast(self.START, self._history(30), 3, date(2025, 2, 4)) is None
+
+    def test_weekly_pattern_and_horizon(self):
+        """Forecast runs through the last requested month and keeps closed days near zero."""
+        today = self.START + timedelta(days=120)
+        report = forecast_service.fit_forecast(self.START, self._history(120), 2, today)
+        days = report['days']
+        assert days['dates'][0] == today.isoformat()
+        assert days['dates'][-1] == '2025-07-31'
+        assert [m['month'] for m in report['months']] == ['2025-05', '2025-06', '2025-07']
+        for d, value, lower, upper in zip(days['dates'], days['forecast'], days['lower'], days['upper']):
+            assert lower <= value <= upper
+            expected = 0 if date.fromisoformat(d).weekday() == 5 else 1000
+            assert abs(value - expected) < 100
+
+    def test_current_month_includes_paid_to_date(self):
+        """The current month's total adds revenue already paid this month."""
+        today = date(2025, 5, 10)
+        history = self._history((today - self.START).days)
+        report = forecast_service.fit_forecast(self.START, history, 1, today)
+        current = report['months'][0]
+        assert current['month'] == '2025-05'
+        assert current['actual_to_date'] == round(sum(history[-9:]), 2)
+        assert current['lower'] <= current['forecast'] <= current['upper']
+
+    def _refit(self, app, days_with_revenue):
+        # get_daily_totals zero-fills the whole window, like the real RPC
+        window = app.config['FORECAST_HISTORY_DAYS']
+        start = date.today() - timedelta(days=window)
+        totals = [0.0] * (window - days_with_revenue) + self._history(days_with_revenue)
+        buckets = [(start + timedelta(days=i)).isoformat() for i in range(window)]
+        supabase = MagicMock()
+        with app.app_context(), \
+                patch.object(forecast_service.analytics_service, 'get_daily_totals', return_value=(buckets, totals)), \
+                patch.object(forecast_service, 'get_supabase', return_value=supabase):
+            outcome = forecast_service.refit()
+        return outcome, supabase
+
+    def test_refit_counts_history_from_first_payment(self, app):
+        """Three weeks of revenue in a zero-filled window is not enough history."""
+        outcome, supabase = self._refit(app, 21)
+        assert outcome == {'fitted': False, 'reason': 'not_enough_history', 'history_days': 21}
+        supabase.table.assert_not_called()
+
+    def test_refit_short_history_has_no_annual_term(self, app):
+        """Annual seasonality needs a year of real history, not a year-long window."""
+        outcome, supabase = self._refit(app, 200)
+        assert outcome['fitted'] and outcome['history_days'] == 200
+        payload = supabase.table.return_value.upsert.call_args.args[0]['payload']
+        assert payload['annual_seasonality'] is False
+        assert payload['history_from'] == (date.today() - timedelta(days=200)).isoformat()
+
+    def test_failed_refit_releases_day(self, app):
+        """If the refit fails the day's claim is released so a later tick retries."""
+        from backend import scheduler
+        with app.app_context(), \
+                patch.object(forecast_service, 'refit', side_effect=RuntimeError('db down')), \
+                patch.object(scheduler, 'claim_daily', return_value=True), \
+                patch.object(scheduler, 'release_daily') as release, \
+                patch.object(scheduler, 'finish_daily') as finish:
+            with pytest.raises(RuntimeError):
+                forecast_service.daily_refit()
+        release.assert_called_once_with(forecast_service.SNAPSHOT)
+        finish.assert_not_called()
+
+
+# ============================================================
+# 2.19 Churn Model Selection
+# ============================================================
+
+class TestChurnTraining:
+    """Test the churn model search on synthetic data (no DB needed)."""
+
+    def test_synthetic_training_set(self):
+        """Synthetic rows follow churn_service.FEATURES with both labels present."""
+        X, y, groups = churn_training.synthetic_training_set(500)
+        assert X.shape == (500, len(churn_service.FEATURES))
+        assert 0 < y.mean() < 1
+        assert len(set(groups)) == 500
+
+    def test_search_ranks_candidates(self):
+        """Every candidate is scored and the list is sorted best first."""
+        X, y, groups = churn_training.synthetic_training_set(2000)
+        results = churn_training.search(X, y, groups, n_jobs=1)
+        expected = sum(len(grid) for _, grid in churn_training.FAMILIES.values())
+        assert len(results) == expected
+        aucs = [r['mean_auc'] for r in results]
+        assert aucs == sorted(aucs, reverse=True)
+        assert aucs[0] > 0.7
+
+    def test_heuristic_score_matches_simple_heuristic(self):
+        """The vectorized heuristic caps at 100 like _simple_heuristic."""
+        X = np.array([[90, 3, 0.5, 0, 30], [400, 1, 1.0, 0, 400]], dtype=float)
+        assert churn_service.heuristic_score(X).tolist() == [50.0, 100.0]
+
+
+# ============================================================
+# 2.20 Top-k Churn Selection
+# ============================================================
+
+class TestChurnTopK:
+    """Test partial selection of the riskiest patients (no DB needed)."""
+
+    DAYS = [10, 400, 150, 95, 300, 20, 130, 60]
+
+    def _columns(self):
+        n = len(self.DAYS)
+        return {
+            'patient_id': [f'p{i}' for i in range(n)],
+            'patient_name': [f'Patient {i}' for i in range(n)],
+            'last_visit': [None] * n,
+            'days_since_last_visit': self.DAYS,
+            'total_appointments': [3] * n,
+            'cancelled_ratio': [0.0] * n,
+            'total_revenue': [0.0] * n,
+            'avg_interval': [30.0] * n,
+        }
+
+    def _patched(self):
+        return patch.multiple(churn_service, SKLEARN_AVAILABLE=False, _get_patient_features=self._columns)
+
+    def test_ranked_matches_full_sort(self):
+        """argpartition + sort of k rows equals the first k of a full sort."""
+        scores = np.array([5.0, 90.0, 40.0, 90.0, 12.5, 70.0])
+        ranked = churn_service._ranked(scores, np.arange(len(scores)), 3)
+        assert ranked.tolist() == [1, 3, 5]
+        assert churn_service._ranked(scores, np.arange(len(scores)), 0).tolist() == []
+
+    def test_top_k_with_risk_filter(self):
+        """Top-k honours k and the risk level, highest probability first."""
+        with self._patched():
+            top = churn_service.get_top_churn(3)
+            medium = churn_service.get_top_churn(5, risk='medium')
+        assert [r['patient_id'] for r in top] == ['p1', 'p4', 'p2']
+        assert [r['patient_id'] for r in medium] == ['p2', 'p6']
+        assert all(r['risk_level'] == 'medium' for r in medium)
+
+    def test_pages_cover_full_ranking(self):
+        """Consecutive pages reproduce get_all_churn_scores in order."""
+        with self._patched():
+            full = [r['patient_id'] for r in churn_service.get_all_churn_scores()]
+            pages = [churn_service.get_churn_page(page, 3) for page in (1, 2, 3)]
+        assert pages[0]['total'] == len(self.DAYS)
+        assert [r['patient_id'] for p in pages for r in p['data']] == full
+
+
+
+# ============================================================
+# 2.21 Batch Writes
+# ============================================================
+
+class TestBatchWrites:
+    """Test batch validation and all-or-nothing results (mocked database)."""
+
+    IDS = [str(uuid.uuid4()) for _ in range(5)]
+
+    def _supabase(self, existing=()):
+        supabase = MagicMock()
+        supabase.table.return_value.select.return_value.in_.return_value.execute.return_value.data = [
+            {'id': row_id} for row_id in existing
+        ]
+        return supabase
+
+    def test_missing_and_malformed_ids(self, app):
+        """Unknown ids are reported per item before anything is written."""
+        from backend.services import batch_service
+        supabase = self._supabase(existing=self.IDS[:1])
+        items = [
+            {'id': self.IDS[0], 'patch': {'status': 'done'}},
+            {'id': self.IDS[1], 'patch': {'status': 'done'}},
+            {'id': 'not-a-uuid', 'patch': {'status': 'done'}},
+        ]
+        with app.app_context(), patch.object(batch_service, 'get_supabase', return_value=supabase):
+            errors = batch_service.validate_batch('tasks', items, 'update')
+            delete_errors = batch_service.validate_batch('tasks', [self.IDS[0], self.IDS[1]], 'delete')
+        assert errors == [
+            {'index': 1, 'error': batch_service.NOT_FOUND_ERROR},
+            {'index': 2, 'error': 'מזהה לא תקין'},
+        ]
+        assert delete_errors == [{'index': 1, 'error': batch_service.NOT_FOUND_ERROR}]
+        supabase.table.return_value.upsert.assert_not_called()
+
+    def test_missing_reference(self, app):
+        """A foreign key pointing nowhere fails only its own item."""
+        from backend.services import batch_service
+        supabase = self._supabase(existing=self.IDS[:1])
+        items = [{'title': 'a', 'assigned_to': self.IDS[0]}, {'title': 'b', 'assigned_to': self.IDS[2]}]
+        with app.app_context(), patch.object(batch_service, 'get_supabase', return_value=supabase):
+            errors = batch_service.validate_batch('tasks', items, 'create')
+        assert [e['index'] for e in errors] == [1]
+        assert 'assigned_to' in errors[0]['error']
+
+    def test_database_error_fails_whole_batch(self):
+        """When the single INSERT fails nothing is committed or published."""
+        from postgrest.exceptions import APIError
+        from backend.services import batch_service
+        supabase = MagicMock()
+        supabase.table.return_value.insert.return_value.execute.side_effect = APIError(
+            {'message': 'violates foreign key constraint', 'code': '23503'}
+        )
+        items = [{'name': 'a', 'price': 10}, {'name': 'b', 'price': 20}]
+        with patch.object(batch_service, 'get_supabase', return_value=supabase), \
+                patch.object(batch_service, '_after_write') as after_write:
+            results = batch_service.create_many('services', items)
+        assert [r['success'] for r in results] == [False, False]
+        assert all(r['error'] == 'violates foreign key constraint' for r in results)
+        after_write.assert_not_called()
+
+    def test_overlap_reports_conflicting_items(self):
+        """A double-booking rolls back the batch; only the clashing item lists conflicts."""
+        from postgrest.exceptions import APIError
+        from backend.services import appointment_service, batch_service, catalog_service
+        supabase = MagicMock()
+        supabase.table.return_value.insert.return_value.execute.side_effect = APIError(
+            {'message': 'conflicting key value', 'code': appointment_service.EXCLUSION_VIOLATION}
+        )
+        clash = [{'id': self.IDS[2]}]
+        supabase.rpc.return_value.execute.return_value.data = [{'item': 1, 'conflicts': clash}]
+        items = [{'patient_id': self.IDS[0], 'doctor_id': self.IDS[3], 'service_id': self.IDS[1],
+                  'appointment_date': f'2026-01-0{d}T10:00'} for d in (1, 2)]
+        with patch.object(batch_service, 'get_supabase', return_value=supabase), \
+                patch.object(catalog_service, 'get_service_durations', return_value={}):
+            results = batch_service.create_many('appointments', items)
+        assert results[0]['error'] == batch_service.ABORTED_ERROR
+        assert results[1]['conflicts'] == clash
+        assert not any(r['success'] for r in results)
+        # Existing rows are checked for the whole batch in one call
+        assert [c.args[0] for c in supabase.rpc.call_args_list] == ['batch_conflicts']
+
+    def test_overlap_within_batch_names_both_items(self):
+        """Two items booking the same doctor at once point at each other."""
+        from postgrest.exceptions import APIError
+        from backend.services import appointment_service, batch_service, catalog_service
+        supabase = MagicMock()
+        supabase.table.return_value.insert.return_value.execute.side_effect = APIError(
+            {'message': 'conflicting key value', 'code': appointment_service.EXCLUSION_VIOLATION}
+        )
+        supabase.rpc.return_value.execute.return_value.data = []
+        items = [
+            {'patient_id': self.IDS[0], 'doctor_id': self.IDS[3], 'service_id': self.IDS[1],
+             'appointment_date': '2026-01-01T10:00'},
+            {'patient_id': self.IDS[0], 'doctor_id': self.IDS[4], 'service_id': self.IDS[1],
+             'appointment_date': '2026-01-01T10:00'},
+            {'patient_id': self.IDS[0], 'doctor_id': self.IDS[3], 'service_id': self.IDS[1],
+             'appointment_date': '2026-01-01T10:30'},
+        ]
+        with patch.object(batch_service, 'get_supabase', return_value=supabase), \
+                patch.object(catalog_service, 'get_service_durations', return_value={self.IDS[1]: 45}):
+            results = batch_service.create_many('appointments', items)
+        assert results[0]['error'] == appointment_service.CONFLICT_ERROR
+        assert [c['index'] for c in results[0]['conflicts']] == [2]
+        assert [c['index'] for c in results[2]['conflicts']] == [0]
+        # Another doctor at the same time is not a clash
+        assert results[1]['error'] == batch_service.ABORTED_ERROR
+
+    def test_rows_gone_during_write(self):
+        """Ids the UPDATE/DELETE no longer finds are reported as not found."""
+        from backend.services import batch_service
+        supabase = MagicMock()
+        supabase.rpc.return_value.execute.return_value.data = [{'id': self.IDS[0], 'status': 'done'}]
+        items = [{'id': row_id, 'patch': {'status': 'done'}} for row_id in self.IDS[:2]]
+        with patch.object(batch_service, 'get_supabase', return_value=supabase), \
+                patch.object(batch_service, '_after_write'):
+            results = batch_service.update_many('tasks', items)
+            supabase.rpc.return_value.execute.return_value.data = [self.IDS[1]]
+            deleted = batch_service.delete_many('tasks', self.IDS[:2])
+        assert [r['success'] for r in results] == [True, False]
+        assert results[1]['error'] == batch_service.NOT_FOUND_ERROR
+        assert [r['success'] for r in deleted] == [False, True]
+        assert supabase.rpc.call_args_list[0].args[0] == 'batch_update'
+
+
+# ============================================================
+# 2.22 Export Date Range
+# ============================================================
+
+class TestExportDateRange:
+    """Test the export date filters (mocked database)."""
+
+    def _query(self):
+        query = MagicMock()
+        for method in ('gte', 'lt', 'lte', 'eq', 'gt', 'is_', 'or_', 'order', 'limit'):
+            getattr(query, method).return_value = query
+        query.execute.return_value.data = []
+        return query
+
+    def test_end_date_is_inclusive(self):
+        """Appointments at any time on the `to` day are exported."""
+        from backend.services import export_service
+        query = self._query()
+        supabase = MagicMock()
+        supabase.table.return_value.select.return_value = query
+        with patch.object(export_service, 'get_supabase', return_value=supabase):
+            list(export_service.iter_rows('appointments', date(2026, 3, 1), date(2026, 3, 31)))
+        query.gte.assert_called_once_with('appointment_date', '2026-03-01')
+        query.lt.assert_called_once_with('appointment_date', '2026-04-01')
+        query.lte.assert_not_called()
+
+    def test_undated_rows_page_after_dated_ones(self):
+        """A page ending on a NULL date continues with the NULL rows, not `date.gt.None`."""
+        from backend.services import export_service
+        query = self._query()
+        pages = [
+            [{'id': 'a', 'issued_date': '2026-03-01'}, {'id': 'b', 'issued_date': '2026-03-02'}],
+            [{'id': 'c', 'issued_date': None}, {'id': 'd', 'issued_date': None}],
+            [{'id': 'e', 'issued_date': None}],
+        ]
+        query.execute.side_effect = [MagicMock(data=page) for page in pages]
+        supabase = MagicMock()
+        supabase.table.return_value.select.return_value = query
+        with patch.object(export_service, 'get_supabase', return_value=supabase):
+            rows = list(export_service.iter_rows('invoices', page_size=2))
+        assert [r['id'] for r in rows] == ['a', 'b', 'c', 'd', 'e']
+        # After a dated page the NULL tail is still reachable
+        assert query.or_.call_args.args[0].endswith('issued_date.is.null')
+        query.is_.assert_called_once_with('issued_date', 'null')
+        query.gt.assert_called_once_with('id', 'd')
+        assert 'None' not in query.or_.call_args.args[0]
+
+
+# ============================================================
+# 2.23 JSON Responses
+# ============================================================
+
+class TestJSONResponses:
+    """Test API response serialization through the app's JSON provider."""
+
+    def test_dates_and_decimals(self, client, doctor_headers):
+        """Dates are ISO strings, Decimals keep their digits, Hebrew stays UTF-8."""
+        from decimal import Decimal
+        from backend.services import catalog_service, invoice_service, patient_service
+        invoice = {
+            'id': 'inv-1', 'amount': Decimal('150.50'), 'issued_date': date(2026, 3, 1),
+            'created_at': datetime(2026, 3, 1, 9, 30), 'patients': {'first_name': 'דוד', 'last_name': 'כהן'},
+        }
+        with patch.object(invoice_service, 'get_invoices',
+                          return_value={'data': [invoice], 'total': 1, 'page': 1, 'limit': 10}), \
+                patch.object(patient_service, 'get_patients', return_value={'data': []}), \
+                patch.object(catalog_service, 'get_all_services', return_value=[]):
+            resp = client.get('/api/invoices/', headers=doctor_headers)
+        assert resp.status_code == 200
+        row = resp.get_json()['data']['data'][0]
+        assert row['amount'] == '150.50'
+        assert row['issued_date'] == '2026-03-01'
+        assert row['created_at'] == '2026-03-01T09:30:00'
+        assert 'דוד כהן'.encode() in resp.data
+
+
+# ============================================================
+# 2.24 Conditional GET and Compression
+# ============================================================
+
+class TestHTTPCache:
+    """Test ETag/304 handling and Accept-Encoding negotiation."""
+
+    def _get(self, client, headers, **extra):
+        from backend.services import catalog_service, invoice_service, patient_service
+        invoices = [{'id': f'inv-{i}', 'amount': 100 + i, 'status': 'pending', 'patients': None}
+                    for i in range(50)]
+        with patch.object(invoice_service, 'get_invoices',
+                          return_value={'data': invoices, 'total': 50, 'page': 1, 'limit': 50}), \
+                patch.object(patient_service, 'get_patients', return_value={'data': []}), \
+                patch.object(catalog_service, 'get_all_services', return_value=[]):
+            return client.get('/api/invoices/', headers={**headers, **extra})
+
+    def test_etag_round_trip(self, client, doctor_headers):
+        """Sending the ETag back gives an empty 304."""
+        first = self._get(client, doctor_headers)
+        etag = first.headers['ETag']
+        second = self._get(client, doctor_headers, **{'If-None-Match': etag})
+        assert first.status_code == 200
+        assert second.status_code == 304
+        assert second.data == b''
+        assert second.headers['ETag'] == etag
+
+    def test_accept_encoding(self, client, doctor_headers):
+        """Large bodies are compressed per Accept-Encoding, with distinct ETags."""
+        import gzip
+        plain = self._get(client, doctor_headers)
+        gzipped = self._get(client, doctor_headers, **{'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in plain.headers
+        assert gzipped.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in gzipped.headers['Vary']
+        assert gzip.decompress(gzipped.data) == plain.data
+        assert gzipped.headers['ETag'].strip('"') == plain.headers['ETag'].strip('"') + '-gzip'
+
+        # The compressed variant's ETag still validates
+        again = self._get(client, doctor_headers, **{'Accept-Encoding': 'gzip',
+                                                     'If-None-Match': gzipped.headers['ETag']})
+        assert again.status_code == 304
+
+
+# ============================================================
+# 2.25 List Search
+# ============================================================
+
+class TestListSearch:
+    """Test that list routes pass searches to the search RPCs (mocked database)."""
+
+    @pytest.mark.parametrize('resource,service_name,rpc', [
+        ('appointments', 'appointment_service', 'search_appointments'),
+        ('invoices', 'invoice_service', 'search_invoices'),
+    ])
+    def test_search_uses_rpc(self, client, doctor_headers, resource, service_name, rpc):
+        """?search= is trimmed and paged through the RPC, and its rows are returned."""
+        from backend import services
+        from backend.services import catalog_service, patient_service
+        service = getattr(services, service_name)
+        supabase = MagicMock()
+        supabase.rpc.return_value.execute.return_value.data = {
+            'data': [{'id': 'row-1', 'patients': {'first_name': 'דוד', 'last_name': 'כהן'}}],
+            'total': 11,
+        }
+        with patch.object(service, 'get_supabase', return_value=supabase), \
+                patch.object(patient_service, 'get_patients', return_value={'data': []}), \
+                patch.object(catalog_service, 'get_all_services', return_value=[]):
+            resp = client.get(f'/api/{resource}/?search=%20כהן%20&status=paid&page=2', headers=doctor_headers)
+        assert resp.status_code == 200
+        supabase.rpc.assert_called_once_with(rpc, {
+            'p_query': 'כהן', 'p_status': 'paid', 'p_limit': 10, 'p_offset': 10,
+        })
+        data = resp.get_json()['data']
+        assert data['total'] == 11
+        assert data['data'][0]['patient_name'] == 'דוד כהן'
+
+
+# ============================================================
+# 2.26 Live Event Streams
+# ============================================================
+
+class TestEventStreams:
+    """Test stream admission, tickets and the change-event tail (no DB needed)."""
+
+    def test_subscribe_limit(self):
+        """subscribe refuses new queues once `limit` are open."""
+        from backend.services import event_service
+        first = event_service.subscribe(['tasks'], limit=1)
+        try:
+            assert first is not None
+            assert event_service.subscribe(['tasks'], limit=1) is None
+        finally:
+            event_service.unsubscribe(first)
+
+    def test_stream_returns_503_at_cap(self, app, client, doctor_headers):
+        """A worker at EVENTS_MAX_STREAMS answers 503 with Retry-After."""
+        limit = app.config['EVENTS_MAX_STREAMS']
+        app.config['EVENTS_MAX_STREAMS'] = 0
+        try:
+            resp = client.get('/api/events/stream?topics=tasks', headers=doctor_headers)
+        finally:
+            app.config['EVENTS_MAX_STREAMS'] = limit
+        assert resp.status_code == 503
+        assert resp.headers['Retry-After']
+
+    def test_stream_requires_valid_ticket(self, client, doctor_headers):
+        """A JWT in the URL is not accepted; used or unknown tickets get 401."""
+        from backend.services import event_service
+        token = doctor_headers['Authorization'][7:]
+        assert client.get(f'/api/events/stream?token={token}').status_code == 401
+        with patch.object(event_service, 'redeem_ticket', return_value=None) as redeem:
+            resp = client.get('/api/events/stream?ticket=used')
+        assert resp.status_code == 401
+        redeem.assert_called_once_with('used')
+
+    def test_late_commits_are_not_skipped(self):
+        """An id that commits after a higher one is dispatched when it appears."""
+        from backend.services import event_service
+        gaps = {}
+        fresh, last_id = event_service._advance([{'id': 11}, {'id': 13}], 10, gaps, now=0.0)
+        assert [e['id'] for e in fresh] == [11, 13]
+        assert last_id == 13 and set(gaps) == {12}
+
+        fresh, last_id = event_service._advance([{'id': 12}, {'id': 13}, {'id': 14}], last_id, gaps, now=1.0)
+        assert [e['id'] for e in fresh] == [12, 14]
+        assert last_id == 14 and gaps == {}
+
+
+# ============================================================
+# 2.27 Task Archiving
+# ============================================================
+
+class TestTaskArchiving:
+    """Test the daily archive job (mocked database)."""
+
+    def test_archive_publishes_deletes(self, app):
+        """Each archived task is published as a delete and the day is finished."""
+        from backend import scheduler
+        from backend.services import event_service, task_service
+        supabase = MagicMock()
+        supabase.rpc.return_value.execute.return_value.data = ['t1', 't2']
+        with app.app_context(), \
+                patch.object(task_service, 'get_supabase', return_value=supabase), \
+                patch.object(scheduler, 'claim_daily', return_value=True), \
+                patch.object(scheduler, 'finish_daily') as finish, \
+                patch.object(event_service, 'publish') as publish:
+            outcome = task_service.daily_archive()
+        assert outcome == {'ran': True, 'archived': 2}
+        supabase.rpc.assert_called_once_with('archive_done_tasks', {
+            'p_older_than_days': app.config['TASK_ARCHIVE_AFTER_DAYS'],
+        })
+        publish.assert_called_once_with('tasks', 'delete', [{'id': 't1'}, {'id': 't2'}])
+        finish.assert_called_once_with('archive_done_tasks', 2)
+
+    def test_failed_archive_releases_claim(self, app):
+        """A failing run gives the day back so a later tick can retry."""
+        from backend import scheduler
+        from backend.services import task_service
+        with app.app_context(), \
+                patch.object(task_service, 'archive_done_tasks', side_effect=RuntimeError('db down')), \
+                patch.object(scheduler, 'claim_daily', return_value=True), \
+                patch.object(scheduler, 'release_daily') as release, \
+                patch.object(scheduler, 'finish_daily') as finish:
+            with pytest.raises(RuntimeError):
+                task_service.daily_archive()
+        release.assert_called_once_with('archive_done_tasks')
+        finish.assert_not_called()
+
+
+# ============================================================
+# 2.28 In-process Cache
+# ============================================================
+
+class TestCache:
+    """Test hits, expiry, version invalidation and the LRU cap (mocked database)."""
+
+    @pytest.fixture(autouse=True)
+    def fresh_cache(self, app):
+        from backend import cache
+        self.versions = []
+        supabase = MagicMock()
+        supabase.table.return_value.select.return_value.execute.side_effect = \
+            lambda: MagicMock(data=list(self.versions))
+        cache.clear()
+        cache._versions.clear()
+        cache._checked_at = 0.0
+        with app.app_context(), patch.object(cache, 'get_supabase', return_value=supabase):
+            yield cache
+        cache.clear()
+        cache._versions.clear()
+
+    def test_hit_skips_loader(self, fresh_cache):
+        """A second read is served without calling the loader."""
+        loader = MagicMock(return_value=['a'])
+        assert fresh_cache.get_or_set('services', 'all', loader) == ['a']
+        assert fresh_cache.get_or_set('services', 'all', loader) == ['a']
+        loader.assert_called_once()
+
+    def test_expired_entry_is_dropped(self, fresh_cache):
+        """An expired entry is removed on read, then reloaded."""
+        with patch.object(fresh_cache.time, 'monotonic', return_value=100.0):
+            fresh_cache.get_or_set('services', 'all', lambda: 'old', ttl=10)
+        with patch.object(fresh_cache.time, 'monotonic', return_value=111.0):
+            assert fresh_cache.get_or_set('services', 'all', lambda: 'new', ttl=10) == 'new'
+        assert len(fresh_cache._entries) == 1
+
+    def test_version_bump_prunes_namespace(self, fresh_cache):
+        """A newer namespace version drops its entries at the next check."""
+        fresh_cache.get_or_set('services', 'all', lambda: 'old')
+        fresh_cache.get_or_set('users', 'all', lambda: 'kept')
+        self.versions = [{'namespace': 'services', 'version': 2}]
+        fresh_cache._checked_at = 0.0
+        fresh_cache._sync_versions()
+        assert list(fresh_cache._entries) == [('users', 'all')]
+        assert fresh_cache.get_or_set('services', 'all', lambda: 'new') == 'new'
+
+    def test_lru_cap(self, app, fresh_cache):
+        """Past CACHE_MAX_ENTRIES the least recently used entry goes first."""
+        limit = app.config['CACHE_MAX_ENTRIES']
+        app.config['CACHE_MAX_ENTRIES'] = 2
+        try:
+            fresh_cache.get_or_set('ns', 'a', lambda: 1)
+            fresh_cache.get_or_set('ns', 'b', lambda: 2)
+            fresh_cache.get_or_set('ns', 'a', lambda: 0)   # hit: 'a' becomes most recent
+            fresh_cache.get_or_set('ns', 'c', lambda: 3)
+        finally:
+            app.config['CACHE_MAX_ENTRIES'] = limit
+        assert list(fresh_cache._entries) == [('ns', 'a'), ('ns', 'c')]
+
+
+# ============================================================
+# 2.29 Service Duration Changes
+# ============================================================
+
+class TestServiceDurationChange:
+    """Test that a duration change which double-books is refused (mocked database)."""
+
+    def test_overlap_returns_409(self, client, doctor_headers):
+        """PUT /api/services/<id> answers 409 when ends_at would overlap."""
+        from postgrest.exceptions import APIError
+        from backend.services import appointment_service, catalog_service
+        supabase = MagicMock()
+        supabase.table.return_value.update.return_value.eq.return_value.execute.side_effect = APIError(
+            {'message': 'conflicting key value', 'code': appointment_service.EXCLUSION_VIOLATION}
+        )
+        with patch.object(catalog_service, 'get_supabase', return_value=supabase):
+            resp = client.put(f'/api/services/{uuid.uuid4()}', json={'duration_minutes': 90},
+                              headers=doctor_headers)
+        assert resp.status_code == 409
+        assert resp.get_json()['success'] is False
+
+
+# ============================================================
+# 2.30 Overdue Invoice Sweep
+# ============================================================
+
+class TestOverdueSweep:
+    """Test the sweep entry point end to end (mocked database)."""
+
+    def test_sweep_command(self, app):
+        """`flask sweep-overdue --force` runs the RPC and publishes the changed rows."""
+        from backend import cache
+        from backend.services import event_service, invoice_service
+        rows = [{'id': 'inv-1', 'status': 'overdue'}, {'id': 'inv-2', 'status': 'overdue'}]
+        supabase = MagicMock()
+        supabase.rpc.return_value.execute.return_value.data = {'ran': True, 'updated': 2, 'rows': rows}
+        with patch.object(invoice_service, 'get_supabase', return_value=supabase), \
+                patch.object(event_service, 'publish') as publish, \
+                patch.object(cache, 'invalidate') as invalidate:
+            result = app.test_cli_runner().invoke(args=['sweep-overdue', '--force'])
+        assert 'Marked 2 invoices overdue' in result.output
+        supabase.rpc.assert_called_once_with('sweep_overdue_invoices', {
+            'p_due_days': app.config['INVOICE_DUE_DAYS'], 'p_force': True,
+        })
+        publish.assert_called_once_with('invoices', 'update', rows)
+        invalidate.assert_called_once_with('payments')
+
+    def test_sweep_already_ran(self, app):
+        """A second sweep on the same day is skipped without events."""
+        from backend.services import event_service, invoice_service
+        supabase = MagicMock()
+        supabase.rpc.return_value.execute.return_value.data = {'ran': False, 'reason': 'already_ran'}
+        with app.app_context(), patch.object(invoice_service, 'get_supabase', return_value=supabase), \
+                patch.object(event_service, 'publish') as publish:
+            outcome = invoice_service.sweep_overdue()
+        assert outcome == {'ran': False, 'reason': 'already_ran'}
+        publish.assert_not_called()
+
+
+# ============================================================
+# 2.31 Auto-invoicing
+# ============================================================
+
+class TestAutoInvoice:
+    """Test POST /api/invoices/auto (mocked database)."""
+
+    def test_auto_invoice_route(self, client, doctor_headers):
+        """Created invoices are returned with their count and total."""
+        from backend.services import event_service, invoice_service
+        created = [{'id': 'inv-1', 'amount': '350.00'}, {'id': 'inv-2', 'amount': '200.50'}]
+        supabase = MagicMock()
+        supabase.rpc.return_value.execute.return_value.data = created
+        with patch.object(invoice_service, 'get_supabase', return_value=supabase), \
+                patch.object(event_service, 'publish') as publish:
+            resp = client.post('/api/invoices/auto', json={'until': '2026-03-31'}, headers=doctor_headers)
+        body = resp.get_json()
+        assert resp.status_code == 200
+        assert body['created'] == 2
+        assert body['total'] == 550.5
+        supabase.rpc.assert_called_once_with('auto_invoice_completed', {'p_until': '2026-03-31'})
+        publish.assert_called_once_with('invoices', 'insert', created)
+
+    def test_bad_until_date(self, client, doctor_headers):
+        """An unparseable `until` is a 400, not a database call."""
+        from backend.services import invoice_service
+        with patch.object(invoice_service, 'get_supabase') as get_supabase:
+            resp = client.post('/api/invoices/auto', json={'until': '31/03/2026'}, headers=doctor_headers)
+        assert resp.status_code == 400
+        get_supabase.assert_not_called()
+
+
+# ============================================================
+# 2.32 Invoice Numbers
+# ============================================================
+
+class TestInvoiceNumbers:
+    """Test that clients cannot set invoice numbers (mocked database)."""
+
+    def test_update_ignores_invoice_number(self):
+        """update_invoice drops invoice_number and keeps the other fields."""
+        from backend.services import event_service, invoice_service
+        supabase = MagicMock()
+        supabase.table.return_value.update.return_value.eq.return_value.execute.return_value.data = [{'id': 'inv-1'}]
+        with patch.object(invoice_service, 'get_supabase', return_value=supabase), \
+                patch.object(event_service, 'publish'):
+            invoice_service.update_invoice('inv-1', {'invoice_number': 'INV-9999', 'status': 'paid'})
+        supabase.table.return_value.update.assert_called_once_with({'status': 'paid'})
+
+
+# ============================================================
+# 2.33 Invoice Aging Report
+# ============================================================
+
+class TestAgingReport:
+    """Test GET /api/dashboard/aging (mocked database)."""
+
+    REPORT = {
+        'as_of': '2026-03-31',
+        'totals': {'days_0_30': '100.00', 'days_90_plus': '250.00'},
+        'patients': [{
+            'patient_name': 'דוד כהן', 'phone': '050-1234567', 'days_0_30': '100.00', 'days_31_60': '0',
+            'days_61_90': '0', 'days_90_plus': '250.00', 'total': '350.00', 'invoice_count': 2,
+            'oldest_issued': '2025-11-02',
+        }],
+    }
+
+    def _get(self, client, headers, query):
+        from backend.services import dashboard_service
+        supabase = MagicMock()
+        supabase.rpc.return_value.execute.return_value.data = self.REPORT
+        with patch.object(dashboard_service, 'get_supabase', return_value=supabase), \
+                patch.object(dashboard_service.cache, 'get_or_set', side_effect=lambda ns, key, loader: loader()):
+            return client.get(f'/api/dashboard/aging{query}', headers=headers), supabase
+
+    def test_json_report(self, client, doctor_headers):
+        """The RPC's report is returned as-is for the requested date."""
+        resp, supabase = self._get(client, doctor_headers, '?as_of=2026-03-31')
+        assert resp.status_code == 200
+        assert resp.get_json()['data'] == self.REPORT
+        supabase.rpc.assert_called_once_with('invoice_aging', {'p_as_of': '2026-03-31'})
+
+    def test_csv_report(self, client, doctor_headers):
+        """format=csv returns one row per patient with a BOM for Excel."""
+        resp, _ = self._get(client, doctor_headers, '?as_of=2026-03-31&format=csv')
+        text = resp.data.decode('utf-8')
+        assert resp.mimetype == 'text/csv'
+        assert text.startswith('\ufeffpatient_name,phone,')
+        assert 'דוד כהן,050-1234567,100.00' in text
+        assert 'aging-2026-03-31.csv' in resp.headers['Content-Disposition']
+
+    def test_bad_date(self, client, doctor_headers):
+        """An unparseable as_of is a 400 without a database call."""
+        resp, supabase = self._get(client, doctor_headers, '?as_of=yesterday')
+        assert resp.status_code == 400
+        supabase.rpc.assert_not_called()
+
+
+# ============================================================
+# 2.34 Revenue Buckets
+# ============================================================
+
+class TestRevenueBuckets:
+    """Test calendar bucketing and revenue cache keys (no DB needed)."""
+
+    @pytest.mark.parametrize('granularity,day,start,end', [
+        ('day', date(2026, 2, 11), date(2026, 2, 11), date(2026, 2, 11)),
+        ('week', date(2026, 2, 11), date(2026, 2, 8), date(2026, 2, 14)),     # Wednesday
+        ('week', date(2026, 2, 8), date(2026, 2, 8), date(2026, 2, 14)),      # Sunday starts a week
+        ('week', date(2026, 1, 1), date(2025, 12, 28), date(2026, 1, 3)),     # across a year
+        ('month', date(2024, 2, 10), date(2024, 2, 1), date(2024, 2, 29)),
+        ('quarter', date(2026, 5, 20), date(2026, 4, 1), date(2026, 6, 30)),
+        ('quarter', date(2026, 12, 31), date(2026, 10, 1), date(2026, 12, 31)),
+    ])
+    def test_period_bounds(self, granularity, day, start, end):
+        """Python bucket bounds match revenue_bucket() in schema.sql."""
+        from backend.services import analytics_service
+        assert analytics_service.period_start(day, granularity) == start
+        assert analytics_service.period_end(day, granularity) == end
+
+    def test_closed_ranges_share_whole_period_keys(self):
+        """Ranges inside the same closed quarters hit one key that never expires."""
+        from backend.services import analytics_service
+        with patch.object(analytics_service.cache, 'get_or_set') as get_or_set:
+            analytics_service.get_revenue(date(2024, 2, 3), date(2024, 5, 9), 'quarter')
+            analytics_service.get_revenue(date(2024, 1, 1), date(2024, 6, 30), 'quarter')
+        first, second = get_or_set.call_args_list
+        assert first.args[1] == second.args[1] == ('revenue', '2024-01-01', '2024-06-30', 'quarter', None)
+        assert first.args[0] == analytics_service.CLOSED_NAMESPACE
+        assert first.kwargs['ttl'] == 0
+
+    def test_open_range_expires(self):
+        """A range reaching the current period uses the default TTL."""
+        from backend.services import analytics_service
+        with patch.object(analytics_service.cache, 'get_or_set') as get_or_set:
+            analytics_service.get_revenue(date.today() - timedelta(days=20), date.today(), 'week')
+        assert get_or_set.call_args.args[0] == 'payments'
+        assert get_or_set.call_args.kwargs['ttl'] is None
+
+    def test_only_backdated_invoices_drop_closed_periods(self):
+        """Today's invoices leave closed periods cached; a backdated one drops them."""
+        from backend.services import analytics_service
+        today = date.today().isoformat()
+        past = (date.today() - timedelta(days=40)).isoformat()
+        with patch.object(analytics_service.cache, 'discard') as discard:
+            analytics_service._on_invoice_event({'action': 'insert', 'payload': {'issued_date': today}})
+            discard.assert_not_called()
+            analytics_service._on_invoice_event({'action': 'update', 'payload': {'issued_date': past}})
+        discard.assert_called_once_with(analytics_service.CLOSED_NAMESPACE)
+
+    def test_rows_land_in_week_buckets(self):
+        """RPC rows are summed into their bucket and per-dimension series."""
+        from backend.services import analytics_service
+        supabase = MagicMock()
+        supabase.rpc.return_value.execute.return_value.data = {
+            'buckets': ['2026-02-01', '2026-02-08', '2026-02-15'],
+            'rows': [
+                {'bucket': '2026-02-01', 'key': 's1', 'label': 'בדיקת דם', 'amount': '200.00'},
+                {'bucket': '2026-02-15', 'key': 's1', 'label': 'בדיקת דם', 'amount': '100.00'},
+                {'bucket': '2026-02-15', 'key': 's2', 'label': 'א.ק.ג', 'amount': '350.00'},
+            ],
+        }
+        with patch.object(analytics_service, 'get_supabase', return_value=supabase):
+            report = analytics_service._load_revenue(date(2026, 2, 1), date(2026, 2, 21), 'week', 'service')
+        assert report['totals'] == [200.0, 0.0, 450.0]
+        assert [s['key'] for s in report['series']] == ['s2', 's1']
+        assert report['series'][1]['values'] == [200.0, 0.0, 100.0]